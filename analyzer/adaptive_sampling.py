@@ -0,0 +1,188 @@
+import threading
+
+import numpy as np
+
+from key_moment_detector import LEFT_WRIST, RIGHT_WRIST
+
+
+class AdaptiveSampler:
+    """Choose the frames that go through pose estimation and detection.
+
+    The stride between inferred frames doubles up to ``max_stride`` while
+    the player moves slowly and drops back to every frame as soon as a wrist
+    moves faster than ``motion_threshold`` (body heights per frame) or a
+    ball is in view. Decisions and observations may come from different
+    pipeline stages, so the sampler is thread-safe.
+    """
+
+    def __init__(self, max_stride=4, motion_threshold=0.02):
+        self.max_stride = max(1, max_stride)
+        self.motion_threshold = motion_threshold
+        self.stride = 1
+        self.last_keyframe = None
+        self.dense_until = -1
+        self.inferred = 0
+        self._last_wrists = None
+        self._lock = threading.Lock()
+
+    def should_infer(self, frame_idx):
+        """Whether ``frame_idx`` is a keyframe; frames must be asked in order."""
+        with self._lock:
+            infer = (
+                self.last_keyframe is None
+                or frame_idx <= self.dense_until
+                or frame_idx - self.last_keyframe >= self.stride
+            )
+            if infer:
+                self.last_keyframe = frame_idx
+                self.inferred += 1
+            return infer
+
+    def observe_pose(self, frame_idx, pose_result):
+        """Adapt the stride to the wrist speed since the previous keyframe."""
+        wrists = _wrists_and_height(pose_result)
+        with self._lock:
+            if wrists is None:
+                # Lost the player: look again on the next frames
+                self.stride = 1
+            elif self._last_wrists is not None:
+                last_idx, last_points = self._last_wrists
+                points, height = wrists
+                speed = np.max(np.linalg.norm(points - last_points, axis=1)) / (
+                    max(frame_idx - last_idx, 1) * height
+                )
+                if speed > self.motion_threshold:
+                    self.stride = 1
+                else:
+                    self.stride = min(self.stride * 2, self.max_stride)
+            self._last_wrists = (frame_idx, wrists[0]) if wrists is not None else None
+
+    def observe_balls(self, frame_idx, balls):
+        """Keep sampling every frame for a while after a ball was seen."""
+        if balls:
+            with self._lock:
+                self.dense_until = max(self.dense_until, frame_idx + 2 * self.max_stride)
+
+
+def _wrists_and_height(pose_result):
+    """``(wrists (2, 2), body height)`` of the first person, or None."""
+    instances = (pose_result or {}).get("predictions") or [[]]
+    if not instances[0]:
+        return None
+    person = instances[0][0]
+    keypoints = np.asarray(person["keypoints"], dtype=np.float64)[:, :2]
+    bbox = np.asarray(person.get("bbox", [[0, 0, 0, 0]]), dtype=np.float64).reshape(-1)
+    height = bbox[3] - bbox[1] if len(bbox) >= 4 else 0
+    if not height > 0:
+        height = np.ptp(keypoints[:, 1])
+    if not height > 0:
+        return None
+    return keypoints[[LEFT_WRIST, RIGHT_WRIST]], height
+
+
+def _bbox_center(bbox):
+    bbox = np.asarray(bbox, dtype=np.float64).reshape(-1)
+    return (bbox[:2] + bbox[2:4]) / 2
+
+
+def interpolate_pose(before, after, t):
+    """Pose result a fraction ``t`` of the way from ``before`` to ``after``.
+
+    People are paired by nearest box centre; people without a partner are
+    held from the nearer keyframe.
+    """
+    people_before = before["predictions"][0]
+    people_after = after["predictions"][0]
+    nearer = people_before if t < 0.5 else people_after
+    if not people_before or not people_after:
+        return {"predictions": [list(nearer)]}
+
+    centers_after = [_bbox_center(p["bbox"]) for p in people_after]
+    instances = []
+    for person in people_before:
+        center = _bbox_center(person["bbox"])
+        match = people_after[
+            int(np.argmin([np.linalg.norm(center - c) for c in centers_after]))
+        ]
+        instance = {}
+        for key in ("keypoints", "keypoint_scores", "bbox"):
+            a = np.asarray(person[key], dtype=np.float64)
+            b = np.asarray(match[key], dtype=np.float64)
+            value = (a + (b - a) * t).tolist()
+            instance[key] = (value[0],) if key == "bbox" else value
+        instance["bbox_score"] = float(min(person["bbox_score"], match["bbox_score"]))
+        instances.append(instance)
+    return {"predictions": [instances]}
+
+
+def interpolate_detections(before, after, frame_idx, t, fps):
+    """Boxes of objects tracked in both keyframes, moved ``t`` of the way."""
+    after_by_track = {d["track_id"]: d for d in after if d["track_id"] is not None}
+    detections = []
+    for detection in before:
+        match = after_by_track.get(detection["track_id"])
+        if match is None:
+            continue
+        a = np.asarray(detection["bbox"], dtype=np.float64)
+        b = np.asarray(match["bbox"], dtype=np.float64)
+        detections.append(
+            {
+                "frame": int(frame_idx),
+                "timestamp": float(frame_idx / fps),
+                "bbox": [int(round(v)) for v in a + (b - a) * t],
+                "track_id": detection["track_id"],
+                "confidence": float(min(detection["confidence"], match["confidence"])),
+                "interpolated": True,
+            }
+        )
+    return detections
+
+
+class GapFiller:
+    """Fill in the frames skipped between keyframes, in frame order.
+
+    ``add`` takes every frame with its results, or with None for skipped
+    frames, and returns the frames that can now be completed as
+    ``(frame_idx, frame, pose_result, (balls, rackets))``. Skipped frames
+    wait for the next keyframe, so at most one stride of frames is held.
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.keyframe = None
+        self.pending = []
+
+    def add(self, frame_idx, frame, pose_result, detections):
+        if pose_result is None:
+            self.pending.append((frame_idx, frame))
+            return []
+
+        completed = []
+        if self.pending:
+            completed = self._fill(self.keyframe, (frame_idx, pose_result, detections))
+        self.keyframe = (frame_idx, pose_result, detections)
+        completed.append((frame_idx, frame, pose_result, detections))
+        return completed
+
+    def finish(self):
+        """Complete frames after the last keyframe by holding its pose."""
+        return self._fill(self.keyframe, None)
+
+    def _fill(self, before, after):
+        completed = []
+        for frame_idx, frame in self.pending:
+            if before is None or after is None:
+                # No keyframe on one side: hold the pose we have, skip boxes
+                held = before or after
+                pose_result = held[1] if held else {"predictions": [[]]}
+                completed.append((frame_idx, frame, pose_result, ([], [])))
+                continue
+            t = (frame_idx - before[0]) / (after[0] - before[0])
+            pose_result = interpolate_pose(before[1], after[1], t)
+            balls, rackets = (
+                interpolate_detections(b, a, frame_idx, t, self.fps)
+                for b, a in zip(before[2], after[2])
+            )
+            completed.append((frame_idx, frame, pose_result, (balls, rackets)))
+        self.pending = []
+        return completed
@@ -87,6 +87,30 @@ const getVideoOrientation = async (videoUri: string): Promise<number> => {
   }
 };
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
+/**
+ * Polls an analysis job until it finishes
+ * @param jobId Id returned by the upload endpoint
+ * @returns Promise with the job result
+ */
+const waitForJob = async (jobId: string): Promise<VideoUploadResponse> => {
+  while (true) {
+    const response = await fetch(getApiUrl(`/jobs/${jobId}`));
+    if (!response.ok) {
+      throw new Error('Failed to get job status');
+    }
+    const job = await response.json();
+    if (job.status === 'succeeded') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Error processing videos');
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
 /**
  * Uploads two videos to the backend for processing
  * @param video1Uri Local URI of the first video
@@ -141,7 +165,9 @@ export const uploadVideos = async (
       throw new Error(errorData.error || 'Failed to upload videos');
     }
     
-    return await response.json();
+    // Processing happens in a background job; wait for it to finish
+    const { job_id } = await response.json();
+    return await waitForJob(job_id);
   } catch (error) {
     console.error('Error uploading videos:', error);
     throw error;
@@ -0,0 +1,1062 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the analyzer backend.
+
+Each subcommand measures one part of the analysis pipeline on real videos,
+for example:
+
+    python benchmark.py pipeline --input input_videos/alcaraz_test.mp4 --device cpu
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+import config
+from metrics import rss_bytes
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _DecodeCounter:
+    """Counts frames decoded through cv2.VideoCapture, whoever opens it."""
+
+    lock = threading.Lock()
+    frames = 0
+
+    @classmethod
+    def add(cls, n=1):
+        with cls.lock:
+            cls.frames += n
+
+
+class _CountingVideoCapture(cv2.VideoCapture):
+    def read(self, *args, **kwargs):
+        ret, frame = super().read(*args, **kwargs)
+        if ret:
+            _DecodeCounter.add()
+        return ret, frame
+
+    def grab(self, *args, **kwargs):
+        ret = super().grab(*args, **kwargs)
+        if ret:
+            _DecodeCounter.add()
+        return ret
+
+
+@contextmanager
+def count_decoded_frames():
+    """Count every frame decoded with OpenCV (MMPose's mmcv reader and
+    Ultralytics' video loader included) inside the ``with`` block."""
+    original = cv2.VideoCapture
+    cv2.VideoCapture = _CountingVideoCapture
+    _DecodeCounter.frames = 0
+    try:
+        yield _DecodeCounter
+    finally:
+        cv2.VideoCapture = original
+
+
+class _CallCounter:
+    """Wraps a model and counts the images passed to it as first argument,
+    alone or in a list, and their pixels."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.images = 0
+        self.pixels = 0
+
+    def __call__(self, *args, **kwargs):
+        images = args[0] if args and isinstance(args[0], list) else args[:1]
+        for image in images:
+            if hasattr(image, "shape"):
+                self.images += 1
+                self.pixels += image.shape[0] * image.shape[1]
+        return self.fn(*args, **kwargs)
+
+
+def video_stats(video_path):
+    """Return ``(frame_count, fps)`` read from the container metadata."""
+    cap = cv2.VideoCapture(video_path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    return frames, fps
+
+
+def print_table(headers, rows):
+    widths = [
+        max(len(str(h)), *(len(str(row[i])) for row in rows))
+        for i, h in enumerate(headers)
+    ]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(v).ljust(w) for v, w in zip(row, widths)))
+
+
+def benchmark_pipeline(args):
+    """Compare decode passes and end-to-end time of the analysis pipelines."""
+    from video_processor import VideoProcessor
+
+    processor = VideoProcessor(device=args.device)
+    with processor.borrow_models() as models:
+        print("Warming up models...")
+        models.warm_up()
+
+    rows = []
+    for video_path in args.input:
+        frames, fps = video_stats(video_path)
+        minutes = frames / fps / 60 if frames else 0
+        for pipeline in args.pipelines:
+            config.PIPELINE = pipeline
+            work_dir = tempfile.mkdtemp(prefix="benchmark_")
+            output_path = os.path.join(work_dir, "output_pose.mp4")
+            try:
+                with count_decoded_frames() as counter:
+                    start = time.perf_counter()
+                    success = processor.process_video(
+                        video_path, output_path, os.path.join(work_dir, "temp")
+                    )
+                    elapsed = time.perf_counter() - start
+                decoded = counter.frames
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            rows.append(
+                [
+                    os.path.basename(video_path),
+                    pipeline,
+                    "ok" if success else "failed",
+                    frames,
+                    f"{decoded / frames:.1f}" if frames else "-",
+                    f"{elapsed:.1f}",
+                    f"{elapsed / minutes:.1f}" if minutes else "-",
+                ]
+            )
+
+    print()
+    print_table(
+        ["video", "pipeline", "result", "frames", "decode passes", "seconds", "s / video min"],
+        rows,
+    )
+    print("\nDecode passes count frames decoded in-process; ffmpeg transcodes are not included.")
+
+
+def load_analysis(output_path):
+    """Pose results and ball/racket detections saved for an analyzed video."""
+    from pose_store import PoseStore, pose_store_path
+
+    store = PoseStore(pose_store_path(output_path))
+    detections = []
+    for suffix in ("_balls.json", "_rackets.json"):
+        with open(os.path.splitext(output_path)[0] + suffix, "r") as f:
+            detections.append(json.load(f))
+    return store.pose_results(), detections[0], detections[1], store.fps
+
+
+def repeat_clip(pose_results, ball_detections, racket_detections, repeats):
+    """Chain a clip ``repeats`` times, as one long video of several serves."""
+    num_frames = len(pose_results)
+    shifted = []
+    for detections in (ball_detections, racket_detections):
+        shifted.append(
+            [
+                dict(d, frame=d["frame"] + i * num_frames)
+                for i in range(repeats)
+                for d in detections
+            ]
+        )
+    return pose_results * repeats, shifted[0], shifted[1]
+
+
+def benchmark_key_moments(args):
+    """Time key moment detection on an analyzed clip chained into longer videos."""
+    from key_moment_detector import detect_key_moments
+
+    pose_results, balls, rackets, fps = load_analysis(args.video)
+    rows = []
+    for repeats in args.repeats:
+        poses, ball_detections, racket_detections = repeat_clip(
+            pose_results, balls, rackets, repeats
+        )
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            moments = detect_key_moments(
+                poses, ball_detections, racket_detections, fps=fps, verbose=False
+            )
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        rows.append(
+            [
+                repeats,
+                len(poses),
+                len(ball_detections) + len(racket_detections),
+                len(moments),
+                f"{best * 1000:.1f}",
+                f"{best / len(poses) * 1e6:.1f}" if poses else "-",
+            ]
+        )
+
+    print_table(
+        ["repeats", "frames", "detections", "moments", "ms (best)", "us / frame"], rows
+    )
+
+
+def benchmark_compare(args):
+    """Time serve comparison against unbanded alignment over every frame pair."""
+    import serve_comparison
+    from pose_store import PoseStore, pose_store_path
+
+    stores = [PoseStore(pose_store_path(video)) for video in (args.video1, args.video2)]
+    keypoints = [np.asarray(store.arrays["keypoints"]) for store in stores]
+
+    def timed(fn, *fn_args):
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = fn(*fn_args)
+            timings.append(time.perf_counter() - start)
+        return result, min(timings)
+
+    comparison, banded = timed(
+        serve_comparison.compare_videos, args.video1, args.video2, args.serve1, args.serve2
+    )
+    start1 = comparison["frame_map"]["start_frame1"]
+    frames2 = np.array(comparison["frame_map"]["frames2"])
+    end1 = start1 + len(frames2)
+    phases = comparison["phases"]
+    start2 = phases[0]["start_frame2"] if phases else 0
+    end2 = phases[-1]["end_frame2"] if phases else 0
+    features1 = serve_comparison.pose_features(keypoints[0][start1:end1])
+    features2 = serve_comparison.pose_features(keypoints[1][start2:end2])
+
+    # One band as wide as the longer serve covers every pair of frames
+    (path1, path2), full = timed(
+        serve_comparison.align, *features1, *features2, max(end1 - start1, end2 - start2)
+    )
+    full_map = serve_comparison._frame_map(path1, path2, 0, end1 - start1) + start2
+    rows = [
+        ["anchored band", len(comparison["anchors"]), f"{banded * 1000:.1f}", "-"],
+        [
+            "full matrix",
+            0,
+            f"{full * 1000:.1f}",
+            f"{np.abs(frames2 - full_map).mean():.2f}" if len(frames2) else "-",
+        ],
+    ]
+    print(f"Frames {start1}-{end1} of video 1 against {start2}-{end2} of video 2")
+    print_table(["alignment", "anchors", "ms (best)", "mean frame shift"], rows)
+    if comparison["similarity"] is not None:
+        print(f"\nSimilarity {comparison['similarity']:.3f}")
+
+
+def compare_pose_stores(reference_dir, candidate_dir, threshold=0.05):
+    """Keypoint error of the first person in ``candidate`` against ``reference``.
+
+    Returns ``(mean error, PCK)`` with errors in units of the reference box
+    height and PCK the share of keypoints within ``threshold`` of it.
+    """
+    from pose_store import PoseStore
+
+    reference = PoseStore(reference_dir).read()
+    candidate = PoseStore(candidate_dir).read()
+    frames = min(len(reference["num_persons"]), len(candidate["num_persons"]))
+    both = (reference["num_persons"][:frames] > 0) & (candidate["num_persons"][:frames] > 0)
+    if not both.any():
+        return float("nan"), float("nan")
+
+    ref_kpts = reference["keypoints"][:frames][both, 0, :, :2]
+    cand_kpts = candidate["keypoints"][:frames][both, 0, :, :2]
+    boxes = reference["bboxes"][:frames][both, 0]
+    heights = np.maximum(boxes[:, 3] - boxes[:, 1], 1.0)[:, None]
+    errors = np.linalg.norm(ref_kpts - cand_kpts, axis=-1) / heights
+    return float(np.nanmean(errors)), float(np.nanmean(errors < threshold))
+
+
+def _detection_frames(output_path, suffix):
+    with open(os.path.splitext(output_path)[0] + suffix, "r") as f:
+        return {d["frame"] for d in json.load(f)}
+
+
+def _moment_frames(output_path):
+    with open(os.path.splitext(output_path)[0] + "_moments.json", "r") as f:
+        return {m["label"]: m["frame"] for m in json.load(f)}
+
+
+def compare_outputs(reference_path, candidate_path):
+    """Accuracy columns of one analysis against a reference analysis:
+    keypoint error, PCK, ball coverage, key moments found and max shift."""
+    from pose_store import pose_store_path
+
+    error, pck = compare_pose_stores(
+        pose_store_path(reference_path), pose_store_path(candidate_path)
+    )
+    reference_balls = _detection_frames(reference_path, "_balls.json")
+    candidate_balls = _detection_frames(candidate_path, "_balls.json")
+    reference_moments = _moment_frames(reference_path)
+    candidate_moments = _moment_frames(candidate_path)
+    moment_shift = max(
+        (
+            abs(reference_moments[label] - candidate_moments[label])
+            for label in reference_moments
+            if label in candidate_moments
+        ),
+        default=0,
+    )
+    return [
+        f"{error:.3f}",
+        f"{pck:.1%}",
+        f"{len(reference_balls & candidate_balls) / len(reference_balls):.0%}"
+        if reference_balls
+        else "-",
+        f"{len(set(reference_moments) & set(candidate_moments))}/{len(reference_moments)}",
+        moment_shift,
+    ]
+
+
+_ACCURACY_HEADERS = ["kpt error", "PCK@0.05", "ball frames", "moments", "max shift"]
+
+
+def benchmark_sampling(args):
+    """Accuracy and throughput of adaptive sampling against full-rate inference."""
+    from video_processor import VideoProcessor
+
+    config.PIPELINE = "streaming"
+    config.SAMPLING_MAX_STRIDE = args.max_stride
+    processor = VideoProcessor(device=args.device)
+    with processor.borrow_models() as models:
+        print("Warming up models...")
+        models.warm_up()
+        models.pose_inferencer = counter = _CallCounter(models.pose_inferencer)
+
+    inputs = args.input or sorted(glob.glob(os.path.join(CURRENT_DIR, "input_videos", "*.mp4")))
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        for video_path in inputs:
+            name = os.path.splitext(os.path.basename(video_path))[0]
+            outputs = {}
+            timings = {}
+            inferred = {}
+            for mode in ("full", "adaptive"):
+                config.SAMPLING = mode
+                outputs[mode] = os.path.join(work_dir, mode, f"{name}_pose.mp4")
+                counter.images = 0
+                start = time.perf_counter()
+                processor.process_video(
+                    video_path, outputs[mode], os.path.join(work_dir, mode, f"temp_{name}")
+                )
+                timings[mode] = time.perf_counter() - start
+                inferred[mode] = counter.images
+
+            rows.append(
+                [
+                    os.path.basename(video_path),
+                    f"{inferred['adaptive'] / max(inferred['full'], 1):.0%}",
+                    f"{timings['full']:.1f}",
+                    f"{timings['adaptive']:.1f}",
+                    f"{timings['full'] / timings['adaptive']:.2f}x",
+                ]
+                + compare_outputs(outputs["full"], outputs["adaptive"])
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_table(
+        [
+            "video",
+            "inferred",
+            "full s",
+            "adaptive s",
+            "speed-up",
+        ]
+        + _ACCURACY_HEADERS,
+        rows,
+    )
+    print(
+        "\nKeypoint error is in units of the person's box height, ball frames is the share "
+        "of full-rate frames with a ball that adaptive sampling also has, and max shift "
+        "is the largest difference in key moment frames."
+    )
+
+
+def benchmark_roi(args):
+    """Pixels, time and accuracy of ROI cropping against full-frame inference."""
+    from video_processor import VideoProcessor
+
+    config.PIPELINE = "streaming"
+    config.ROI_REACQUIRE_FRAMES = args.reacquire_frames
+    processor = VideoProcessor(device=args.device)
+    with processor.borrow_models() as models:
+        print("Warming up models...")
+        models.warm_up()
+        models.pose_inferencer = pose_counter = _CallCounter(models.pose_inferencer)
+        models.yolo_model.track = detection_counter = _CallCounter(models.yolo_model.track)
+
+    inputs = args.input or sorted(glob.glob(os.path.join(CURRENT_DIR, "input_videos", "*.mp4")))
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        for video_path in inputs:
+            name = os.path.splitext(os.path.basename(video_path))[0]
+            outputs = {}
+            timings = {}
+            pixels = {}
+            for mode, roi in (("full", False), ("roi", True)):
+                config.ROI = roi
+                outputs[mode] = os.path.join(work_dir, mode, f"{name}_pose.mp4")
+                pose_counter.pixels = detection_counter.pixels = 0
+                start = time.perf_counter()
+                processor.process_video(
+                    video_path, outputs[mode], os.path.join(work_dir, mode, f"temp_{name}")
+                )
+                timings[mode] = time.perf_counter() - start
+                pixels[mode] = (pose_counter.pixels, detection_counter.pixels)
+
+            rows.append(
+                [
+                    os.path.basename(video_path),
+                    f"{pixels['roi'][0] / max(pixels['full'][0], 1):.0%}",
+                    f"{pixels['roi'][1] / max(pixels['full'][1], 1):.0%}",
+                    f"{sum(pixels['roi']) / max(sum(pixels['full']), 1):.0%}",
+                    f"{timings['full']:.1f}",
+                    f"{timings['roi']:.1f}",
+                    f"{timings['full'] / timings['roi']:.2f}x",
+                ]
+                + compare_outputs(outputs["full"], outputs["roi"])
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_table(
+        ["video", "pose pixels", "det pixels", "pixels", "full s", "roi s", "speed-up"]
+        + _ACCURACY_HEADERS,
+        rows,
+    )
+    print(
+        "\nPixels are the share of full-frame pixels given to each model and to both. "
+        "Keypoint error is in units of the person's box height, ball frames is the share "
+        "of full-frame frames with a ball that ROI cropping also has, and max shift is the "
+        "largest difference in key moment frames."
+    )
+
+
+def analyze_with(settings, inputs, device, work_dir):
+    """Analyze ``inputs`` end to end under each set of config overrides.
+
+    ``settings`` maps a label to the config values to set. Returns the
+    output paths and seconds taken, both keyed by ``(label, video_path)``.
+    """
+    from video_processor import VideoProcessor
+
+    outputs = {}
+    timings = {}
+    for label, overrides in settings.items():
+        for name, value in overrides.items():
+            setattr(config, name, value)
+        # Models are built for one configuration, so load a set per label
+        processor = VideoProcessor(device=device)
+        with processor.borrow_models() as models:
+            print(f"Warming up {label} models...")
+            models.warm_up()
+        for video_path in inputs:
+            name = os.path.splitext(os.path.basename(video_path))[0]
+            outputs[label, video_path] = os.path.join(work_dir, label, f"{name}_pose.mp4")
+            start = time.perf_counter()
+            processor.process_video(
+                video_path,
+                outputs[label, video_path],
+                os.path.join(work_dir, label, f"temp_{name}"),
+            )
+            timings[label, video_path] = time.perf_counter() - start
+    return outputs, timings
+
+
+def benchmark_detectors(args):
+    """Throughput and accuracy of YOLO person boxes against MMPose's person detector."""
+    config.PIPELINE = "streaming"
+    inputs = args.input or sorted(glob.glob(os.path.join(CURRENT_DIR, "input_videos", "*.mp4")))
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        outputs, timings = analyze_with(
+            {mode: {"PERSON_DETECTOR": mode} for mode in ("mmpose", "yolo")},
+            inputs,
+            args.device,
+            work_dir,
+        )
+        for video_path in inputs:
+            frames, _ = video_stats(video_path)
+            rows.append(
+                [
+                    os.path.basename(video_path),
+                    frames,
+                    f"{frames / timings['mmpose', video_path]:.1f}",
+                    f"{frames / timings['yolo', video_path]:.1f}",
+                    f"{timings['mmpose', video_path] / timings['yolo', video_path]:.2f}x",
+                ]
+                + compare_outputs(outputs["mmpose", video_path], outputs["yolo", video_path])
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_table(
+        ["video", "frames", "mmpose fps", "yolo fps", "speed-up"] + _ACCURACY_HEADERS, rows
+    )
+    print(
+        "\nfps counts frames analyzed per second end to end. Keypoint error is in units "
+        "of the person's box height, ball frames is the share of frames with a ball "
+        "under MMPose person boxes that YOLO person boxes also have, and max shift is "
+        "the largest difference in key moment frames."
+    )
+
+
+def read_frames(video_path, count):
+    """Decode the first ``count`` frames of a video."""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def benchmark_batch(args):
+    """Pose inference throughput across MMPose batch sizes."""
+    from model_pool import ModelSet
+
+    frames = read_frames(args.input, args.frames)
+    if not frames:
+        raise SystemExit(f"Could not read frames from {args.input}")
+    models = ModelSet(args.device)
+    print("Warming up models...")
+    models.warm_up()
+
+    rows = []
+    reference = None
+    base_fps = None
+    for batch_size in args.batch_sizes:
+        best = float("inf")
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            predictions = []
+            for result in models.pose_inferencer(frames, show=False, batch_size=batch_size):
+                predictions.extend(result["predictions"])
+            best = min(best, time.perf_counter() - start)
+
+        keypoints = [
+            np.asarray(people[0]["keypoints"]) if people else None for people in predictions
+        ]
+        if reference is None:
+            reference = keypoints
+        diffs = [
+            np.abs(a - b).max()
+            for a, b in zip(reference, keypoints)
+            if a is not None and b is not None and a.shape == b.shape
+        ]
+        fps = len(frames) / best
+        if base_fps is None:
+            base_fps = fps
+        rows.append(
+            [
+                batch_size,
+                f"{fps:.1f}",
+                f"{fps / base_fps:.2f}x",
+                f"{max(diffs, default=0):.3f}",
+            ]
+        )
+
+    print()
+    print_table(["batch size", "frames / s", "speed-up", "max kpt diff (px)"], rows)
+    print(
+        f"\nBest of {args.runs} runs over {len(frames)} frames on {args.device}, detector "
+        "and pose model included; keypoint differences are against the first batch size."
+    )
+
+
+def _box_iou(a, b):
+    """IoU matrix of two sets of ``(x1, y1, x2, y2)`` boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=-1)
+    area_a = np.prod(a[:, 2:4] - a[:, :2], axis=-1)
+    area_b = np.prod(b[:, 2:4] - b[:, :2], axis=-1)
+    return inter / np.maximum(area_a[:, None] + area_b[None] - inter, 1e-6)
+
+
+def _detect(yolo_model, frames, device):
+    """Ball, racket and person boxes of each frame as ``(boxes, classes)``."""
+    from video_processor import BALL_CLASS, PERSON_CLASS, RACKET_CLASS
+
+    detections = []
+    for frame in frames:
+        result = yolo_model.predict(
+            frame,
+            device=device,
+            classes=[PERSON_CLASS, BALL_CLASS, RACKET_CLASS],
+            conf=0.2,
+            verbose=False,
+        )[0]
+        detections.append(
+            (result.boxes.xyxy.cpu().numpy(), result.boxes.cls.cpu().numpy().astype(int))
+        )
+    return detections
+
+
+def _pose(pose_inferencer, frames, bboxes):
+    predictions = []
+    for result in pose_inferencer(
+        frames, show=False, batch_size=max(1, config.POSE_BATCH_SIZE), bboxes=bboxes
+    ):
+        predictions.extend(result["predictions"])
+    return predictions
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_onnx(args):
+    """Numerical parity and throughput of the ONNX Runtime backend against PyTorch."""
+    from model_pool import ModelSet
+    from video_processor import PERSON_CLASS
+
+    inputs = args.input or sorted(glob.glob(os.path.join(CURRENT_DIR, "input_videos", "*.mp4")))
+    frames = read_frames(inputs[0], args.frames)
+    if not frames:
+        raise SystemExit(f"Could not read frames from {inputs[0]}")
+    config.ONNX_THREADS = args.threads
+
+    # Model-level parity on the same frames and the same person boxes, so
+    # differences come from the runtime alone
+    model_sets = {}
+    for backend in ("pytorch", "onnxruntime"):
+        config.BACKEND = backend
+        config.PERSON_DETECTOR = "yolo"
+        model_sets[backend] = ModelSet(args.device)
+        print(f"Warming up {backend} models...")
+        model_sets[backend].warm_up()
+
+    detections = {}
+    poses = {}
+    seconds = {}
+    for backend, models in model_sets.items():
+        detections[backend], seconds[backend, "yolo"] = _timed(
+            _detect, models.yolo_model, frames, args.device
+        )
+    person_bboxes = [
+        boxes[classes == PERSON_CLASS] for boxes, classes in detections["pytorch"]
+    ]
+    for backend, models in model_sets.items():
+        poses[backend], seconds[backend, "pose"] = _timed(
+            _pose, models.pose_inferencer, frames, person_bboxes
+        )
+
+    box_ious = []
+    box_counts = 0
+    for (ref_boxes, ref_classes), (onnx_boxes, onnx_classes) in zip(
+        detections["pytorch"], detections["onnxruntime"]
+    ):
+        box_counts += len(ref_boxes)
+        for cls in np.unique(ref_classes):
+            ref = ref_boxes[ref_classes == cls]
+            candidates = onnx_boxes[onnx_classes == cls]
+            if len(candidates):
+                box_ious.extend(_box_iou(ref, candidates).max(axis=1))
+    keypoint_diffs = [
+        np.abs(np.asarray(ref["keypoints"]) - np.asarray(cand["keypoints"])).max()
+        for ref_people, cand_people in zip(poses["pytorch"], poses["onnxruntime"])
+        for ref, cand in zip(ref_people, cand_people)
+    ]
+    box_ious = np.asarray(box_ious)
+
+    print()
+    print_table(
+        ["model", "pytorch fps", "onnxruntime fps", "speed-up", "parity"],
+        [
+            [
+                "yolo",
+                f"{len(frames) / seconds['pytorch', 'yolo']:.1f}",
+                f"{len(frames) / seconds['onnxruntime', 'yolo']:.1f}",
+                f"{seconds['pytorch', 'yolo'] / seconds['onnxruntime', 'yolo']:.2f}x",
+                f"{np.sum(box_ious > 0.9)}/{box_counts} boxes IoU>0.9, "
+                f"min IoU {box_ious.min(initial=1.0):.3f}",
+            ],
+            [
+                "pose",
+                f"{len(frames) / seconds['pytorch', 'pose']:.1f}",
+                f"{len(frames) / seconds['onnxruntime', 'pose']:.1f}",
+                f"{seconds['pytorch', 'pose'] / seconds['onnxruntime', 'pose']:.2f}x",
+                f"max kpt diff {max(keypoint_diffs, default=0):.2f} px, "
+                f"mean {np.mean(keypoint_diffs) if keypoint_diffs else 0:.3f} px",
+            ],
+        ],
+    )
+    model_sets.clear()
+
+    # End-to-end analysis of every input with each backend
+    config.PIPELINE = "streaming"
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        outputs, timings = analyze_with(
+            {
+                backend: {"BACKEND": backend, "PERSON_DETECTOR": "yolo"}
+                for backend in ("pytorch", "onnxruntime")
+            },
+            inputs,
+            args.device,
+            work_dir,
+        )
+        for video_path in inputs:
+            frame_count, _ = video_stats(video_path)
+            rows.append(
+                [
+                    os.path.basename(video_path),
+                    frame_count,
+                    f"{frame_count / timings['pytorch', video_path]:.1f}",
+                    f"{frame_count / timings['onnxruntime', video_path]:.1f}",
+                    f"{timings['pytorch', video_path] / timings['onnxruntime', video_path]:.2f}x",
+                ]
+                + compare_outputs(
+                    outputs["pytorch", video_path], outputs["onnxruntime", video_path]
+                )
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_table(
+        ["video", "frames", "pytorch fps", "onnxruntime fps", "speed-up"] + _ACCURACY_HEADERS,
+        rows,
+    )
+    print(
+        f"\nModel rows time {len(frames)} frames on {args.device} with "
+        f"{args.threads or 'all'} ONNX Runtime threads; both pose models get the PyTorch "
+        "YOLO person boxes. Video rows are end to end with YOLO person boxes on both "
+        "backends. Keypoint error is in units of the person's box height and max shift "
+        "is the largest difference in key moment frames."
+    )
+
+
+class _PeakRss:
+    """Samples resident memory on a thread and keeps the peak above the start."""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.base = rss_bytes()
+        self.peak = self.base
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        if self.base is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self.base is not None:
+            self._thread.join()
+
+    @property
+    def growth(self):
+        return None if self.base is None else self.peak - self.base
+
+
+def _buffered_range_app(path):
+    """The former range handler: the requested range is read into memory
+    before the first byte is sent."""
+    from werkzeug.wrappers import Request, Response
+
+    @Request.application
+    def app(request):
+        size = os.path.getsize(path)
+        start, stop = 0, size
+        if request.range is not None:
+            start, stop = request.range.ranges[0]
+            stop = size if stop is None else min(stop, size)
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(stop - start)
+        response = Response(data, 206 if request.range else 200, mimetype="video/mp4")
+        if request.range is not None:
+            response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        return response
+
+    return app
+
+
+def _streaming_range_app(path):
+    from werkzeug.wrappers import Request
+
+    from video_serving import serve_file
+
+    @Request.application
+    def app(request):
+        return serve_file(request, path)
+
+    return app
+
+
+def _scrub(port, size, seeks, read_bytes, seed, latencies):
+    """One viewer seeking around a video: each seek opens a ``bytes=N-``
+    range like a browser does and drops it after ``read_bytes``."""
+    import http.client
+    import random
+
+    rng = random.Random(seed)
+    for _ in range(seeks):
+        offset = rng.randrange(size)
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        start = time.perf_counter()
+        conn.request("GET", "/", headers={"Range": f"bytes={offset}-"})
+        response = conn.getresponse()
+        response.read(min(read_bytes, size - offset))
+        latencies.append(time.perf_counter() - start)
+        conn.close()
+
+
+def benchmark_serving(args):
+    """Scrub latency and server memory of range serving under concurrent viewers."""
+    import logging
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    source = args.video or max(
+        glob.glob(os.path.join(CURRENT_DIR, "input_videos", "*.mp4")), key=os.path.getsize
+    )
+    with open(source, "rb") as f:
+        content = f.read()
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    path = os.path.join(work_dir, "video.mp4")
+    # Repeat the video's bytes up to the target size; only the bytes matter
+    with open(path, "wb") as f:
+        for _ in range(max(1, args.size_mb * 1024 * 1024 // len(content))):
+            f.write(content)
+    size = os.path.getsize(path)
+
+    rows = []
+    try:
+        for name, make_app in (
+            ("buffered", _buffered_range_app),
+            ("streaming", _streaming_range_app),
+        ):
+            server = make_server("127.0.0.1", 0, make_app(path), threaded=True)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                for viewers in args.viewers:
+                    latencies = []
+                    with _PeakRss() as memory:
+                        clients = [
+                            threading.Thread(
+                                target=_scrub,
+                                args=(server.port, size, args.seeks, args.read_kb * 1024, i, latencies),
+                            )
+                            for i in range(viewers)
+                        ]
+                        for client in clients:
+                            client.start()
+                        for client in clients:
+                            client.join()
+                    latencies = np.array(latencies) * 1000
+                    rows.append(
+                        [
+                            name,
+                            viewers,
+                            len(latencies),
+                            f"{np.percentile(latencies, 50):.1f}",
+                            f"{np.percentile(latencies, 95):.1f}",
+                            "-" if memory.growth is None else f"{memory.growth / 2**20:.0f}",
+                        ]
+                    )
+            finally:
+                server.shutdown()
+                thread.join()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_table(["server", "viewers", "seeks", "p50 ms", "p95 ms", "peak RSS +MB"], rows)
+    print(
+        f"\nEach seek requests bytes=N- of a {size / 2**20:.0f}MB video at a random offset "
+        f"and reads {args.read_kb}KB before moving on, as a scrubbing video element does. "
+        "Latency is until those bytes arrived; memory is the peak growth of the "
+        "benchmark process, which hosts the server."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analyzer backend")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pipeline_parser = subparsers.add_parser(
+        "pipeline", help="Decode passes and time per minute of video for each pipeline"
+    )
+    pipeline_parser.add_argument(
+        "--input", nargs="+", required=True, help="Path(s) to input videos"
+    )
+    pipeline_parser.add_argument(
+        "--pipelines",
+        nargs="+",
+        default=["legacy", "streaming"],
+        choices=["legacy", "streaming"],
+        help="Pipelines to compare",
+    )
+    pipeline_parser.add_argument(
+        "--device", default=config.DEVICE, help='Device to use (cuda device or "cpu")'
+    )
+    pipeline_parser.set_defaults(func=benchmark_pipeline)
+
+    moments_parser = subparsers.add_parser(
+        "key-moments",
+        help="Key moment detection time on an analyzed clip repeated into long videos",
+    )
+    moments_parser.add_argument(
+        "--video",
+        required=True,
+        help="Analyzed output video (e.g. output/serve_pose.mp4) with its saved poses and detections",
+    )
+    moments_parser.add_argument(
+        "--repeats", nargs="+", type=int, default=[1, 10, 50], help="Clip repetitions"
+    )
+    moments_parser.add_argument("--runs", type=int, default=3, help="Runs per length")
+    moments_parser.set_defaults(func=benchmark_key_moments)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Serve comparison time against aligning every pair of frames"
+    )
+    for name in ("video1", "video2"):
+        compare_parser.add_argument(
+            f"--{name}", required=True, help="Analyzed output video with its saved poses"
+        )
+        compare_parser.add_argument(
+            f"--serve{name[-1]}", type=int, help="Serve of a multi-serve session"
+        )
+    compare_parser.add_argument("--runs", type=int, default=3, help="Runs per alignment")
+    compare_parser.set_defaults(func=benchmark_compare)
+
+    sampling_parser = subparsers.add_parser(
+        "sampling", help="Adaptive frame sampling accuracy and speed against full rate"
+    )
+    sampling_parser.add_argument(
+        "--input", nargs="+", help="Path(s) to input videos (default: input_videos/*.mp4)"
+    )
+    sampling_parser.add_argument(
+        "--max-stride", type=int, default=config.SAMPLING_MAX_STRIDE, help="Largest stride"
+    )
+    sampling_parser.add_argument(
+        "--device", default=config.DEVICE, help='Device to use (cuda device or "cpu")'
+    )
+    sampling_parser.set_defaults(func=benchmark_sampling)
+
+    roi_parser = subparsers.add_parser(
+        "roi", help="ROI cropping pixels, accuracy and speed against full frames"
+    )
+    roi_parser.add_argument(
+        "--input", nargs="+", help="Path(s) to input videos (default: input_videos/*.mp4)"
+    )
+    roi_parser.add_argument(
+        "--reacquire-frames",
+        type=int,
+        default=config.ROI_REACQUIRE_FRAMES,
+        help="Frames between full-frame pose passes",
+    )
+    roi_parser.add_argument(
+        "--device", default=config.DEVICE, help='Device to use (cuda device or "cpu")'
+    )
+    roi_parser.set_defaults(func=benchmark_roi)
+
+    detectors_parser = subparsers.add_parser(
+        "detectors",
+        help="YOLO person boxes against MMPose's person detector, speed and accuracy",
+    )
+    detectors_parser.add_argument(
+        "--input", nargs="+", help="Path(s) to input videos (default: input_videos/*.mp4)"
+    )
+    detectors_parser.add_argument(
+        "--device", default=config.DEVICE, help='Device to use (cuda device or "cpu")'
+    )
+    detectors_parser.set_defaults(func=benchmark_detectors)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Pose inference throughput across MMPose batch sizes"
+    )
+    batch_parser.add_argument("--input", required=True, help="Path to an input video")
+    batch_parser.add_argument(
+        "--frames", type=int, default=64, help="Frames decoded from the start of the video"
+    )
+    batch_parser.add_argument(
+        "--batch-sizes", nargs="+", type=int, default=[1, 2, 4, 8, 16], help="Batch sizes"
+    )
+    batch_parser.add_argument("--runs", type=int, default=2, help="Runs per batch size")
+    batch_parser.add_argument(
+        "--device", default="cpu", help='Device to use (cuda device or "cpu")'
+    )
+    batch_parser.set_defaults(func=benchmark_batch)
+
+    onnx_parser = subparsers.add_parser(
+        "onnx", help="ONNX Runtime backend parity and throughput against PyTorch"
+    )
+    onnx_parser.add_argument(
+        "--input", nargs="+", help="Path(s) to input videos (default: input_videos/*.mp4)"
+    )
+    onnx_parser.add_argument(
+        "--frames", type=int, default=64, help="Frames of the first video for model parity"
+    )
+    onnx_parser.add_argument(
+        "--threads", type=int, default=config.ONNX_THREADS, help="ONNX Runtime threads (0 for all)"
+    )
+    onnx_parser.add_argument(
+        "--device", default="cpu", help='Device to use (cuda device or "cpu")'
+    )
+    onnx_parser.set_defaults(func=benchmark_onnx)
+
+    serving_parser = subparsers.add_parser(
+        "serving", help="Range serving scrub latency and memory under concurrent viewers"
+    )
+    serving_parser.add_argument(
+        "--video", help="Video whose bytes are served (default: largest in input_videos/)"
+    )
+    serving_parser.add_argument(
+        "--size-mb", type=int, default=100, help="Size the video is repeated up to"
+    )
+    serving_parser.add_argument(
+        "--viewers", nargs="+", type=int, default=[1, 8, 32], help="Concurrent viewers"
+    )
+    serving_parser.add_argument("--seeks", type=int, default=20, help="Seeks per viewer")
+    serving_parser.add_argument(
+        "--read-kb", type=int, default=512, help="KB read after each seek"
+    )
+    serving_parser.set_defaults(func=benchmark_serving)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
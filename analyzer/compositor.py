@@ -0,0 +1,169 @@
+import os
+import uuid
+
+import cv2
+import numpy as np
+
+from key_moment_detector import LEFT_HIP, LEFT_SHOULDER, RIGHT_HIP, RIGHT_SHOULDER
+from pose_store import PoseStore, pose_store_path
+from renderer import draw_pose, open_video_writer
+from serve_comparison import compare_videos
+
+MODES = ("side_by_side", "ghost")
+# Colour and opacity of the second player's skeleton in ghost mode
+GHOST_COLOR = (255, 255, 255)
+GHOST_OPACITY = 0.6
+# Report progress at most once every this many frames
+PROGRESS_INTERVAL = 10
+
+
+def _no_progress(stage, fraction):
+    pass
+
+
+def composite_name(video1, video2, mode, serve1=None, serve2=None):
+    """File name of the composite of two analyzed output videos."""
+    names = []
+    for video, serve in ((video1, serve1), (video2, serve2)):
+        name = os.path.splitext(os.path.basename(video))[0]
+        if name.endswith("_pose"):
+            name = name[: -len("_pose")]
+        names.append(f"{name}_serve{serve}" if serve is not None else name)
+    return f"{names[0]}_vs_{names[1]}_{mode}.mp4"
+
+
+class _FrameReader:
+    """Read frames of a video in increasing order, repeating the last one
+    while the same frame is asked for again.
+
+    Frames before the one asked for are grabbed without being converted,
+    so nothing but the current frame is held in memory.
+    """
+
+    def __init__(self, video_path):
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open video file {video_path}")
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.position = -1
+        self.frame = None
+
+    def read(self, frame_idx):
+        """The frame at ``frame_idx`` (or the last one, past the end)."""
+        while self.position < frame_idx:
+            if self.position < frame_idx - 1:
+                ok = self.cap.grab()
+            else:
+                ok, frame = self.cap.read()
+                if ok:
+                    self.frame = frame
+            if not ok:
+                break
+            self.position += 1
+        return self.frame
+
+    def release(self):
+        self.cap.release()
+
+
+def _hips_and_torso(keypoints):
+    """Hip centre and torso length of the first person in a frame."""
+    xy = keypoints[0, :, :2]
+    hips = (xy[LEFT_HIP] + xy[RIGHT_HIP]) / 2
+    shoulders = (xy[LEFT_SHOULDER] + xy[RIGHT_SHOULDER]) / 2
+    return hips, np.linalg.norm(shoulders - hips)
+
+
+def _draw_ghost(frame, keypoints1, keypoints2):
+    """Draw the second player's skeleton translucently over a frame of the
+    first, moved onto the first player's hips and scaled to their torso."""
+    if keypoints1.shape[0] == 0 or keypoints2.shape[0] == 0:
+        return
+    hips1, torso1 = _hips_and_torso(keypoints1)
+    hips2, torso2 = _hips_and_torso(keypoints2)
+    if not (torso1 > 0 and torso2 > 0):
+        return
+    points = (keypoints2[0, :, :2] - hips2) * (torso1 / torso2) + hips1
+    visible = np.isfinite(points).all(axis=1)
+    ghost = {
+        "keypoints": np.where(visible[:, None], points, 0.0),
+        "keypoint_scores": np.where(visible, np.nan_to_num(keypoints2[0, :, 2]), 0.0),
+    }
+    overlay = frame.copy()
+    draw_pose(overlay, [ghost], color=GHOST_COLOR)
+    cv2.addWeighted(overlay, GHOST_OPACITY, frame, 1 - GHOST_OPACITY, 0, dst=frame)
+
+
+def render_composite(
+    output_path1,
+    output_path2,
+    composite_path,
+    mode="side_by_side",
+    serve1=None,
+    serve2=None,
+    progress=_no_progress,
+):
+    """Render two analyzed serves, time-aligned, into one H.264 video.
+
+    The serves are aligned with serve_comparison.compare_videos and the
+    composite follows the first one frame by frame, showing the matching
+    frame of the second. ``side_by_side`` puts the second video, scaled to
+    the same height, to the right of the first; ``ghost`` draws the second
+    player's skeleton over the first video, moved onto the first player's
+    hips and scaled to their torso. Both videos are decoded once, in
+    order, and frames go straight into the encoder. Returns the comparison.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown composite mode {mode!r}, expected one of {', '.join(MODES)}")
+    comparison = compare_videos(output_path1, output_path2, serve1, serve2)
+    start1 = comparison["frame_map"]["start_frame1"]
+    frames2 = comparison["frame_map"]["frames2"]
+    if not frames2:
+        raise ValueError("The serves have no frames to composite")
+
+    video1 = _FrameReader(output_path1)
+    video2 = _FrameReader(output_path2)
+    if mode == "side_by_side":
+        width2 = int(round(video2.width * video1.height / video2.height))
+        width = video1.width + width2
+        canvas = np.zeros((video1.height, width, 3), np.uint8)
+    else:
+        width = video1.width
+        keypoints1 = PoseStore(pose_store_path(output_path1)).arrays["keypoints"]
+        keypoints2 = PoseStore(pose_store_path(output_path2)).arrays["keypoints"]
+
+    tmp_path = os.path.join(
+        os.path.dirname(composite_path), f".tmp-{uuid.uuid4().hex}.mp4"
+    )
+    out = open_video_writer(tmp_path, width, video1.height, video1.fps)
+    progress("composite", 0.0)
+    try:
+        try:
+            for i, frame2_idx in enumerate(frames2):
+                frame1_idx = start1 + i
+                frame = video1.read(frame1_idx)
+                frame2 = video2.read(frame2_idx)
+                if frame is None or frame2 is None:
+                    break
+                if mode == "side_by_side":
+                    canvas[:, : video1.width] = frame
+                    canvas[:, video1.width :] = cv2.resize(frame2, (width2, video1.height))
+                    out.write(canvas)
+                else:
+                    _draw_ghost(frame, keypoints1[frame1_idx], keypoints2[frame2_idx])
+                    out.write(frame)
+                if (i + 1) % PROGRESS_INTERVAL == 0:
+                    progress("composite", (i + 1) / len(frames2))
+        finally:
+            video1.release()
+            video2.release()
+            out.close()
+        os.replace(tmp_path, composite_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    progress("composite", 1.0)
+    print(f"Saved {mode} composite to: {composite_path}")
+    return comparison
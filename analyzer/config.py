@@ -0,0 +1,142 @@
+"""Runtime configuration for the analyzer backend.
+
+Every setting can be overridden with an environment variable of the same name
+prefixed with ``ANALYZER_`` (e.g. ``ANALYZER_DEVICE=cpu``).
+"""
+
+import os
+
+
+def _env(name, default):
+    return os.environ.get(f"ANALYZER_{name}", default)
+
+
+def _env_int(name, default):
+    return int(_env(name, default))
+
+
+def _env_float(name, default):
+    return float(_env(name, default))
+
+
+def _env_bool(name, default):
+    return str(_env(name, default)).lower() in ("1", "true", "yes", "on")
+
+
+def _env_list(name, default, separator=","):
+    return [item.strip() for item in _env(name, default).split(separator) if item.strip()]
+
+
+def _parse_cpu_set(text):
+    """Cores of a CPU list such as ``0-3,8``."""
+    cpus = set()
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+# Models
+DEVICE = _env("DEVICE", "cuda:0")
+YOLO_MODEL = _env("YOLO_MODEL", "yolov9e.pt")
+POSE_MODEL = _env("POSE_MODEL", "human")
+
+# Model pool: MODEL_REPLICAS model sets on each of DEVICES (e.g.
+# "cuda:0,cuda:1", defaults to DEVICE). CPU_SETS optionally pins inference on
+# each device's replicas to a set of cores, e.g. "0-7;8-15" with DEVICES=cpu,cpu.
+MODEL_REPLICAS = _env_int("MODEL_REPLICAS", 1)
+DEVICES = _env_list("DEVICES", DEVICE)
+CPU_SETS = [_parse_cpu_set(cpus) for cpus in _env_list("CPU_SETS", "", ";")]
+WARM_UP_ON_STARTUP = _env_bool("WARM_UP_ON_STARTUP", True)
+
+# Background analysis jobs
+JOB_WORKERS = _env_int("JOB_WORKERS", 1)
+JOB_QUEUE_SIZE = _env_int("JOB_QUEUE_SIZE", 8)
+JOB_RETRY_AFTER = _env_int("JOB_RETRY_AFTER", 30)
+
+# Number of videos of one upload analyzed at the same time. Inference of
+# concurrent videos is further limited by ANALYZER_MODEL_REPLICAS.
+VIDEO_CONCURRENCY = _env_int("VIDEO_CONCURRENCY", 2)
+
+# Video analysis pipeline: "streaming" decodes each frame once and feeds pose
+# estimation, detection and rendering through bounded queues; "legacy" runs
+# each model over the whole file and re-reads intermediate videos.
+PIPELINE = _env("PIPELINE", "streaming")
+PIPELINE_QUEUE_SIZE = _env_int("PIPELINE_QUEUE_SIZE", 8)
+
+# H.264 encoding of the rendered output video (x264 preset and CRF)
+ENCODE_PRESET = _env("ENCODE_PRESET", "veryfast")
+ENCODE_CRF = _env_int("ENCODE_CRF", 23)
+
+# Composite of the two analyzed serves rendered at the end of each job:
+# "side_by_side", "ghost" (the second player's skeleton over the first
+# video) or "off"; composites can also be requested with POST /api/composite
+COMPOSITE = _env("COMPOSITE", "off")
+
+# Cache of analysis results keyed by video content, models and orientation.
+# Least recently used entries are evicted beyond ANALYZER_CACHE_MAX_MB;
+# ANALYZER_CACHE_VIDEOS=0 keeps only the analysis and re-renders on a hit.
+CACHE_ENABLED = _env_bool("CACHE_ENABLED", True)
+CACHE_DIR = _env("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+CACHE_MAX_BYTES = _env_int("CACHE_MAX_MB", 2048) * 1024 * 1024
+CACHE_VIDEOS = _env_bool("CACHE_VIDEOS", True)
+
+# Videos up to this long with at most one detected serve are analyzed as a
+# single serve; longer sessions get key moments for every serve found
+SINGLE_SERVE_MAX_SECONDS = _env_int("SINGLE_SERVE_MAX_SECONDS", 30)
+
+# Smoothing of joint tracks before kinematics are derived (see
+# kinematics.py): "savgol" (Savitzky-Golay) or "one_euro"
+KINEMATICS_SMOOTHING = _env("KINEMATICS_SMOOTHING", "savgol")
+
+# Frame sampling of the streaming pipeline: "full" runs pose estimation and
+# detection on every frame; "adaptive" skips up to SAMPLING_MAX_STRIDE - 1
+# frames at a time while wrists move slower than SAMPLING_MOTION_THRESHOLD
+# body heights per frame and no ball is in view, interpolating the rest
+SAMPLING = _env("SAMPLING", "full")
+SAMPLING_MAX_STRIDE = _env_int("SAMPLING_MAX_STRIDE", 4)
+SAMPLING_MOTION_THRESHOLD = _env_float("SAMPLING_MOTION_THRESHOLD", 0.02)
+
+# Region-of-interest cropping of the streaming pipeline: once the player is
+# found, pose estimation and detection only see a crop around them, and pose
+# estimation goes back to the full frame every ROI_REACQUIRE_FRAMES frames
+ROI = _env_bool("ROI", False)
+ROI_REACQUIRE_FRAMES = _env_int("ROI_REACQUIRE_FRAMES", 30)
+
+# Person boxes for top-down pose estimation: "mmpose" runs MMPose's own person
+# detector; "yolo" adds people to the YOLO ball/racket pass and hands those
+# boxes to the pose model, so each frame goes through a single detector
+PERSON_DETECTOR = _env("PERSON_DETECTOR", "mmpose")
+
+# Frames per MMPose call: the person detector and the top-down pose model
+# each process a whole batch in one forward pass
+POSE_BATCH_SIZE = _env_int("POSE_BATCH_SIZE", 1)
+
+# Inference backend: "pytorch" runs MMPose and Ultralytics models directly;
+# "onnxruntime" runs the graphs exported to ONNX_DIR by onnx_backend.py with
+# ONNX_THREADS intra-op threads (0 for every core). The exported pose graph
+# takes YOLO person boxes and draws no visualisation, so this backend implies
+# PERSON_DETECTOR=yolo and the streaming pipeline.
+BACKEND = _env("BACKEND", "pytorch")
+ONNX_DIR = _env("ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+ONNX_THREADS = _env_int("ONNX_THREADS", 0)
+if BACKEND == "onnxruntime":
+    PERSON_DETECTOR = "yolo"
+    PIPELINE = "streaming"
+
+# Chunked uploads (see uploads.py): videos of up to UPLOAD_MAX_MB are sent in
+# chunks and analysis can start before the last one arrives. Sessions that
+# receive nothing for UPLOAD_SESSION_TTL seconds are cancelled.
+UPLOAD_MAX_BYTES = _env_int("UPLOAD_MAX_MB", 4096) * 1024 * 1024
+UPLOAD_SESSION_TTL = _env_int("UPLOAD_SESSION_TTL", 600)
+
+# Production serving with gunicorn (see gunicorn.conf.py). ROLE picks the
+# routes a server runs: "io" serves the frontend and finished results with
+# IO_WORKERS processes of IO_THREADS threads and loads no model; "analysis"
+# takes uploads and runs jobs in a single process, which owns the job queue
+# and the model pool, with ANALYSIS_THREADS request threads; "all" does both.
+ROLE = _env("ROLE", "all")
+BIND = _env("BIND", "0.0.0.0:5000")
+IO_WORKERS = _env_int("IO_WORKERS", 4)
+IO_THREADS = _env_int("IO_THREADS", 16)
+ANALYSIS_THREADS = _env_int("ANALYSIS_THREADS", 32)
@@ -0,0 +1,98 @@
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _gap_starts(finite):
+    """Indices of the first sample of every run of missing samples."""
+    return np.flatnonzero(~finite & np.concatenate(([True], finite[:-1])))
+
+
+def lttb_indices(y, points):
+    """Indices of at most ``points`` samples of ``y`` picked by
+    Largest-Triangle-Three-Buckets.
+
+    The first and last samples are kept, and from each bucket in between
+    the one forming the largest triangle with the sample kept before it
+    and the mean of the next bucket, so peaks survive and the line keeps
+    its shape. Missing (NaN) samples are left out, except the first of
+    every gap, which keeps the gap visible in a chart. Gap markers count
+    against ``points`` and take at most half of it, spread evenly over the
+    gaps when there are more.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(y)
+    indices = np.flatnonzero(finite)
+    gaps = _gap_starts(finite)
+    if len(indices) + len(gaps) <= points:
+        return np.union1d(indices, gaps)
+    if len(gaps) > points // 2:
+        gaps = gaps[np.linspace(0, len(gaps) - 1, points // 2).astype(np.int64)]
+    points -= len(gaps)
+    if len(indices) <= points or points < 3:
+        kept = np.linspace(0, len(indices) - 1, min(points, len(indices))).astype(np.int64)
+        return np.union1d(indices[kept], gaps)
+
+    values = y[indices]
+    # Buckets of the samples between the first and the last one
+    edges = np.linspace(1, len(indices) - 1, points - 1).astype(np.int64)
+    sums = np.add.reduceat(values[1:-1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    means_x = np.add.reduceat(indices[1:-1].astype(np.float64), edges[:-1] - 1) / counts
+    means_y = sums / counts
+    # The mean of the "next bucket" of the last bucket is the last sample
+    next_x = np.append(means_x[1:], indices[-1])
+    next_y = np.append(means_y[1:], values[-1])
+
+    kept = np.empty(points, np.int64)
+    kept[0] = 0
+    kept[-1] = len(indices) - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        x = indices[start:end]
+        area = np.abs(
+            (indices[previous] - next_x[bucket]) * (values[start:end] - values[previous])
+            - (indices[previous] - x) * (next_y[bucket] - values[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return np.union1d(indices[kept], gaps)
+
+
+def minmax_indices(y, points):
+    """Indices of the lowest and the highest sample of each of
+    ``points // 2`` equal buckets of ``y``, in order.
+
+    Cheaper than LTTB and keeps every extreme, which suits dense, noisy
+    series. Buckets with no finite sample keep their first sample, so gaps
+    stay visible.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    num_samples = len(y)
+    buckets = max(1, points // 2)
+    if num_samples <= points:
+        return np.arange(num_samples)
+
+    size = -(-num_samples // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:num_samples] = y
+    padded = padded.reshape(buckets, size)
+    finite = np.isfinite(padded)
+    low = np.where(finite, padded, np.inf).argmin(axis=1)
+    high = np.where(finite, padded, -np.inf).argmax(axis=1)
+    offsets = np.arange(buckets) * size
+    empty = ~finite.any(axis=1)
+    low = np.where(empty, 0, low) + offsets
+    high = np.where(empty, 0, high) + offsets
+    indices = np.union1d(low, high)
+    return indices[indices < num_samples]
+
+
+def decimate(y, points, method="lttb"):
+    """Indices of about ``points`` samples of ``y`` that chart like all of them."""
+    if method == "lttb":
+        return lttb_indices(y, points)
+    if method == "minmax":
+        return minmax_indices(y, points)
+    raise ValueError(f"Unknown decimation {method!r}, expected one of {', '.join(METHODS)}")
@@ -0,0 +1,224 @@
+import queue
+import threading
+
+import cv2
+
+# Seconds a blocked queue operation waits before re-checking for shutdown
+_POLL_INTERVAL = 0.1
+
+_END = object()
+
+# OpenCV 4.10 and later can decode from a Python file object
+STREAM_CAPTURE = hasattr(cv2, "IStreamReader")
+
+# cv2.rotate codes of the clockwise rotations VideoSource applies
+_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def normalize_rotation(degrees):
+    """``degrees`` as a clockwise rotation of 0, 90, 180 or 270.
+
+    Raises ValueError for angles that are not a multiple of 90 degrees.
+    """
+    try:
+        rotation = int(degrees) % 360
+    except (TypeError, ValueError):
+        rotation = None
+    if rotation != 0 and rotation not in _ROTATIONS:
+        raise ValueError(f"Rotation must be a multiple of 90 degrees, got {degrees!r}")
+    return rotation
+
+
+def _container_rotation(cap):
+    """Clockwise rotation OpenCV applies from the container's display matrix."""
+    if not cap.get(cv2.CAP_PROP_ORIENTATION_AUTO):
+        return 0
+    return int(cap.get(cv2.CAP_PROP_ORIENTATION_META)) % 360
+
+
+def video_rotation(video_path, rotation=0):
+    """The rotation VideoSource applies to ``video_path`` for a client ``rotation``.
+
+    Videos with rotation in their container are already upright once
+    decoded, so the client's rotation only applies to the others.
+    """
+    rotation = normalize_rotation(rotation)
+    if not rotation:
+        return 0
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return 0 if _container_rotation(cap) else rotation
+    finally:
+        cap.release()
+
+
+class _Failure:
+    """Carries an exception from a pipeline thread to its consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class VideoSource:
+    """Decode a video file exactly once, frame by frame.
+
+    With a ``stream`` (a seekable binary file object such as an
+    uploads.UploadReader) frames are decoded from it instead of opening
+    ``video_path``, through OpenCV's FFmpeg stream capture (STREAM_CAPTURE).
+
+    OpenCV applies the rotation stored in the container's display matrix
+    while demuxing. ``rotation`` turns the frames of videos without one 90,
+    180 or 270 degrees clockwise in memory; it is ignored when the
+    container has a rotation, which clients report as well (iOS always
+    sends 90). ``width`` and ``height`` describe the frames as yielded.
+    """
+
+    def __init__(self, video_path, stream=None, rotation=0):
+        self.video_path = video_path
+        self.stream = stream
+        self.rotation = normalize_rotation(rotation)
+        if stream is not None:
+            self.cap = cv2.VideoCapture(stream, cv2.CAP_FFMPEG, [])
+        else:
+            self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open video file {video_path}")
+        container_rotation = _container_rotation(self.cap)
+        if container_rotation and self.rotation:
+            print(
+                f"Video is rotated {container_rotation} degrees by its container, "
+                f"ignoring the requested {self.rotation} degrees"
+            )
+            self.rotation = 0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if self.rotation in (90, 270):
+            self.width, self.height = self.height, self.width
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if self.fps <= 0:
+            self.fps = 30
+            print(f"Warning: Could not detect FPS, using default of {self.fps}")
+        else:
+            print(f"Detected video FPS: {self.fps}")
+        self.frames_decoded = 0
+
+    def frames(self):
+        """Yield ``(frame_idx, frame)`` for every decodable frame."""
+        try:
+            while True:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                if self.rotation:
+                    frame = cv2.rotate(frame, _ROTATIONS[self.rotation])
+                yield self.frames_decoded, frame
+                self.frames_decoded += 1
+            if getattr(self.stream, "truncated", False):
+                raise IOError(f"Video stream of {self.video_path} ended before it was complete")
+        finally:
+            self.release()
+
+    def release(self):
+        self.cap.release()
+        if self.stream is not None:
+            self.stream.close()
+
+
+class FramePipeline:
+    """Connect per-frame stages with bounded queues, one thread per stage.
+
+    ``source`` fans every item of an iterable out to several consumers and
+    ``map`` applies a function to a stream on its own thread. Items keep their
+    order, so the outputs of parallel branches can simply be zipped back
+    together. Queues hold at most ``queue_size`` items, which bounds the
+    number of decoded frames in flight. Exceptions raised in a stage are
+    re-raised in whoever consumes its output, and leaving the ``with`` block
+    stops every stage.
+    """
+
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._threads = []
+        self._queues = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def queue_depths(self):
+        """Current number of items waiting in each stage's queue."""
+        return {name: q.qsize() for name, q in self._queues.items()}
+
+    def source(self, iterable, consumers=1, name="source"):
+        """Fan ``iterable`` out to ``consumers`` independent iterators."""
+        queues = [self._queue(f"{name}_{i}") for i in range(consumers)]
+        self._start(self._run_source, iterable, queues, name=name)
+        return [self._drain(q) for q in queues]
+
+    def map(self, fn, iterable, name="map"):
+        """Return an iterator over ``fn(item)``, computed on a separate thread."""
+        q = self._queue(name)
+        self._start(self._run_source, (fn(item) for item in iterable), [q], name=name)
+        return self._drain(q)
+
+    def _queue(self, name):
+        q = queue.Queue(maxsize=self.queue_size)
+        self._queues[name] = q
+        return q
+
+    def _start(self, target, *args, name):
+        thread = threading.Thread(
+            target=target, args=args, name=f"pipeline-{name}", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, q):
+        while True:
+            try:
+                item = q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def _run_source(self, iterable, queues):
+        try:
+            for item in iterable:
+                for q in queues:
+                    if not self._put(q, item):
+                        return
+            end = _END
+        except BaseException as e:
+            end = _Failure(e)
+        for q in queues:
+            self._put(q, end)
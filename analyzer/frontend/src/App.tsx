@@ -8,6 +8,28 @@ interface ProcessedVideo {
   label: string;
 }
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
+// Poll an analysis job until it finishes and return its result
+const waitForJob = async (jobId: string) => {
+  while (true) {
+    const response = await fetch(`/api/jobs/${jobId}`);
+    if (!response.ok) {
+      throw new Error(
+        `Failed to get job status: ${response.status} ${response.statusText}`
+      );
+    }
+    const job = await response.json();
+    if (job.status === "succeeded") {
+      return job.result;
+    }
+    if (job.status === "failed") {
+      throw new Error(job.error || "Error processing videos");
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
 const App: React.FC = () => {
   const [processedVideos, setProcessedVideos] = useState<ProcessedVideo[]>([]);
   const [isLoading, setIsLoading] = useState<boolean>(false);
@@ -42,7 +64,8 @@ const App: React.FC = () => {
         );
       }
 
-      const data = await response.json();
+      const { job_id } = await response.json();
+      const data = await waitForJob(job_id);
       if (data.status === "success") {
         setProcessedVideos(data.videos);
       } else {
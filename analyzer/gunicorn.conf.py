@@ -0,0 +1,37 @@
+"""gunicorn settings for serving the analyzer in production.
+
+Run an io server for viewers and an analysis server side by side, e.g.
+
+    ANALYZER_ROLE=io ANALYZER_BIND=0.0.0.0:5000 gunicorn -c gunicorn.conf.py
+    ANALYZER_ROLE=analysis ANALYZER_BIND=0.0.0.0:5001 gunicorn -c gunicorn.conf.py
+
+with a reverse proxy sending /api/upload, /api/uploads, /api/analyze,
+/api/composite, /api/jobs, /api/ready and /metrics to the analysis server
+and everything else to the io server. Both need the same ``output/`` directory.
+"""
+
+import config
+
+wsgi_app = f"main:create_app('{config.ROLE}')"
+bind = config.BIND
+worker_class = "gthread"
+
+if config.ROLE == "io":
+    workers = config.IO_WORKERS
+    threads = config.IO_THREADS
+else:
+    # Jobs, upload sessions and models live in memory, so one process
+    # serves every analysis request; its threads hold uploads and
+    # server-sent event streams open
+    workers = 1
+    threads = config.ANALYSIS_THREADS
+
+# Models are loaded after the fork, never in the master process
+preload_app = False
+
+
+def post_worker_init(worker):
+    import main
+
+    if main.model_pool is not None and config.WARM_UP_ON_STARTUP:
+        main.model_pool.start_warm_up()
@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+import metrics
+
+# Pipeline stages reported through job progress events, in execution order
+STAGES = ("pose", "detection", "render", "encode", "key_moments")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the job queue is at capacity."""
+
+
+class Job:
+    """A unit of background work with progress reporting and an event log."""
+
+    def __init__(self, kind="analysis"):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.moments = {}
+        self.result = None
+        self.error = None
+        self._events = []
+        self._cond = threading.Condition()
+        self._emit("status", status=QUEUED)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def _emit(self, event_type, **data):
+        with self._cond:
+            self._events.append(
+                {"id": len(self._events), "event": event_type, "data": data}
+            )
+            self._cond.notify_all()
+
+    def set_status(self, status, **data):
+        with self._cond:
+            self.status = status
+            if status == RUNNING:
+                self.started_at = time.time()
+            elif status in FINISHED_STATES:
+                self.finished_at = time.time()
+            self._emit("status", status=status, **data)
+
+    def report(self, video, stage, fraction):
+        """Record that ``stage`` of ``video`` is ``fraction`` (0-1) complete."""
+        fraction = round(min(max(float(fraction), 0.0), 1.0), 3)
+        # Videos of a job report from their own threads
+        with self._cond:
+            stages = self.progress.setdefault(video, {s: 0.0 for s in STAGES})
+            if stages.get(stage) == fraction:
+                return
+            stages[stage] = fraction
+            self._emit("progress", video=video, stage=stage, progress=fraction)
+
+    def progress_callback(self, video):
+        """A ``progress(stage, fraction)`` callable bound to one video."""
+        return lambda stage, fraction: self.report(video, stage, fraction)
+
+    def publish_moment(self, video, moment):
+        """Record a key moment of ``video`` found while analysis is running."""
+        with self._cond:
+            self.moments.setdefault(video, []).append(moment)
+            self._emit("moment", video=video, moment=moment)
+
+    def moment_callback(self, video):
+        """An ``on_moment(moment)`` callable bound to one video."""
+        return lambda moment: self.publish_moment(video, moment)
+
+    def events(self, start=0, heartbeat=15.0):
+        """Yield events from index ``start`` as they happen until the job ends.
+
+        ``None`` is yielded whenever ``heartbeat`` seconds pass without an
+        event so that callers can keep idle connections alive.
+        """
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self._events) and not self.finished:
+                    self._cond.wait(timeout=heartbeat)
+                pending = self._events[index:]
+                done = self.finished
+            if pending:
+                for event in pending:
+                    yield event
+                index += len(pending)
+            elif done:
+                return
+            else:
+                yield None
+
+    def to_dict(self):
+        """A snapshot of the job, safe to serialize while it keeps running."""
+        with self._cond:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "progress": {video: dict(stages) for video, stages in self.progress.items()},
+                "moments": {video: list(moments) for video, moments in self.moments.items()},
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobManager:
+    """Run jobs on a fixed number of worker threads behind a bounded queue.
+
+    ``submit`` raises QueueFullError instead of blocking once ``max_queued``
+    jobs are waiting, so callers can shed load (e.g. with HTTP 429).
+    """
+
+    def __init__(self, workers=1, max_queued=8, history=100):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.history = history
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, name=f"job-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    @property
+    def full(self):
+        return self._queue.full()
+
+    def queue_length(self):
+        return self._queue.qsize()
+
+    def running_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == RUNNING)
+
+    def submit(self, fn, *args, kind="analysis", **kwargs):
+        """Queue ``fn(job, *args, **kwargs)``; its return value becomes the job result."""
+        self.start()
+        job = Job(kind=kind)
+        try:
+            self._queue.put_nowait((job, fn, args, kwargs))
+        except queue.Full:
+            raise QueueFullError(
+                f"Job queue is full ({self.max_queued} jobs waiting)"
+            )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(len(finished) - self.history, 0)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job, fn, args, kwargs = self._queue.get()
+            job.set_status(RUNNING)
+            metrics.JOB_WAIT_SECONDS.observe(job.started_at - job.created_at, kind=job.kind)
+            try:
+                job.result = fn(job, *args, **kwargs)
+                job.set_status(SUCCEEDED, result=job.result)
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.set_status(FAILED, error=job.error)
+            finally:
+                metrics.JOBS.inc(kind=job.kind, status=job.status)
+                metrics.JOB_SECONDS.observe(
+                    job.finished_at - job.started_at, kind=job.kind, status=job.status
+                )
+                self._queue.task_done()
@@ -1,3 +1,5 @@
+from collections import deque
+
 import numpy as np
 
 # Define keypoint indices (based on MMPose human keypoint format)
@@ -14,6 +16,20 @@ RIGHT_KNEE = 14
 LEFT_ANKLE = 15
 RIGHT_ANKLE = 16
 
+# Frames are skipped when the mean keypoint score is below this
+MIN_POSE_SCORE = 0.3
+# Frames before the current one searched for the ball still in the left hand
+BALL_RELEASE_WINDOW = 5
+# Trophy position needs the shoulders tilted by more than this (degrees)
+SHOULDER_ANGLE_THRESHOLD = 30
+# Follow through needs the shoulder-elbow angle above this (degrees)
+FOLLOW_THROUGH_ANGLE_THRESHOLD = 30
+# Online detection confirms the impact once the racket has not gone any
+# higher for this many seconds
+IMPACT_CONFIRM_SECONDS = 0.3
+# Online detection gives up on a serve that has not finished after this long
+ONLINE_SERVE_TIMEOUT_SECONDS = 10.0
+
 
 def calculate_ball_velocity(ball1, ball2, fps):
     """Calculate velocity between two ball detections."""
@@ -42,33 +58,67 @@ def calculate_ball_velocity(ball1, ball2, fps):
     return velocity
 
 
-def detect_key_moments(
-    keypoints_results, ball_detections=None, racket_detections=None, fps=30
-):
-    """Detect key moments of a tennis serve based on pose keypoints, ball and racket detection."""
-    key_moments = []
-    serve_phases = {
-        "start": False,
-        "ball_release": False,
-        "trophy": False,
-        "racket_low": False,
-        "impact": False,
-        "follow_through": False,
-    }
-
-    # Helper function to calculate vertical position relative to shoulder
-    def get_relative_height(point, shoulder):
-        return shoulder[1] - point[1]  # Positive means above shoulder
-
-    # Helper function to calculate horizontal position relative to shoulder
-    def get_relative_forward_pos(point, shoulder):
-        return point[0] - shoulder[0]  # Positive means in front
-
-    # First, analyze all frames to find max heights for comparison
-    all_left_wrist_y = []
-    all_right_wrist_y = []
-    all_right_ankle_y = []
-    valid_frames = []
+class FrameIndex:
+    """Detections of a video grouped by frame in CSR layout.
+
+    Detections are stably sorted by frame, so ``offsets[f]:offsets[f + 1]``
+    are the detections of frame ``f`` in their original order. Only
+    detections of frames below ``num_frames`` are indexed.
+    """
+
+    def __init__(self, detections, num_frames):
+        self.detections = detections or []
+        frames = np.array([d["frame"] for d in self.detections], dtype=np.int64)
+        bboxes = np.array(
+            [d["bbox"] for d in self.detections], dtype=np.float64
+        ).reshape(-1, 4)
+
+        order = np.argsort(frames, kind="stable")
+        self.offsets = np.searchsorted(frames[order], np.arange(num_frames + 1))
+        # Positions into the original detection list, frame by frame
+        self.order = order[self.offsets[0] : self.offsets[-1]]
+        self.frames = frames[self.order]
+        self.centers = (bboxes[self.order, :2] + bboxes[self.order, 2:]) / 2
+
+    def __len__(self):
+        return len(self.order)
+
+    def counts(self):
+        """Number of detections in each frame."""
+        return np.diff(self.offsets)
+
+    def detection(self, position):
+        """The original detection dict at an index position."""
+        return self.detections[self.order[position]]
+
+    def first_per_frame(self, mask, key=None):
+        """Per frame, the first position where ``mask`` holds, or -1.
+
+        With ``key``, the position with the smallest key wins instead, ties
+        going to the earlier detection.
+        """
+        positions = np.flatnonzero(mask)
+        if key is not None:
+            positions = positions[
+                np.lexsort((positions, key[positions], self.frames[positions]))
+            ]
+        first = np.full(len(self.offsets) - 1, -1, dtype=np.int64)
+        frames, starts = np.unique(self.frames[positions], return_index=True)
+        first[frames] = positions[starts]
+        return first
+
+
+def _first_person_arrays(keypoints_results):
+    """Keypoints and confidence of the first person in every frame.
+
+    Returns ``(valid, keypoints, confidence)``: whether the frame has a
+    confident pose, ``(frames, keypoints, 2)`` coordinates (NaN where not
+    valid) and the mean keypoint score (1.0 without scores).
+    """
+    num_frames = len(keypoints_results)
+    valid = np.zeros(num_frames, dtype=bool)
+    keypoints = np.full((num_frames, RIGHT_ANKLE + 1, 2), np.nan)
+    confidence = np.ones(num_frames)
 
     for frame_idx, result in enumerate(keypoints_results):
         # Skip if no predictions
@@ -85,455 +135,544 @@ def detect_key_moments(
         if "keypoints" not in person:
             continue
 
-        # Convert keypoints to numpy array if it's not already
-        keypoints = (
-            np.array(person["keypoints"])
-            if isinstance(person["keypoints"], list)
-            else person["keypoints"]
-        )
         scores = person.get("keypoint_scores", None)
+        if scores is not None:
+            mean_score = np.mean(scores)
+            # Skip if confidence is too low
+            if mean_score < MIN_POSE_SCORE:
+                continue
+            confidence[frame_idx] = float(mean_score)
 
-        # Skip if confidence is too low
-        if scores is not None and np.mean(scores) < 0.3:  # Reduced confidence threshold
-            continue
+        kpts = np.asarray(person["keypoints"], dtype=np.float64)[:, :2]
+        keypoints[frame_idx, : len(kpts)] = kpts[: RIGHT_ANKLE + 1]
+        valid[frame_idx] = True
 
-        # Get relevant keypoint coordinates
-        left_wrist = keypoints[LEFT_WRIST][:2]
-        right_wrist = keypoints[RIGHT_WRIST][:2]
-        right_ankle = keypoints[RIGHT_ANKLE][:2]
+    return valid, keypoints, confidence
 
-        # Record y-positions (lower y value means higher position in the image)
-        all_left_wrist_y.append(left_wrist[1])
-        all_right_wrist_y.append(right_wrist[1])
-        all_right_ankle_y.append(right_ankle[1])
-        valid_frames.append(frame_idx)
 
-    # Check if we have enough valid frames
-    if len(valid_frames) < 10:
-        print("WARNING: Too few valid frames detected. Key moment detection may fail.")
-        return key_moments
+def _pose_features(keypoints):
+    """Per-frame serve features computed for all frames at once."""
+    left_shoulder = keypoints[:, LEFT_SHOULDER]
+    right_shoulder = keypoints[:, RIGHT_SHOULDER]
+    right_elbow = keypoints[:, RIGHT_ELBOW]
 
-    # Convert to numpy arrays for easier processing
-    all_left_wrist_y = np.array(all_left_wrist_y)
-    all_right_wrist_y = np.array(all_right_wrist_y)
-    all_right_ankle_y = np.array(all_right_ankle_y)
-    valid_frames = np.array(valid_frames)
+    shoulder_vector = right_shoulder - left_shoulder
+    elbow_vector = right_elbow - right_shoulder
+    shoulder_width = np.sqrt(np.sum(shoulder_vector**2, axis=1))
+    elbow_length = np.sqrt(np.sum(elbow_vector**2, axis=1))
 
-    # Find the minimum y values (highest positions)
-    min_left_wrist_y = np.min(all_left_wrist_y) if len(all_left_wrist_y) > 0 else 0
-    min_right_wrist_y = np.min(all_right_wrist_y) if len(all_right_wrist_y) > 0 else 0
-    min_right_ankle_y = np.min(all_right_ankle_y) if len(all_right_ankle_y) > 0 else 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Positive means the wrist is above its shoulder
+        left_wrist_height = (
+            left_shoulder[:, 1] - keypoints[:, LEFT_WRIST, 1]
+        ) / shoulder_width
+        right_wrist_height = (
+            right_shoulder[:, 1] - keypoints[:, RIGHT_WRIST, 1]
+        ) / shoulder_width
+        cos_angle = np.sum(shoulder_vector * elbow_vector, axis=1) / (
+            shoulder_width * elbow_length
+        )
+        elbow_angle = np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+    return {
+        "shoulder_width": shoulder_width,
+        "left_wrist_height": left_wrist_height,
+        "right_wrist_height": right_wrist_height,
+        "shoulder_angle": np.degrees(
+            np.arctan2(shoulder_vector[:, 1], shoulder_vector[:, 0])
+        ),
+        # Angle between the shoulder line and the upper right arm
+        "elbow_angle": np.where(
+            (shoulder_width > 0) & (elbow_length > 0), elbow_angle, np.nan
+        ),
+    }
 
-    # Find the corresponding frames for these peaks
-    peak_left_wrist_frame = (
-        valid_frames[np.argmin(all_left_wrist_y)] if len(all_left_wrist_y) > 0 else 0
-    )
-    peak_right_wrist_frame = (
-        valid_frames[np.argmin(all_right_wrist_y)] if len(all_right_wrist_y) > 0 else 0
-    )
-    peak_right_ankle_frame = (
-        valid_frames[np.argmin(all_right_ankle_y)] if len(all_right_ankle_y) > 0 else 0
-    )
 
-    print(
-        f"Peak analysis - Left wrist peak at frame {peak_left_wrist_frame}, Right wrist peak at frame {peak_right_wrist_frame}, Right ankle peak at frame {peak_right_ankle_frame}"
-    )
+def _ball_release_frames(keypoints, features, balls):
+    """Frames where the ball just left the left hand.
+
+    The ball must be away from the left wrist in the frame itself but near
+    it (measured against the current wrist) in one of the
+    BALL_RELEASE_WINDOW frames before, with the wrist above the shoulder.
+    """
+    num_frames = len(keypoints)
+    near_now = np.zeros(num_frames, dtype=bool)
+    near_before = np.zeros(num_frames, dtype=bool)
+    left_wrist = keypoints[:, LEFT_WRIST]
+    shoulder_width = features["shoulder_width"]
+
+    for lag in range(BALL_RELEASE_WINDOW + 1):
+        target = balls.frames + lag
+        in_range = target < num_frames
+        target = target[in_range]
+        centers = balls.centers[in_range]
+        dist = np.sqrt(
+            (centers[:, 0] - left_wrist[target, 0]) ** 2
+            + (centers[:, 1] - left_wrist[target, 1]) ** 2
+        )
+        near = target[dist < shoulder_width[target] * 1.0]
+        if lag == 0:
+            near_now[near] = True
+        else:
+            near_before[near] = True
 
-    # Track ball velocities for debugging
-    ball_velocities = []
+    return ~near_now & (features["left_wrist_height"] > 0.2) & near_before
 
-    # Now process frames for key moments
-    i = 0
-    while i < len(keypoints_results):
-        result = keypoints_results[i]
-        frame_idx = i
 
-        # Skip if no predictions
-        if not result or "predictions" not in result or not result["predictions"]:
-            i += 1
-            continue
+def _first(mask, start):
+    """First frame from ``start`` on where ``mask`` holds, or None."""
+    frames = np.flatnonzero(mask[start:])
+    return int(start + frames[0]) if len(frames) else None
 
-        # Get predictions for the first person
-        predictions = result["predictions"][0]
-        if not predictions:
-            i += 1
-            continue
 
-        # Get keypoints of the first person detected
-        person = predictions[0]
-        if "keypoints" not in person:
-            i += 1
-            continue
+def point_position(xy):
+    return {"x": float(xy[0]), "y": float(xy[1])}
 
-        # Convert keypoints to numpy array if it's not already
-        keypoints = (
-            np.array(person["keypoints"])
-            if isinstance(person["keypoints"], list)
-            else person["keypoints"]
-        )
-        scores = person.get("keypoint_scores", None)
 
-        # Skip if confidence is too low
-        if scores is not None and np.mean(scores) < 0.3:  # Reduced confidence threshold
-            i += 1
-            continue
+def racket_position(racket):
+    bbox = racket["bbox"]
+    return {
+        "x": float((bbox[0] + bbox[2]) / 2),
+        "y": float((bbox[1] + bbox[3]) / 2),
+    }
 
-        # Get relevant keypoint coordinates
-        left_wrist = keypoints[LEFT_WRIST][:2]
-        right_wrist = keypoints[RIGHT_WRIST][:2]
-        left_shoulder = keypoints[LEFT_SHOULDER][:2]
-        right_shoulder = keypoints[RIGHT_SHOULDER][:2]
-        right_elbow = keypoints[RIGHT_ELBOW][:2]
-        right_ankle = keypoints[RIGHT_ANKLE][:2]
 
-        # Calculate body measurements for relative scaling
-        shoulder_width = np.linalg.norm(right_shoulder - left_shoulder)
+def _no_log(*args):
+    pass
 
-        # Calculate relative positions
-        left_wrist_height = (
-            get_relative_height(left_wrist, left_shoulder) / shoulder_width
-        )
-        right_wrist_height = (
-            get_relative_height(right_wrist, right_shoulder) / shoulder_width
-        )
 
-        timestamp = frame_idx / fps
-
-        # Start position: Hard-coded to frame 0
-        if frame_idx == 0 and not serve_phases["start"]:
-            serve_phases["start"] = True
-            key_moments.append(
-                {
-                    "frame": int(frame_idx),
-                    "timestamp": float(timestamp),
-                    "label": "Start Position",
-                    "confidence": float(np.mean(scores)) if scores is not None else 1.0,
-                }
-            )
-            i += 1
-            continue
+def detect_key_moments(
+    keypoints_results, ball_detections=None, racket_detections=None, fps=30, verbose=True
+):
+    """Detect key moments of a tennis serve based on pose keypoints, ball and racket detection.
+
+    Poses are packed into per-frame arrays and detections indexed by frame
+    (see FrameIndex), so the features of every frame are computed in bulk.
+    The serve phases (start, ball release, trophy position, racket low
+    point, impact and follow through) are then found in order, each one as
+    the first frame after the previous phase whose features match. Progress
+    is printed unless ``verbose`` is off.
+    """
+    log = print if verbose else _no_log
+    key_moments = []
+    valid, keypoints, confidence = _first_person_arrays(keypoints_results)
+    valid_frames = np.flatnonzero(valid)
 
-        # Ball Release: When the ball leaves the left hand (needs ball detection data)
-        elif (
-            serve_phases["start"]
-            and not serve_phases["ball_release"]
-            and ball_detections
-        ):
-            # Find balls near the left wrist
-            balls_near_left_wrist = []
-            for ball in ball_detections:
-                if ball["frame"] == frame_idx:
-                    ball_x = (ball["bbox"][0] + ball["bbox"][2]) / 2
-                    ball_y = (ball["bbox"][1] + ball["bbox"][3]) / 2
-                    dist_to_left_wrist = np.sqrt(
-                        (ball_x - left_wrist[0]) ** 2 + (ball_y - left_wrist[1]) ** 2
-                    )
-                    if dist_to_left_wrist < shoulder_width * 1.0:
-                        balls_near_left_wrist.append(ball)
-
-            # If we previously had balls near the left wrist and now we don't
-            if len(balls_near_left_wrist) == 0 and left_wrist_height > 0.2:
-                # Check if previous frames had balls near left wrist
-                prev_balls_near_left_wrist = []
-                for ball in ball_detections:
-                    if frame_idx - 5 <= ball["frame"] < frame_idx:
-                        ball_x = (ball["bbox"][0] + ball["bbox"][2]) / 2
-                        ball_y = (ball["bbox"][1] + ball["bbox"][3]) / 2
-                        dist_to_left_wrist_prev = np.sqrt(
-                            (ball_x - left_wrist[0]) ** 2
-                            + (ball_y - left_wrist[1]) ** 2
-                        )
-                        if dist_to_left_wrist_prev < shoulder_width * 1.0:
-                            prev_balls_near_left_wrist.append(ball)
-
-                if len(prev_balls_near_left_wrist) > 0:
-                    serve_phases["ball_release"] = True
-                    key_moments.append(
-                        {
-                            "frame": int(frame_idx),
-                            "timestamp": float(timestamp),
-                            "label": "Ball Release",
-                            "confidence": (
-                                float(np.mean(scores)) if scores is not None else 1.0
-                            ),
-                        }
-                    )
-                    print(
-                        f"Detected Ball Release at frame {frame_idx}, timestamp {timestamp:.2f}"
-                    )
-            i += 1
-            continue
+    # Check if we have enough valid frames
+    if len(valid_frames) < 10:
+        log("WARNING: Too few valid frames detected. Key moment detection may fail.")
+        return key_moments
 
-        # Trophy Position: When the racket is above the right shoulder and the shoulder angle is above 30 degrees
-        elif serve_phases["ball_release"] and not serve_phases["trophy"]:
-            # Calculate shoulder angle
-            shoulder_vector = right_shoulder - left_shoulder
-            shoulder_angle = np.arctan2(shoulder_vector[1], shoulder_vector[0])
-            shoulder_angle_deg = np.degrees(shoulder_angle)
-
-            # Define threshold angle (adjust based on testing)
-            SHOULDER_ANGLE_THRESHOLD = 30  # degrees
-
-            rackets_in_frame = [r for r in racket_detections if r["frame"] == frame_idx]
-            if rackets_in_frame and abs(shoulder_angle_deg) > SHOULDER_ANGLE_THRESHOLD:
-                # Find racket above right shoulder
-                detected_racket = None
-                for racket in rackets_in_frame:
-                    racket_y = (racket["bbox"][1] + racket["bbox"][3]) / 2
-                    racket_x = (racket["bbox"][0] + racket["bbox"][2]) / 2
-
-                    # Check if racket is above right shoulder (lower y value means higher position)
-                    if racket_y < right_shoulder[1]:
-                        detected_racket = racket
-                        break
+    # Find the frames of the highest positions (lowest y values)
+    peak_left_wrist_frame = valid_frames[np.argmin(keypoints[valid_frames, LEFT_WRIST, 1])]
+    peak_right_wrist_frame = valid_frames[np.argmin(keypoints[valid_frames, RIGHT_WRIST, 1])]
+    peak_right_ankle_frame = valid_frames[np.argmin(keypoints[valid_frames, RIGHT_ANKLE, 1])]
+    log(
+        f"Peak analysis - Left wrist peak at frame {peak_left_wrist_frame}, Right wrist peak at frame {peak_right_wrist_frame}, Right ankle peak at frame {peak_right_ankle_frame}"
+    )
 
-                if detected_racket:
-                    serve_phases["trophy"] = True
-                    key_moments.append(
-                        {
-                            "frame": int(frame_idx),
-                            "timestamp": float(timestamp),
-                            "label": "Trophy Position",
-                            "confidence": float(detected_racket["confidence"]),
-                            "shoulder_angle": float(shoulder_angle_deg),
-                            "racket_position": {
-                                "x": float(
-                                    (
-                                        detected_racket["bbox"][0]
-                                        + detected_racket["bbox"][2]
-                                    )
-                                    / 2
-                                ),
-                                "y": float(
-                                    (
-                                        detected_racket["bbox"][1]
-                                        + detected_racket["bbox"][3]
-                                    )
-                                    / 2
-                                ),
-                            },
-                            "right_shoulder_position": {
-                                "x": float(right_shoulder[0]),
-                                "y": float(right_shoulder[1]),
-                            },
-                        }
-                    )
-                    print(
-                        f"Detected Trophy Position at frame {frame_idx}, timestamp {timestamp:.2f} (shoulder angle: {shoulder_angle_deg:.1f}°)"
-                    )
-            i += 1
-            continue
+    num_frames = len(keypoints_results)
+    features = _pose_features(keypoints)
+    balls = FrameIndex(ball_detections, num_frames)
+    rackets = FrameIndex(racket_detections, num_frames)
+    left_shoulder = keypoints[:, LEFT_SHOULDER]
+    right_shoulder = keypoints[:, RIGHT_SHOULDER]
+    right_wrist = keypoints[:, RIGHT_WRIST]
+    right_elbow = keypoints[:, RIGHT_ELBOW]
+
+    # Start position: Hard-coded to frame 0, every later phase follows it
+    if not valid[0]:
+        return _sorted_moments(key_moments)
+    key_moments.append(
+        {
+            "frame": 0,
+            "timestamp": 0.0,
+            "label": "Start Position",
+            "confidence": float(confidence[0]),
+        }
+    )
+    if not ball_detections:
+        return _sorted_moments(key_moments)
+
+    # Ball Release: When the ball leaves the left hand
+    release_frame = _first(valid & _ball_release_frames(keypoints, features, balls), 1)
+    if release_frame is None:
+        return _sorted_moments(key_moments)
+    timestamp = release_frame / fps
+    key_moments.append(
+        {
+            "frame": release_frame,
+            "timestamp": float(timestamp),
+            "label": "Ball Release",
+            "confidence": float(confidence[release_frame]),
+        }
+    )
+    log(f"Detected Ball Release at frame {release_frame}, timestamp {timestamp:.2f}")
 
-        # Racket Low Point: After trophy position, when racket is closest to right hand and at highest position
-        elif (
-            serve_phases["trophy"]
-            and not serve_phases["racket_low"]
-            and racket_detections
-        ):
-            rackets_in_frame = [r for r in racket_detections if r["frame"] == frame_idx]
-            if rackets_in_frame:
-                # Method 1: Find racket closest to right hand
-                min_dist = float("inf")
-                closest_racket = None
-                for racket in rackets_in_frame:
-                    racket_x = (racket["bbox"][0] + racket["bbox"][2]) / 2
-                    racket_y = (racket["bbox"][1] + racket["bbox"][3]) / 2
-                    dist_x = abs(racket_x - right_wrist[0])
-                    dist_y = racket_y - right_wrist[1]
-                    # Racket should be below right hand but close horizontally
-                    if dist_y > 0 and dist_x < shoulder_width * 0.5:
-                        if dist_x < min_dist:
-                            min_dist = dist_x
-                            closest_racket = racket
-
-                # Method 2: Find racket at highest position
-                max_height = float("-inf")
-                highest_racket = None
-                for racket in rackets_in_frame:
-                    racket_y = (racket["bbox"][1] + racket["bbox"][3]) / 2
-                    if racket_y < max_height:
-                        max_height = racket_y
-                        highest_racket = racket
-
-                # Use either method that detects a racket
-                detected_racket = None
-                if closest_racket:
-                    detected_racket = closest_racket
-                    print(
-                        f"Detected Racket Low Point using closest racket method at frame {frame_idx}"
-                    )
-                elif highest_racket:
-                    detected_racket = highest_racket
-                    print(
-                        f"Detected Racket Low Point using highest position method at frame {frame_idx}"
-                    )
-
-                if detected_racket:
-                    serve_phases["racket_low"] = True
-                    key_moments.append(
-                        {
-                            "frame": int(frame_idx),
-                            "timestamp": float(timestamp),
-                            "label": "Racket Low Point",
-                            "confidence": float(detected_racket["confidence"]),
-                            "detection_method": (
-                                "closest"
-                                if detected_racket == closest_racket
-                                else "highest"
-                            ),
-                            "racket_position": {
-                                "x": float(
-                                    (
-                                        detected_racket["bbox"][0]
-                                        + detected_racket["bbox"][2]
-                                    )
-                                    / 2
-                                ),
-                                "y": float(
-                                    (
-                                        detected_racket["bbox"][1]
-                                        + detected_racket["bbox"][3]
-                                    )
-                                    / 2
-                                ),
-                            },
-                            "right_hand_position": {
-                                "x": float(right_wrist[0]),
-                                "y": float(right_wrist[1]),
-                            },
-                        }
-                    )
-                    print(
-                        f"Detected Racket Low Point at frame {frame_idx}, timestamp {timestamp:.2f}"
-                    )
-            i += 1
-            continue
+    # Trophy Position: When a racket is above the right shoulder and the
+    # shoulder angle is above SHOULDER_ANGLE_THRESHOLD
+    racket_above_shoulder = rackets.first_per_frame(
+        rackets.centers[:, 1] < right_shoulder[rackets.frames, 1]
+    )
+    trophy_frame = _first(
+        valid
+        & (np.abs(features["shoulder_angle"]) > SHOULDER_ANGLE_THRESHOLD)
+        & (racket_above_shoulder >= 0),
+        release_frame + 1,
+    )
+    if trophy_frame is None:
+        return _sorted_moments(key_moments)
+    racket = rackets.detection(racket_above_shoulder[trophy_frame])
+    shoulder_angle_deg = features["shoulder_angle"][trophy_frame]
+    timestamp = trophy_frame / fps
+    key_moments.append(
+        {
+            "frame": trophy_frame,
+            "timestamp": float(timestamp),
+            "label": "Trophy Position",
+            "confidence": float(racket["confidence"]),
+            "shoulder_angle": float(shoulder_angle_deg),
+            "racket_position": racket_position(racket),
+            "right_shoulder_position": point_position(right_shoulder[trophy_frame]),
+        }
+    )
+    log(
+        f"Detected Trophy Position at frame {trophy_frame}, timestamp {timestamp:.2f} (shoulder angle: {shoulder_angle_deg:.1f}°)"
+    )
 
-        # Ball Impact: Detect when racket is at its highest position
-        elif (
-            serve_phases["racket_low"]
-            and not serve_phases["impact"]
-            and racket_detections
-        ):
-            # Find the global highest racket position across all frames
-            highest_racket_info = None
-            highest_racket_y = float("inf")
-            highest_racket_frame = None
-
-            # Examine all racket detections
-            for racket in racket_detections:
-                # Calculate the midpoint of the racket bounding box
-                racket_y = (racket["bbox"][1] + racket["bbox"][3]) / 2
-                racket_x = (racket["bbox"][0] + racket["bbox"][2]) / 2
-
-                # Only consider rackets that are close to the right wrist
-                if racket_y < highest_racket_y:
-                    highest_racket_y = racket_y
-                    highest_racket_info = racket
-                    highest_racket_frame = racket["frame"]
-
-            # If we found the highest racket, mark it as the impact moment
-            if highest_racket_info:
-                # Update frame and timestamp to the peak
-                impact_frame = highest_racket_frame
-                impact_timestamp = impact_frame / fps
-
-                # Calculate racket position
-                racket_x = (
-                    highest_racket_info["bbox"][0] + highest_racket_info["bbox"][2]
-                ) / 2
-
-                serve_phases["impact"] = True
-                key_moments.append(
-                    {
-                        "frame": int(impact_frame),
-                        "timestamp": float(impact_timestamp),
-                        "label": "Ball Impact",
-                        "confidence": float(highest_racket_info["confidence"]),
-                        "racket_position": {
-                            "x": float(racket_x),
-                            "y": float(highest_racket_y),
-                        },
-                        "right_hand_position": {
-                            "x": float(right_wrist[0]),
-                            "y": float(right_wrist[1]),
-                        },
-                    }
-                )
-                print(
-                    f"Detected Ball Impact at frame {impact_frame}, timestamp {impact_timestamp:.2f} (global highest racket)"
-                )
+    # Racket Low Point: After trophy position, the racket below the right
+    # hand that is horizontally closest to it
+    offset_x = np.abs(rackets.centers[:, 0] - right_wrist[rackets.frames, 0])
+    offset_y = rackets.centers[:, 1] - right_wrist[rackets.frames, 1]
+    closest_racket = rackets.first_per_frame(
+        (offset_y > 0)
+        & (offset_x < features["shoulder_width"][rackets.frames] * 0.5),
+        key=offset_x,
+    )
+    low_frame = _first(valid & (closest_racket >= 0), trophy_frame + 1)
+    if low_frame is None:
+        return _sorted_moments(key_moments)
+    racket = rackets.detection(closest_racket[low_frame])
+    timestamp = low_frame / fps
+    log(f"Detected Racket Low Point using closest racket method at frame {low_frame}")
+    key_moments.append(
+        {
+            "frame": low_frame,
+            "timestamp": float(timestamp),
+            "label": "Racket Low Point",
+            "confidence": float(racket["confidence"]),
+            "detection_method": "closest",
+            "racket_position": racket_position(racket),
+            "right_hand_position": point_position(right_wrist[low_frame]),
+        }
+    )
+    log(f"Detected Racket Low Point at frame {low_frame}, timestamp {timestamp:.2f}")
+
+    # Ball Impact: The highest racket position across all frames, reported
+    # with the right hand of the next pose after the racket low point
+    hand_frame = _first(valid, low_frame + 1)
+    if hand_frame is None:
+        return _sorted_moments(key_moments)
+    racket_y = np.array(
+        [(r["bbox"][1] + r["bbox"][3]) / 2 for r in racket_detections]
+    )
+    racket = racket_detections[int(np.argmin(racket_y))]
+    impact_frame = racket["frame"]
+    impact_timestamp = impact_frame / fps
+    key_moments.append(
+        {
+            "frame": int(impact_frame),
+            "timestamp": float(impact_timestamp),
+            "label": "Ball Impact",
+            "confidence": float(racket["confidence"]),
+            "racket_position": racket_position(racket),
+            "right_hand_position": point_position(right_wrist[hand_frame]),
+        }
+    )
+    log(
+        f"Detected Ball Impact at frame {impact_frame}, timestamp {impact_timestamp:.2f} (global highest racket)"
+    )
 
-                # Skip ahead to the impact frame
-                i = impact_frame
-                continue
+    # Follow Through: From the impact on, when the angle between the
+    # shoulders and the right upper arm exceeds FOLLOW_THROUGH_ANGLE_THRESHOLD
+    follow_frame = _first(
+        valid & (features["elbow_angle"] > FOLLOW_THROUGH_ANGLE_THRESHOLD),
+        int(impact_frame),
+    )
+    if follow_frame is None:
+        return _sorted_moments(key_moments)
+    angle_deg = features["elbow_angle"][follow_frame]
+    timestamp = follow_frame / fps
+    key_moments.append(
+        {
+            "frame": follow_frame,
+            "timestamp": float(timestamp),
+            "label": "Follow Through",
+            "confidence": float(confidence[follow_frame]),
+            "shoulder_elbow_angle": float(angle_deg),
+            "right_elbow_position": point_position(right_elbow[follow_frame]),
+            "right_shoulder_position": point_position(right_shoulder[follow_frame]),
+            "left_shoulder_position": point_position(left_shoulder[follow_frame]),
+        }
+    )
+    log(
+        f"Detected Follow Through at frame {follow_frame}, timestamp {timestamp:.2f} (angle: {angle_deg:.1f}°)"
+    )
 
-        # Follow Through: When the angle between shoulders and right elbow is less than 160 degrees
-        elif serve_phases["impact"] and not serve_phases["follow_through"]:
-            # Calculate vectors for angle calculation
-            shoulder_vector = right_shoulder - left_shoulder
-            elbow_vector = right_elbow - right_shoulder
-
-            # Calculate angle between vectors using dot product
-            dot_product = np.dot(shoulder_vector, elbow_vector)
-            shoulder_magnitude = np.linalg.norm(shoulder_vector)
-            elbow_magnitude = np.linalg.norm(elbow_vector)
-
-            # Avoid division by zero
-            if shoulder_magnitude > 0 and elbow_magnitude > 0:
-                cos_angle = dot_product / (shoulder_magnitude * elbow_magnitude)
-                # Clamp cos_angle to valid range [-1, 1] to avoid numerical errors
-                cos_angle = np.clip(cos_angle, -1.0, 1.0)
-                angle_deg = np.degrees(np.arccos(cos_angle))
-
-                # Define threshold angle (160 degrees)
-                FOLLOW_THROUGH_ANGLE_THRESHOLD = 30
-
-                if angle_deg > FOLLOW_THROUGH_ANGLE_THRESHOLD:
-                    serve_phases["follow_through"] = True
-                    key_moments.append(
-                        {
-                            "frame": int(frame_idx),
-                            "timestamp": float(timestamp),
-                            "label": "Follow Through",
-                            "confidence": (
-                                float(np.mean(scores)) if scores is not None else 1.0
-                            ),
-                            "shoulder_elbow_angle": float(angle_deg),
-                            "right_elbow_position": {
-                                "x": float(right_elbow[0]),
-                                "y": float(right_elbow[1]),
-                            },
-                            "right_shoulder_position": {
-                                "x": float(right_shoulder[0]),
-                                "y": float(right_shoulder[1]),
-                            },
-                            "left_shoulder_position": {
-                                "x": float(left_shoulder[0]),
-                                "y": float(left_shoulder[1]),
-                            },
-                        }
-                    )
-                    print(
-                        f"Detected Follow Through at frame {frame_idx}, timestamp {timestamp:.2f} (angle: {angle_deg:.1f}°)"
-                    )
-            i += 1
-            continue
+    return _sorted_moments(key_moments)
 
-        i += 1
 
-    # Sort key moments by frame index
+def _sorted_moments(key_moments):
+    """Sort key moments by frame index."""
     key_moments.sort(key=lambda x: x["frame"])
+    return key_moments
 
-    # Print ball velocities for debugging
-    print("\nBall Velocities:")
-    for vel in ball_velocities:
-        print(f"Frame {vel['frame']} ({vel['timestamp']:.2f}s):")
-        print(f"  Velocity: {vel['velocity']}")
-        print(f"  Magnitude: {vel['magnitude']:.2f} pixels/second")
 
-    return key_moments
+class OnlineKeyMomentDetector:
+    """Serve phase detector fed one analyzed frame at a time.
+
+    Moments are returned by ``update`` as soon as they are confirmed, looking
+    back over a bounded window of recent frames rather than the whole-video
+    passes of detect_key_moments. The impact is the highest racket since the
+    racket low point, confirmed once the racket has not gone higher for
+    IMPACT_CONFIRM_SECONDS. Serves are only followed once the serve
+    segmenter has opened one, so a player standing around between serves
+    does not start any; the start position is then the last frame before
+    with both wrists below the shoulders. Moments carry the segmenter's
+    ``serve`` number. They are provisional: the final ones come from
+    detect_key_moments once the whole video is analyzed.
+    """
+
+    def __init__(self, fps=30):
+        self.fps = fps
+        self.confirm_frames = max(1, int(round(IMPACT_CONFIRM_SECONDS * fps)))
+        self.timeout_frames = int(round(ONLINE_SERVE_TIMEOUT_SECONDS * fps))
+        self.window = deque(maxlen=self.confirm_frames + BALL_RELEASE_WINDOW + 1)
+        self.serve = None
+        self.serving = False
+        self.start_frame = None
+        self._start_serve()
+        self.phase = "rest"
+
+    def _start_serve(self):
+        self.phase = "start"
+        self.serve_start = None
+        self.peak_racket = None
+        self.peak_frame = None
+        self.hand_frame = None
+
+    def update(self, frame_idx, pose_result, balls, rackets, serve):
+        """Feed the next frame; returns the moments it confirmed.
+
+        ``serve`` is the number of the serve the segmenter has open at this
+        frame, or None between serves.
+        """
+        valid, keypoints, confidence = _first_person_arrays([pose_result])
+        features = {name: value[0] for name, value in _pose_features(keypoints).items()}
+        frame = {
+            "frame": frame_idx,
+            "valid": bool(valid[0]),
+            "keypoints": keypoints[0],
+            "confidence": float(confidence[0]),
+            "features": features,
+            "balls": FrameIndex(balls, frame_idx + 1).centers,
+            "rackets": rackets,
+        }
+        self.window.append(frame)
+        moments = []
+        if serve is not None and not self.serving:
+            # The segmenter opened a serve, dropping any unfinished one
+            self.serve = serve
+            self._start_serve()
+        self.serving = serve is not None
+        self._step(frame, moments)
+        return moments
+
+    def finish(self):
+        """Confirm what the end of the video settles; returns those moments."""
+        moments = []
+        if self.phase == "impact" and self.peak_racket is not None and self.hand_frame is not None:
+            self._confirm_impact(moments)
+        return moments
+
+    def _emit(self, moments, moment):
+        moment["serve"] = self.serve
+        moments.append(moment)
+
+    def _step(self, frame, moments):
+        frame_idx = frame["frame"]
+        if self.phase not in ("start", "rest") and (
+            frame_idx - self.serve_start > self.timeout_frames
+        ):
+            # Abandon a serve that stalled and wait for the next one
+            self.phase = "rest"
+
+        if self.phase == "impact":
+            self._track_racket_peak(frame, moments)
+            return
+        if not frame["valid"]:
+            return
+
+        keypoints = frame["keypoints"]
+        features = frame["features"]
+        if max(features["left_wrist_height"], features["right_wrist_height"]) <= 0:
+            self.start_frame = frame
+        if self.phase == "rest":
+            return
+
+        if self.phase == "start":
+            start = self.start_frame or frame
+            self.start_frame = None
+            self.serve_start = frame_idx
+            self.phase = "ball_release"
+            self._emit(
+                moments,
+                {
+                    "frame": int(start["frame"]),
+                    "timestamp": float(start["frame"] / self.fps),
+                    "label": "Start Position",
+                    "confidence": start["confidence"],
+                },
+            )
+        elif self.phase == "ball_release":
+            if self._ball_released(frame):
+                self.phase = "trophy"
+                self._emit(
+                    moments,
+                    {
+                        "frame": int(frame_idx),
+                        "timestamp": float(frame_idx / self.fps),
+                        "label": "Ball Release",
+                        "confidence": frame["confidence"],
+                    },
+                )
+        elif self.phase == "trophy":
+            if abs(features["shoulder_angle"]) > SHOULDER_ANGLE_THRESHOLD:
+                right_shoulder = keypoints[RIGHT_SHOULDER]
+                for racket in frame["rackets"]:
+                    if racket_position(racket)["y"] < right_shoulder[1]:
+                        self.phase = "racket_low"
+                        self._emit(
+                            moments,
+                            {
+                                "frame": int(frame_idx),
+                                "timestamp": float(frame_idx / self.fps),
+                                "label": "Trophy Position",
+                                "confidence": float(racket["confidence"]),
+                                "shoulder_angle": float(features["shoulder_angle"]),
+                                "racket_position": racket_position(racket),
+                                "right_shoulder_position": point_position(right_shoulder),
+                            },
+                        )
+                        break
+        elif self.phase == "racket_low":
+            right_wrist = keypoints[RIGHT_WRIST]
+            closest = None
+            min_dist = float("inf")
+            for racket in frame["rackets"]:
+                center = racket_position(racket)
+                dist_x = abs(center["x"] - right_wrist[0])
+                if (
+                    center["y"] - right_wrist[1] > 0
+                    and dist_x < features["shoulder_width"] * 0.5
+                    and dist_x < min_dist
+                ):
+                    min_dist = dist_x
+                    closest = racket
+            if closest is not None:
+                self.phase = "impact"
+                self._emit(
+                    moments,
+                    {
+                        "frame": int(frame_idx),
+                        "timestamp": float(frame_idx / self.fps),
+                        "label": "Racket Low Point",
+                        "confidence": float(closest["confidence"]),
+                        "detection_method": "closest",
+                        "racket_position": racket_position(closest),
+                        "right_hand_position": point_position(right_wrist),
+                    },
+                )
+        elif self.phase == "follow_through":
+            self._check_follow_through(frame, moments)
+
+    def _ball_released(self, frame):
+        """The ball left the left hand, as in detect_key_moments."""
+        features = frame["features"]
+        left_wrist = frame["keypoints"][LEFT_WRIST]
+        limit = features["shoulder_width"] * 1.0
+
+        def near(centers):
+            dist = np.sqrt(
+                (centers[:, 0] - left_wrist[0]) ** 2 + (centers[:, 1] - left_wrist[1]) ** 2
+            )
+            return bool(np.any(dist < limit))
+
+        if near(frame["balls"]) or not features["left_wrist_height"] > 0.2:
+            return False
+        return any(
+            near(previous["balls"])
+            for previous in self.window
+            if frame["frame"] - BALL_RELEASE_WINDOW <= previous["frame"] < frame["frame"]
+        )
 
+    def _track_racket_peak(self, frame, moments):
+        for racket in frame["rackets"]:
+            if self.peak_racket is None or (
+                racket_position(racket)["y"] < racket_position(self.peak_racket)["y"]
+            ):
+                self.peak_racket = racket
+                self.peak_frame = frame["frame"]
+        if self.hand_frame is None and frame["valid"]:
+            self.hand_frame = frame
+        if (
+            self.peak_racket is not None
+            and self.hand_frame is not None
+            and frame["frame"] - self.peak_frame >= self.confirm_frames
+        ):
+            self._confirm_impact(moments)
+
+    def _confirm_impact(self, moments):
+        self.phase = "follow_through"
+        self._emit(
+            moments,
+            {
+                "frame": int(self.peak_frame),
+                "timestamp": float(self.peak_frame / self.fps),
+                "label": "Ball Impact",
+                "confidence": float(self.peak_racket["confidence"]),
+                "racket_position": racket_position(self.peak_racket),
+                "right_hand_position": point_position(
+                    self.hand_frame["keypoints"][RIGHT_WRIST]
+                ),
+            },
+        )
+        # The follow through may already be among the frames since the impact
+        for frame in self.window:
+            if frame["frame"] >= self.peak_frame and frame["valid"]:
+                if self._check_follow_through(frame, moments):
+                    break
+
+    def _check_follow_through(self, frame, moments):
+        angle_deg = frame["features"]["elbow_angle"]
+        if not angle_deg > FOLLOW_THROUGH_ANGLE_THRESHOLD:
+            return False
+        keypoints = frame["keypoints"]
+        self.phase = "rest"
+        self._emit(
+            moments,
+            {
+                "frame": int(frame["frame"]),
+                "timestamp": float(frame["frame"] / self.fps),
+                "label": "Follow Through",
+                "confidence": frame["confidence"],
+                "shoulder_elbow_angle": float(angle_deg),
+                "right_elbow_position": point_position(keypoints[RIGHT_ELBOW]),
+                "right_shoulder_position": point_position(keypoints[RIGHT_SHOULDER]),
+                "left_shoulder_position": point_position(keypoints[LEFT_SHOULDER]),
+            },
+        )
+        return True
 
 # def detect_ball_impact(ball_detections, frame_idx, key_moments, scores, fps):
 #     current_balls = [b for b in ball_detections if b["frame"] == frame_idx]
@@ -0,0 +1,380 @@
+import json
+import math
+import os
+import uuid
+
+import numpy as np
+
+import config
+from key_moment_detector import (
+    LEFT_ANKLE,
+    LEFT_ELBOW,
+    LEFT_HIP,
+    LEFT_KNEE,
+    LEFT_SHOULDER,
+    LEFT_WRIST,
+    MIN_POSE_SCORE,
+    RIGHT_ANKLE,
+    RIGHT_ELBOW,
+    RIGHT_HIP,
+    RIGHT_KNEE,
+    RIGHT_SHOULDER,
+    RIGHT_WRIST,
+)
+from pose_store import PoseStore
+
+# COCO keypoints of the "human" model, in order
+KEYPOINT_NAMES = (
+    "nose",
+    "left_eye",
+    "right_eye",
+    "left_ear",
+    "right_ear",
+    "left_shoulder",
+    "right_shoulder",
+    "left_elbow",
+    "right_elbow",
+    "left_wrist",
+    "right_wrist",
+    "left_hip",
+    "right_hip",
+    "left_knee",
+    "right_knee",
+    "left_ankle",
+    "right_ankle",
+)
+
+# Joint angles as (name, a, b, c): the angle at b between the limbs to a and c
+JOINT_ANGLES = (
+    ("left_elbow", LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+    ("right_elbow", RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+    ("left_shoulder", LEFT_HIP, LEFT_SHOULDER, LEFT_ELBOW),
+    ("right_shoulder", RIGHT_HIP, RIGHT_SHOULDER, RIGHT_ELBOW),
+    ("left_hip", LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+    ("right_hip", RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+    ("left_knee", LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+    ("right_knee", RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+)
+ANGLE_NAMES = tuple(name for name, *_ in JOINT_ANGLES)
+
+# Gaps of up to this long in a joint's track are interpolated; longer ones
+# stay missing
+MAX_GAP_SECONDS = 0.25
+# Savitzky-Golay window and polynomial order
+SAVGOL_WINDOW_SECONDS = 0.2
+SAVGOL_ORDER = 2
+# One-euro filter cutoffs in Hz; BETA is per torso length per second
+ONE_EURO_MIN_CUTOFF = 1.0
+ONE_EURO_BETA = 0.5
+ONE_EURO_D_CUTOFF = 1.0
+
+# Time series of single joints and angles, as ``<quantity>.<name>``, with
+# the array, component and units of each quantity
+SERIES_QUANTITIES = {
+    "speed": ("speed", None, "torso lengths/s"),
+    "velocity_x": ("velocity", 0, "torso lengths/s"),
+    "velocity_y": ("velocity", 1, "torso lengths/s"),
+    "acceleration_x": ("acceleration", 0, "torso lengths/s^2"),
+    "acceleration_y": ("acceleration", 1, "torso lengths/s^2"),
+    "position_x": ("positions", 0, "pixels"),
+    "position_y": ("positions", 1, "pixels"),
+    "angles": ("angles", None, "degrees"),
+    "angular_velocity": ("angular_velocity", None, "degrees/s"),
+}
+DEFAULT_SERIES = ("speed.right_wrist", "speed.left_wrist") + tuple(
+    f"angles.{name}" for name in ANGLE_NAMES
+)
+
+# Arrays saved with a pose store, each as ``kinematics_<name>.npy``
+ARRAY_NAMES = (
+    "observed",
+    "positions",
+    "velocity",
+    "acceleration",
+    "speed",
+    "angles",
+    "angular_velocity",
+)
+META_FILE = "kinematics.json"
+
+
+def interpolate_gaps(values, max_gap):
+    """Fill runs of at most ``max_gap`` NaN frames along the first axis by
+    linear interpolation, for every other index at once.
+
+    Longer runs and runs at either end are left NaN, so frames keep their
+    place in time.
+    """
+    values = np.array(values, dtype=np.float64)
+    flat = values.reshape(len(values), int(np.prod(values.shape[1:])))
+    num_frames = len(flat)
+    valid = np.isfinite(flat)
+    frames = np.arange(num_frames)[:, None]
+    previous = np.maximum.accumulate(np.where(valid, frames, -1), axis=0)
+    following = np.minimum.accumulate(np.where(valid, frames, num_frames)[::-1], axis=0)[::-1]
+    fill = (
+        ~valid
+        & (previous >= 0)
+        & (following < num_frames)
+        & (following - previous - 1 <= max_gap)
+    )
+    rows, columns = np.nonzero(fill)
+    before = previous[rows, columns]
+    after = following[rows, columns]
+    weight = (rows - before) / (after - before)
+    flat[rows, columns] = (
+        flat[before, columns] * (1 - weight) + flat[after, columns] * weight
+    )
+    return values
+
+
+def _hold(flat):
+    """Copy of ``flat`` with NaN replaced by the nearest earlier (or else
+    later) finite value of the same column, and 0 in empty columns."""
+    valid = np.isfinite(flat)
+    num_frames = len(flat)
+    frames = np.arange(num_frames)[:, None]
+    previous = np.maximum.accumulate(np.where(valid, frames, -1), axis=0)
+    following = np.minimum.accumulate(np.where(valid, frames, num_frames)[::-1], axis=0)[::-1]
+    source = np.where(previous >= 0, previous, following)
+    columns = np.broadcast_to(np.arange(flat.shape[1]), flat.shape)
+    held = flat[np.minimum(source, num_frames - 1), columns]
+    return np.where(source < num_frames, held, 0.0)
+
+
+def _savgol_weights(window, order, deriv, positions, delta):
+    """Weights of the ``window`` samples giving the ``deriv``-th derivative
+    at ``positions`` (offsets from the window centre) of the least-squares
+    polynomial of ``order`` through them."""
+    half = window // 2
+    offsets = np.arange(-half, half + 1, dtype=np.float64)
+    powers = np.arange(order + 1)
+    fit = np.linalg.pinv(offsets[:, None] ** powers)
+    factors = np.array(
+        [math.factorial(k) / math.factorial(k - deriv) if k >= deriv else 0.0 for k in powers]
+    )
+    basis = factors * np.asarray(positions, np.float64)[:, None] ** np.maximum(powers - deriv, 0)
+    return basis @ fit / delta**deriv
+
+
+def savgol_filter(values, window, order, deriv=0, delta=1.0):
+    """Savitzky-Golay smoothing (or derivative) along the first axis.
+
+    Every other index is filtered at once; the first and last half window
+    are evaluated on the polynomial fitted to the first and last window.
+    NaN samples are held at their neighbours' value while filtering and
+    stay NaN in the result.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.reshape(len(values), int(np.prod(values.shape[1:])))
+    num_frames = len(flat)
+    window = min(window, num_frames - (num_frames + 1) % 2)
+    if window <= order:
+        result = flat if deriv == 0 else np.full_like(flat, np.nan)
+        return result.reshape(values.shape)
+
+    missing = ~np.isfinite(flat)
+    filled = _hold(flat) if missing.any() else flat
+    half = window // 2
+    result = np.empty_like(filled)
+    windows = np.lib.stride_tricks.sliding_window_view(filled, window, axis=0)
+    result[half : num_frames - half] = windows @ _savgol_weights(window, order, deriv, [0], delta)[0]
+    if half:
+        head = _savgol_weights(window, order, deriv, np.arange(-half, 0), delta)
+        tail = _savgol_weights(window, order, deriv, np.arange(1, half + 1), delta)
+        result[:half] = head @ filled[:window]
+        result[num_frames - half :] = tail @ filled[num_frames - window :]
+    result[missing] = np.nan
+    return result.reshape(values.shape)
+
+
+def _smoothing_factor(cutoff, fps):
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau * fps)
+
+
+def one_euro_filter(
+    values,
+    fps,
+    min_cutoff=ONE_EURO_MIN_CUTOFF,
+    beta=ONE_EURO_BETA,
+    d_cutoff=ONE_EURO_D_CUTOFF,
+):
+    """One-euro filter along the first axis, every other index at once.
+
+    Slow movements are smoothed with a low cutoff and fast ones followed
+    closely, as the cutoff rises with the filtered speed. The filter
+    restarts after a NaN frame, which stays NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.reshape(len(values), int(np.prod(values.shape[1:])))
+    result = np.full_like(flat, np.nan)
+    if not len(flat):
+        return result.reshape(values.shape)
+    previous = np.full(flat.shape[1], np.nan)
+    previous_speed = np.zeros(flat.shape[1])
+    speed_factor = _smoothing_factor(d_cutoff, fps)
+    for i, current in enumerate(flat):
+        observed = np.isfinite(current)
+        restart = observed & ~np.isfinite(previous)
+        speed = np.where(
+            restart, 0.0, speed_factor * (current - previous) * fps + (1 - speed_factor) * previous_speed
+        )
+        factor = _smoothing_factor(min_cutoff + beta * np.abs(speed), fps)
+        filtered = np.where(restart, current, factor * current + (1 - factor) * previous)
+        previous = np.where(observed, filtered, np.nan)
+        previous_speed = np.where(observed, speed, 0.0)
+        result[i] = previous
+    return result.reshape(values.shape)
+
+
+def _smooth(values, fps, smoothing):
+    """``(smoothed, first derivative, second derivative)`` along the first axis."""
+    if smoothing == "savgol":
+        window = max(SAVGOL_ORDER + 1, int(round(SAVGOL_WINDOW_SECONDS * fps)) | 1)
+        return tuple(
+            savgol_filter(values, window, SAVGOL_ORDER, deriv, 1.0 / fps) for deriv in range(3)
+        )
+    if smoothing == "one_euro":
+        smoothed = one_euro_filter(values, fps)
+        if len(smoothed) < 2:
+            return smoothed, np.full_like(smoothed, np.nan), np.full_like(smoothed, np.nan)
+        first = np.gradient(smoothed, 1.0 / fps, axis=0)
+        return smoothed, first, np.gradient(first, 1.0 / fps, axis=0)
+    raise ValueError(f"Unknown smoothing {smoothing!r}, expected savgol or one_euro")
+
+
+def body_scale(points):
+    """Median torso length (mid-shoulder to mid-hip) over a track, or 1.0
+    when the torso is never seen."""
+    hips = (points[:, LEFT_HIP] + points[:, RIGHT_HIP]) / 2
+    shoulders = (points[:, LEFT_SHOULDER] + points[:, RIGHT_SHOULDER]) / 2
+    torso = np.linalg.norm(shoulders - hips, axis=-1)
+    torso = torso[np.isfinite(torso) & (torso > 0)]
+    return float(np.median(torso)) if len(torso) else 1.0
+
+
+def joint_angles(points):
+    """``(frames, len(JOINT_ANGLES))`` angles in degrees from joint positions."""
+    a, b, c = (np.array(joints) for joints in zip(*(angle[1:] for angle in JOINT_ANGLES)))
+    limb1 = points[:, a] - points[:, b]
+    limb2 = points[:, c] - points[:, b]
+    cross = limb1[..., 0] * limb2[..., 1] - limb1[..., 1] * limb2[..., 0]
+    dot = (limb1 * limb2).sum(axis=-1)
+    return np.degrees(np.abs(np.arctan2(cross, dot)))
+
+
+def compute_kinematics(keypoints, fps, smoothing=None):
+    """Kinematics of the first person of a pose track, for all joints at once.
+
+    ``keypoints`` is a pose store's ``(frames, persons, keypoints, 3)``
+    array. Joints scored below MIN_POSE_SCORE count as missing; gaps of up
+    to MAX_GAP_SECONDS are interpolated and every frame keeps its place in
+    time. Tracks are smoothed with ``smoothing`` ("savgol" or "one_euro",
+    default ANALYZER_KINEMATICS_SMOOTHING) and differentiated in torso
+    lengths, so speeds compare across players and camera distances.
+
+    Returns a dict of
+        fps, scale:        frame rate and torso length in pixels
+        angle_names:       names of the ``angles`` columns (JOINT_ANGLES)
+        observed:          (frames, keypoints) joint seen, not interpolated
+        positions:         (frames, keypoints, 2) smoothed, in pixels
+        velocity:          (frames, keypoints, 2) torso lengths / s
+        acceleration:      (frames, keypoints, 2) torso lengths / s^2
+        speed:             (frames, keypoints) torso lengths / s
+        angles:            (frames, angles) degrees
+        angular_velocity:  (frames, angles) degrees / s
+    with NaN wherever a joint is missing.
+    """
+    smoothing = smoothing or config.KINEMATICS_SMOOTHING
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    num_frames = len(keypoints)
+    if keypoints.ndim == 4 and keypoints.shape[1]:
+        person = keypoints[:, 0]
+    else:
+        person = np.full((num_frames, keypoints.shape[-2], 3), np.nan)
+    observed = np.isfinite(person[..., :2]).all(axis=-1) & (person[..., 2] >= MIN_POSE_SCORE)
+    points = np.where(observed[..., None], person[..., :2], np.nan)
+
+    scale = body_scale(points)
+    max_gap = int(round(MAX_GAP_SECONDS * fps))
+    points = interpolate_gaps(points / scale, max_gap)
+    positions, velocity, acceleration = _smooth(points, fps, smoothing)
+    angles, angular_velocity, _ = _smooth(joint_angles(points), fps, smoothing)
+
+    return {
+        "fps": float(fps),
+        "scale": scale,
+        "smoothing": smoothing,
+        "angle_names": list(ANGLE_NAMES),
+        "observed": observed,
+        "positions": (positions * scale).astype(np.float32),
+        "velocity": velocity.astype(np.float32),
+        "acceleration": acceleration.astype(np.float32),
+        "speed": np.linalg.norm(velocity, axis=-1).astype(np.float32),
+        "angles": angles.astype(np.float32),
+        "angular_velocity": angular_velocity.astype(np.float32),
+    }
+
+
+def save_kinematics(directory, kinematics):
+    """Save kinematics into a pose store directory.
+
+    Every file is written under a temporary name and moved into place, and
+    ``kinematics.json``, which marks the arrays complete, comes last, so
+    processes computing the same kinematics at once do not clash.
+    """
+    tag = uuid.uuid4().hex
+    for name in ARRAY_NAMES:
+        tmp_path = os.path.join(directory, f".kinematics_{name}.{tag}.npy")
+        np.save(tmp_path, kinematics[name])
+        os.replace(tmp_path, os.path.join(directory, f"kinematics_{name}.npy"))
+    meta = {key: kinematics[key] for key in ("fps", "scale", "smoothing", "angle_names")}
+    tmp_path = os.path.join(directory, f".{META_FILE}.{tag}")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, META_FILE))
+
+
+def load_kinematics(directory):
+    """Memory-mapped kinematics saved in a pose store, or None."""
+    meta_path = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as f:
+        kinematics = json.load(f)
+    for name in ARRAY_NAMES:
+        kinematics[name] = np.load(
+            os.path.join(directory, f"kinematics_{name}.npy"), mmap_mode="r"
+        )
+    return kinematics
+
+
+def pose_store_kinematics(directory, smoothing=None):
+    """Kinematics of a pose store, computed and saved with it on first use."""
+    smoothing = smoothing or config.KINEMATICS_SMOOTHING
+    kinematics = load_kinematics(directory)
+    if kinematics is not None and kinematics["smoothing"] == smoothing:
+        return kinematics
+    store = PoseStore(directory)
+    kinematics = compute_kinematics(store.arrays["keypoints"], store.fps, smoothing)
+    save_kinematics(directory, kinematics)
+    return kinematics
+
+
+def kinematics_series(kinematics, series):
+    """One time series, e.g. ``speed.right_wrist`` or ``angles.right_elbow``,
+    as ``(values, units)``; raises ValueError for an unknown series."""
+    quantity, _, name = series.partition(".")
+    if quantity not in SERIES_QUANTITIES:
+        raise ValueError(
+            f"Unknown quantity {quantity!r}, expected one of {', '.join(SERIES_QUANTITIES)}"
+        )
+    array, component, units = SERIES_QUANTITIES[quantity]
+    names = kinematics["angle_names"] if array in ("angles", "angular_velocity") else KEYPOINT_NAMES
+    if name not in names:
+        raise ValueError(f"Unknown {quantity} series {name!r}, expected one of {', '.join(names)}")
+    values = kinematics[array][:, list(names).index(name)]
+    if component is not None:
+        values = values[:, component]
+    return values, units
@@ -1,33 +1,122 @@
-from flask import Flask, request, jsonify, send_file, Response, send_from_directory
+from flask import Blueprint, Flask, request, jsonify, send_file, Response, current_app
 from flask_cors import CORS
 import os
 import cv2
+import json
 import shutil
+import uuid
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
 from werkzeug.utils import secure_filename
-from video_processor import VideoProcessor
+import config
+import compositor
+import metrics
+from frame_pipeline import normalize_rotation
+from decimation import METHODS as DECIMATION_METHODS, decimate
+from jobs import JobManager, QueueFullError
+from kinematics import DEFAULT_SERIES, kinematics_series, pose_store_kinematics
+from pose_store import PoseStore, pose_store_path
+from result_cache import ResultCache
+from serve_comparison import compare_videos
+from uploads import UploadError, UploadManager, UploadOffsetError
+from video_serving import serve_file
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 
-# Initialize Flask app with Vite frontend
-app = Flask(
-    __name__,
-    static_folder="./frontend/dist",  # Vite's default build output directory
-    static_url_path="",
-)
-CORS(app)  # Enable CORS for all routes
-
 # Configure upload and output directories
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(CURRENT_DIR, "uploads")
 OUTPUT_FOLDER = os.path.join(CURRENT_DIR, "output")
 ALLOWED_EXTENSIONS = {"mp4", "avi", "mov"}
+# Most frames returned by one /api/poses request
+MAX_POSE_FRAMES = 1000
+# Samples per series returned by /api/kinematics by default and at most
+KINEMATICS_POINTS = 1000
+MAX_KINEMATICS_POINTS = 5000
+# Maximum request size (100MB); larger videos go through the chunked
+# /api/uploads endpoints
+MAX_CONTENT_LENGTH = 100 * 1024 * 1024
+
+ROLES = ("all", "io", "analysis")
+
+# Routes for viewers: the frontend, result videos and analysis outputs. They
+# only read files, so any number of light worker processes can serve them.
+io_routes = Blueprint("io", __name__)
+# Routes that upload and analyze videos, served by the one process that owns
+# the model pool, the job queue and the upload sessions
+analysis_routes = Blueprint("analysis", __name__)
+
+# Analysis services, created by create_app for the "analysis" and "all" roles
+model_pool = None
+result_cache = None
+job_manager = None
+upload_manager = None
+
+
+def create_app(role=None):
+    """Create the Flask app serving ``role`` (default ANALYZER_ROLE).
+
+    "io" serves the frontend and finished results without importing the
+    models, "analysis" takes uploads and runs analysis jobs, and "all" does
+    both in one process, as the development server does.
+    """
+    role = role or config.ROLE
+    if role not in ROLES:
+        raise ValueError(f"Unknown role {role!r}, expected one of {', '.join(ROLES)}")
+    serves_io = role in ("all", "io")
+
+    # Initialize Flask app with Vite frontend
+    app = Flask(
+        __name__,
+        # Vite's default build output directory
+        static_folder="./frontend/dist" if serves_io else None,
+        static_url_path="",
+    )
+    CORS(app)  # Enable CORS for all routes
+    app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+    app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    app.config["OUTPUT_FOLDER"] = OUTPUT_FOLDER
+
+    if serves_io:
+        app.register_blueprint(io_routes)
+    if role in ("all", "analysis"):
+        _init_analysis()
+        app.register_blueprint(analysis_routes)
+    return app
+
+
+def _init_analysis():
+    global model_pool, result_cache, job_manager, upload_manager
+    if model_pool is not None:
+        return
+    from model_pool import ModelPool
+
+    # Models are loaded once per process and shared by every request
+    model_pool = ModelPool(
+        device=config.DEVICES,
+        replicas=config.MODEL_REPLICAS,
+        cpu_sets=config.CPU_SETS,
+        # Without warm-up, replicas load on the first jobs instead
+        lazy=not config.WARM_UP_ON_STARTUP,
+    )
+
+    # Repeat uploads of the same video are restored from the result cache
+    result_cache = (
+        ResultCache(config.CACHE_DIR, config.CACHE_MAX_BYTES, store_videos=config.CACHE_VIDEOS)
+        if config.CACHE_ENABLED
+        else None
+    )
+
+    # Analysis runs on a bounded pool of background workers
+    job_manager = JobManager(workers=config.JOB_WORKERS, max_queued=config.JOB_QUEUE_SIZE)
+
+    # Chunked uploads that analysis jobs can start reading before they complete
+    upload_manager = UploadManager(
+        UPLOAD_FOLDER, config.UPLOAD_MAX_BYTES, config.UPLOAD_SESSION_TTL
+    )
 
-# Configure maximum file size (100MB)
-app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-app.config["OUTPUT_FOLDER"] = OUTPUT_FOLDER
 
 # Define keypoint indices (based on MMPose human keypoint format)
 LEFT_WRIST = 9
@@ -50,68 +139,184 @@ def allowed_file(filename):
     return ext in ALLOWED_EXTENSIONS
 
 
-def send_file_partial(path):
-    """Support for range requests - important for video streaming."""
-    range_header = request.headers.get("Range", None)
-    if not range_header:
-        # Make sure the mimetype and content-type are set explicitly
-        response = send_from_directory(
-            app.config["OUTPUT_FOLDER"], 
-            os.path.basename(path), 
-            mimetype="video/mp4",
-            as_attachment=False
-        )
-        response.headers.add("Accept-Ranges", "bytes")
-        return response
-
-    size = os.path.getsize(path)
-    byte1, byte2 = 0, None
+@io_routes.route("/")
+def serve():
+    """Serve the Vite frontend."""
+    return current_app.send_static_file("index.html")
 
-    m = range_header.replace("bytes=", "").split("-")
-    byte1 = int(m[0])
-    if len(m) > 1 and m[1].isdigit():
-        byte2 = int(m[1])
 
-    if byte2 is None:
-        byte2 = size - 1
+@io_routes.route("/<path:path>")
+def serve_static(path):
+    """Serve static files from the Vite build directory."""
+    return current_app.send_static_file(path)
 
-    length = byte2 - byte1 + 1
 
-    with open(path, "rb") as f:
-        f.seek(byte1)
-        data = f.read(length)
+def analyze_video(job, processor, video):
+    """Analyze one uploaded video, reporting progress under its key on ``job``.
 
-    rv = Response(
-        data,
-        206,
-        mimetype="video/mp4",
-        content_type="video/mp4",
-        direct_passthrough=True,
+    Outputs are named after the job and the video's key as well as the
+    upload, so videos of the same name never write the same files.
+    """
+    output_name = f"{video['name']}_{job.id}_{video['key']}_pose.mp4"
+    output_path = os.path.join(OUTPUT_FOLDER, output_name)
+    temp_dir = os.path.join(OUTPUT_FOLDER, f"temp_{job.id}_{video['key']}")
+    stats = metrics.AnalysisMetrics()
+    success = False
+    try:
+        with stats:
+            success = processor.process_video(
+                video["path"],
+                output_path,
+                temp_dir,
+                orientation=video["orientation"],
+                progress=job.progress_callback(video["key"]),
+                on_moment=job.moment_callback(video["key"]),
+                upload=video.get("upload"),
+                stats=stats,
+            )
+    finally:
+        stats.finish(success)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if video.get("upload") is not None:
+            # Refuse further chunks of an upload nobody is reading anymore
+            video["upload"].abort()
+        if os.path.exists(video["path"]):
+            os.remove(video["path"])
+    if not success:
+        raise RuntimeError(f"Error processing {video['label'].lower()}")
+    return {
+        "name": output_name,
+        "label": video["label"],
+        "metrics": stats.to_dict(),
+    }
+
+
+def analyze_videos(job, videos):
+    """Job body: analyze the uploaded videos concurrently.
+
+    Up to ANALYZER_VIDEO_CONCURRENCY videos run at once. Each one only holds
+    a model replica while it is being inferred, so rendering and encoding of
+    one video overlap with inference of the other even with a single replica.
+    """
+    from video_processor import VideoProcessor
+
+    processor = VideoProcessor(model_pool=model_pool, result_cache=result_cache)
+    workers = max(1, min(config.VIDEO_CONCURRENCY, len(videos)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"job-{job.id[:8]}") as executor:
+        futures = [executor.submit(analyze_video, job, processor, video) for video in videos]
+        # Wait for every video before raising so no upload is left behind
+        wait(futures)
+    results = [future.result() for future in futures]
+
+    peak_rss = [r["metrics"]["peak_rss_bytes"] for r in results if r["metrics"]["peak_rss_bytes"]]
+    return {
+        "status": "success",
+        "message": "Videos processed successfully",
+        "videos": results,
+        "comparison": _comparison_summary(results),
+        "composite": _job_composite(job, results),
+        "metrics": {
+            "queued_seconds": job.started_at - job.created_at,
+            "peak_rss_bytes": max(peak_rss, default=None),
+        },
+    }
+
+
+def _comparison_summary(results):
+    """Overall and per-phase similarity of the first serves of two analyzed
+    videos; the frame mapping is left to /api/compare."""
+    if len(results) != 2:
+        return None
+    try:
+        comparison = compare_videos(
+            os.path.join(OUTPUT_FOLDER, results[0]["name"]),
+            os.path.join(OUTPUT_FOLDER, results[1]["name"]),
+        )
+    except Exception as e:
+        print(f"Warning: could not compare the serves: {str(e)}")
+        return None
+    return {
+        "similarity": comparison["similarity"],
+        "anchors": comparison["anchors"],
+        "phases": comparison["phases"],
+        "url": "/api/compare?" + urlencode({"video1": results[0]["name"], "video2": results[1]["name"]}),
+    }
+
+
+def _job_composite(job, results):
+    """Render the ANALYZER_COMPOSITE composite of a job's two videos."""
+    if config.COMPOSITE == "off" or len(results) != 2:
+        return None
+    try:
+        return render_composite(
+            job, results[0]["name"], results[1]["name"], config.COMPOSITE
+        )["name"]
+    except Exception as e:
+        print(f"Warning: could not render the composite: {str(e)}")
+        return None
+
+
+def render_composite(job, video1, video2, mode, serve1=None, serve2=None):
+    """Job body: render two analyzed videos, aligned, into one video."""
+    name = compositor.composite_name(video1, video2, mode, serve1, serve2)
+    comparison = compositor.render_composite(
+        os.path.join(OUTPUT_FOLDER, video1),
+        os.path.join(OUTPUT_FOLDER, video2),
+        os.path.join(OUTPUT_FOLDER, name),
+        mode,
+        serve1,
+        serve2,
+        progress=job.progress_callback("composite"),
     )
-    rv.headers.add("Content-Range", f"bytes {byte1}-{byte2}/{size}")
-    rv.headers.add("Accept-Ranges", "bytes")
-    # Add cache control headers to prevent caching issues
-    rv.headers.add("Cache-Control", "no-cache, no-store, must-revalidate")
-    rv.headers.add("Pragma", "no-cache")
-    rv.headers.add("Expires", "0")
-    return rv
-
-
-@app.route("/")
-def serve():
-    """Serve the Vite frontend."""
-    return app.send_static_file("index.html")
-
+    return {
+        "status": "success",
+        "name": name,
+        "mode": mode,
+        "similarity": comparison["similarity"],
+    }
+
+
+@analysis_routes.route("/api/composite", methods=["POST"])
+def create_composite():
+    """Queue rendering of two analyzed videos into one synchronized video.
+
+    Takes ``{"video1", "video2", "mode", "serve1", "serve2"}``: ``mode`` is
+    "side_by_side" (default) or "ghost", and the serves pick serves of
+    multi-serve sessions. Responds with 202 and a job whose result names
+    the composite, served by /api/video/<name>.
+    """
+    body = request.get_json(silent=True) or {}
+    video1 = secure_filename(body.get("video1") or "")
+    video2 = secure_filename(body.get("video2") or "")
+    mode = body.get("mode", "side_by_side")
+    if not video1 or not video2:
+        return jsonify({"error": "video1 and video2 are required"}), 400
+    if mode not in compositor.MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(compositor.MODES)}"}), 400
+    for video in (video1, video2):
+        if not os.path.exists(os.path.join(OUTPUT_FOLDER, video)):
+            return jsonify({"error": f"{video} not found"}), 404
+    try:
+        serves = [None if body.get(key) is None else int(body[key]) for key in ("serve1", "serve2")]
+    except (TypeError, ValueError):
+        return jsonify({"error": "serve1 and serve2 must be serve numbers"}), 400
 
-@app.route("/<path:path>")
-def serve_static(path):
-    """Serve static files from the Vite build directory."""
-    return app.send_static_file(path)
+    try:
+        job = job_manager.submit(
+            render_composite, video1, video2, mode, *serves, kind="composite"
+        )
+    except QueueFullError:
+        return _queue_full_response()
+    return _job_queued_response(job)
 
 
-@app.route("/api/upload", methods=["POST"])
+@analysis_routes.route("/api/upload", methods=["POST"])
 def upload_videos():
-    """Handle video upload and processing."""
+    """Accept two videos and queue them for analysis.
+
+    Responds with 202 and a job id immediately; poll /api/jobs/<id> or
+    subscribe to /api/jobs/<id>/events for progress and the result.
+    """
     if "video1" not in request.files or "video2" not in request.files:
         return jsonify({"error": "Both videos are required"}), 400
 
@@ -124,87 +329,271 @@ def upload_videos():
     if not (allowed_file(video1.filename) and allowed_file(video2.filename)):
         return jsonify({"error": "Invalid file type"}), 400
 
+    try:
+        orientations = _orientations(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Shed load before accepting the upload bodies
+    if job_manager.full:
+        return _queue_full_response()
+
+    videos = []
     try:
         # Create directories if they don't exist
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
         os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
-        # Save uploaded files
-        video1_filename = secure_filename(video1.filename)
-        video2_filename = secure_filename(video2.filename)
+        # Save uploaded files under unique names so queued jobs cannot clobber each other
+        for key, upload, label in (
+            ("video1", video1, "First Video"),
+            ("video2", video2, "Second Video"),
+        ):
+            filename = secure_filename(upload.filename)
+            path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{filename}")
+            upload.save(path)
+            orientation = orientations[key]
+            print(f"{label} orientation: {orientation}")
+            videos.append(
+                {
+                    "key": key,
+                    "label": label,
+                    "path": path,
+                    "name": os.path.splitext(filename)[0],
+                    "orientation": orientation,
+                }
+            )
 
-        video1_path = os.path.join(UPLOAD_FOLDER, video1_filename)
-        video2_path = os.path.join(UPLOAD_FOLDER, video2_filename)
+        job = job_manager.submit(analyze_videos, videos)
+    except QueueFullError:
+        _remove_uploads(videos)
+        return _queue_full_response()
+    except Exception as e:
+        _remove_uploads(videos)
+        return jsonify({"error": str(e)}), 500
 
-        video1.save(video1_path)
-        video2.save(video2_path)
+    return _job_queued_response(job)
 
-        # Get orientation information from form data
-        video1_orientation = int(request.form.get('video1_orientation', 0))
-        video2_orientation = int(request.form.get('video2_orientation', 0))
-        
-        print(f"Video 1 orientation: {video1_orientation}")
-        print(f"Video 2 orientation: {video2_orientation}")
 
-        # Initialize video processor
-        processor = VideoProcessor(device="cuda:0")
+@analysis_routes.route("/api/uploads", methods=["POST"])
+def create_upload():
+    """Start a chunked upload of one video.
 
-        # Process videos
-        video1_name = os.path.splitext(video1_filename)[0]
-        video2_name = os.path.splitext(video2_filename)[0]
+    Takes ``{"filename": ..., "size": <bytes>}`` and returns the upload id.
+    Chunks are then sent in order with PATCH /api/uploads/<id>.
+    """
+    body = request.get_json(silent=True) or {}
+    filename = body.get("filename", "")
+    if not isinstance(filename, str) or not filename or not allowed_file(filename):
+        return jsonify({"error": "Invalid file type"}), 400
+    try:
+        size = int(body.get("size", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Upload size must be a number of bytes"}), 400
+    try:
+        session = upload_manager.create(filename, size)
+    except (UploadError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    response = jsonify(session.to_dict())
+    response.headers["Location"] = f"/api/uploads/{session.id}"
+    return response, 201
+
+
+@analysis_routes.route("/api/uploads/<upload_id>", methods=["PATCH"])
+def upload_chunk(upload_id):
+    """Append the request body at the ``Upload-Offset`` header.
+
+    The body is streamed to disk. A chunk that does not start where the
+    upload ends gets 409 with the offset to resume from.
+    """
+    session = upload_manager.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    offset = request.headers.get("Upload-Offset", "")
+    if not offset.isdigit():
+        return jsonify({"error": "Missing Upload-Offset header"}), 400
+    try:
+        session.write(int(offset), request.stream, request.content_length)
+    except UploadOffsetError as e:
+        return _upload_response(session, {"error": str(e)}, 409)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    return _upload_response(session, session.to_dict(), 200)
+
+
+@analysis_routes.route("/api/uploads/<upload_id>", methods=["GET", "HEAD"])
+def get_upload(upload_id):
+    """Report how much of an upload arrived, to resume it after a failure."""
+    session = upload_manager.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return _upload_response(session, session.to_dict(), 200)
+
+
+@analysis_routes.route("/api/uploads/<upload_id>", methods=["DELETE"])
+def delete_upload(upload_id):
+    """Cancel an upload."""
+    upload_manager.discard(upload_id)
+    return "", 204
+
+
+@analysis_routes.route("/api/analyze", methods=["POST"])
+def analyze_uploads():
+    """Queue two chunked uploads for analysis.
+
+    Takes ``{"video1": <upload id>, "video2": <upload id>}`` plus optional
+    ``video1_orientation``/``video2_orientation``. It can be called as soon
+    as both uploads started: faststart MP4s are analyzed while their chunks
+    arrive and other files once complete.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        orientations = _orientations(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if job_manager.full:
+        return _queue_full_response()
+
+    videos = []
+    for key, label in (("video1", "First Video"), ("video2", "Second Video")):
+        session = upload_manager.claim(body.get(key, ""))
+        if session is None:
+            for video in videos:
+                upload_manager.release(video["upload"])
+            return jsonify({"error": f"Unknown or already analyzed upload for {key}"}), 400
+        videos.append(
+            {
+                "key": key,
+                "label": label,
+                "path": session.path,
+                "name": os.path.splitext(session.filename)[0],
+                "orientation": orientations[key],
+                "upload": session,
+            }
+        )
 
-        output_path1 = os.path.join(OUTPUT_FOLDER, f"{video1_name}_pose.mp4")
-        temp_dir1 = os.path.join(OUTPUT_FOLDER, f"temp_{video1_name}")
-        success1 = processor.process_video(video1_path, output_path1, temp_dir1, orientation=video1_orientation)
+    try:
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        job = job_manager.submit(analyze_videos, videos)
+    except QueueFullError:
+        for video in videos:
+            upload_manager.release(video["upload"])
+        return _queue_full_response()
+    return _job_queued_response(job)
+
+
+def _orientations(values):
+    """Clockwise rotation of each video from its ``<key>_orientation`` field."""
+    return {
+        key: normalize_rotation(values.get(f"{key}_orientation", 0))
+        for key in ("video1", "video2")
+    }
+
+
+def _upload_response(session, body, status):
+    response = jsonify(body)
+    response.headers["Upload-Offset"] = str(session.received)
+    response.headers["Upload-Length"] = str(session.size)
+    return response, status
+
+
+def _job_queued_response(job):
+    return (
+        jsonify(
+            {
+                "status": "queued",
+                "job_id": job.id,
+                "status_url": f"/api/jobs/{job.id}",
+                "events_url": f"/api/jobs/{job.id}/events",
+            }
+        ),
+        202,
+    )
 
-        output_path2 = os.path.join(OUTPUT_FOLDER, f"{video2_name}_pose.mp4")
-        temp_dir2 = os.path.join(OUTPUT_FOLDER, f"temp_{video2_name}")
-        success2 = processor.process_video(video2_path, output_path2, temp_dir2, orientation=video2_orientation)
 
-        # Clean up
-        shutil.rmtree(temp_dir1, ignore_errors=True)
-        shutil.rmtree(temp_dir2, ignore_errors=True)
-        os.remove(video1_path)
-        os.remove(video2_path)
+def _remove_uploads(videos):
+    for video in videos:
+        if os.path.exists(video["path"]):
+            os.remove(video["path"])
 
-        if success1 and success2:
-            return jsonify(
-                {
-                    "status": "success",
-                    "message": "Videos processed successfully",
-                    "videos": [
-                        {"name": f"{video1_name}_pose.mp4", "label": "First Video"},
-                        {"name": f"{video2_name}_pose.mp4", "label": "Second Video"},
-                    ],
-                }
-            )
-        else:
-            return (
-                jsonify({"status": "error", "message": "Error processing videos"}),
-                500,
+
+def _queue_full_response():
+    response = jsonify({"error": "Analysis queue is full, please retry later"})
+    response.headers["Retry-After"] = str(config.JOB_RETRY_AFTER)
+    return response, 429
+
+
+@analysis_routes.route("/api/jobs/<job_id>")
+def get_job(job_id):
+    """Get the status, per-stage progress and result of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@analysis_routes.route("/api/jobs/<job_id>/events")
+def job_events(job_id):
+    """Stream job status and progress as server-sent events."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    # Resume after the last event the client saw when it reconnects
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    start = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+
+    def stream():
+        for event in job.events(start=start):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield (
+                f"id: {event['id']}\n"
+                f"event: {event['event']}\n"
+                f"data: {json.dumps(event['data'])}\n\n"
             )
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@analysis_routes.route("/api/ready")
+def ready():
+    """Report whether the analysis models are loaded and warmed up (or, with
+    warm-up disabled, load on demand)."""
+    status = model_pool.status()
+    return jsonify(status), (200 if status["ready"] else 503)
 
 
-@app.route("/api/video/<filename>")
+@analysis_routes.route("/metrics")
+def get_metrics():
+    """Export analysis metrics in the Prometheus text format."""
+    metrics.JOBS_QUEUED.set(job_manager.queue_length())
+    metrics.JOBS_RUNNING.set(job_manager.running_count())
+    metrics.REPLICAS_AVAILABLE.set(model_pool.status()["available"])
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@io_routes.route("/api/video/<filename>")
 def serve_video(filename):
     """Serve processed video files with range request support."""
     try:
         # Ensure the file exists
-        path = os.path.join(app.config["OUTPUT_FOLDER"], filename)
+        path = os.path.join(current_app.config["OUTPUT_FOLDER"], filename)
         if not os.path.exists(path):
             return jsonify({"error": "Video file not found"}), 404
             
-        # Use the send_file_partial function for proper streaming support
-        return send_file_partial(path)
+        # Stream the file with range and conditional request support
+        return serve_file(request, path)
     except Exception as e:
         print(f"Error serving video {filename}: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/moments/<video_name>")
+@io_routes.route("/api/moments/<video_name>")
 def get_moments(video_name):
     """Get key moments for a video."""
     try:
@@ -220,7 +609,7 @@ def get_moments(video_name):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/balls/<video_name>")
+@io_routes.route("/api/balls/<video_name>")
 def get_balls(video_name):
     """Get ball detections for a video."""
     try:
@@ -236,6 +625,137 @@ def get_balls(video_name):
         return jsonify({"error": str(e)}), 500
 
 
+@io_routes.route("/api/serves/<video_name>")
+def get_serves(video_name):
+    """Get the serves found in a video, each with its key moments."""
+    try:
+        serves_file = os.path.join(
+            OUTPUT_FOLDER, os.path.splitext(video_name)[0] + "_serves.json"
+        )
+        if os.path.exists(serves_file):
+            with open(serves_file, "r") as f:
+                serves = f.read()
+            return serves
+        return jsonify([])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@io_routes.route("/api/poses/<video_name>")
+def get_poses(video_name):
+    """Get the pose tracks of a range of frames of a video.
+
+    ``start`` and ``end`` (exclusive) select the frames; at most
+    MAX_POSE_FRAMES are returned per request.
+    """
+    poses_dir = pose_store_path(os.path.join(OUTPUT_FOLDER, secure_filename(video_name)))
+    if not os.path.exists(os.path.join(poses_dir, "meta.json")):
+        return jsonify({"error": "No pose tracks for this video"}), 404
+
+    try:
+        start = request.args.get("start", 0, type=int)
+        end = request.args.get("end", start + MAX_POSE_FRAMES, type=int)
+        store = PoseStore(poses_dir)
+        start = max(0, min(start, store.frame_count))
+        end = max(start, min(end, start + MAX_POSE_FRAMES, store.frame_count))
+        return jsonify(
+            {
+                "fps": store.fps,
+                "frame_count": store.frame_count,
+                "start": start,
+                "end": end,
+                "frames": store.frames_json(start, end),
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@io_routes.route("/api/compare")
+def compare_serves():
+    """Align a serve of ``video1`` with one of ``video2`` and score them.
+
+    ``serve1`` and ``serve2`` pick serves of multi-serve sessions (the
+    first by default). The result has the overall and per-phase
+    similarity, the key moments the alignment is anchored on and
+    ``frame_map``, the frame of video2 matching each frame of video1.
+    """
+    video1 = request.args.get("video1")
+    video2 = request.args.get("video2")
+    if not video1 or not video2:
+        return jsonify({"error": "video1 and video2 are required"}), 400
+
+    try:
+        return jsonify(
+            compare_videos(
+                os.path.join(OUTPUT_FOLDER, secure_filename(video1)),
+                os.path.join(OUTPUT_FOLDER, secure_filename(video2)),
+                request.args.get("serve1", type=int),
+                request.args.get("serve2", type=int),
+            )
+        )
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@io_routes.route("/api/kinematics/<video_name>")
+def get_kinematics(video_name):
+    """Get kinematics time series of a video, decimated for charting.
+
+    ``series`` lists ``<quantity>.<name>`` series separated by commas, e.g.
+    ``speed.right_wrist,angles.right_elbow`` (default: wrist speeds and
+    every joint angle). ``start`` and ``end`` (exclusive) select frames,
+    and each series is cut down to about ``points`` samples (at most
+    MAX_KINEMATICS_POINTS) with ``method`` "lttb" (default) or "minmax".
+    Each series comes back as the frames kept and their values.
+    """
+    poses_dir = pose_store_path(os.path.join(OUTPUT_FOLDER, secure_filename(video_name)))
+    if not os.path.exists(os.path.join(poses_dir, "meta.json")):
+        return jsonify({"error": "No pose tracks for this video"}), 404
+
+    names = request.args.get("series")
+    names = [name for name in names.split(",") if name] if names else list(DEFAULT_SERIES)
+    points = max(3, min(request.args.get("points", KINEMATICS_POINTS, type=int), MAX_KINEMATICS_POINTS))
+    method = request.args.get("method", "lttb")
+    if method not in DECIMATION_METHODS:
+        return jsonify({"error": f"method must be one of {', '.join(DECIMATION_METHODS)}"}), 400
+
+    try:
+        kinematics = pose_store_kinematics(poses_dir)
+        frame_count = len(kinematics["speed"])
+        start = max(0, min(request.args.get("start", 0, type=int), frame_count))
+        end = max(start, min(request.args.get("end", frame_count, type=int), frame_count))
+        series = {}
+        for name in names:
+            values, units = kinematics_series(kinematics, name)
+            values = np.asarray(values[start:end], dtype=np.float64)
+            frames = decimate(values, points, method)
+            values = np.round(values[frames], 3)
+            series[name] = {
+                "units": units,
+                "frames": (frames + start).tolist(),
+                "values": [None if np.isnan(value) else value for value in values.tolist()],
+            }
+        return jsonify(
+            {
+                "fps": kinematics["fps"],
+                "frame_count": frame_count,
+                "start": start,
+                "end": end,
+                "method": method,
+                "series": series,
+            }
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 if __name__ == "__main__":
     # Ensure output directory exists with proper permissions
     os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -245,5 +765,16 @@ if __name__ == "__main__":
     if os.path.exists(OUTPUT_FOLDER):
         output_files = os.listdir(OUTPUT_FOLDER)
         print(f"Found {len(output_files)} files in output directory")
-    
+
+    app = create_app()
+
+    # Warm the models up in the reloader's child process only, so the parent
+    # process that merely watches files does not load them as well
+    if (
+        model_pool is not None
+        and config.WARM_UP_ON_STARTUP
+        and os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    ):
+        model_pool.start_warm_up()
+
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,360 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the latency histogram buckets, in seconds
+FRAME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+FPS_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 240)
+
+# Seconds between samples of memory and pipeline queue depths during an analysis
+SAMPLE_INTERVAL = 0.1
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. frames processed."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. a queue length."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Counts of observations in cumulative ``le`` buckets, plus their sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, count=1, **labels):
+        """Record ``value`` ``count`` times."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += count
+                    break
+            self._values[key] = (counts, total + value * count)
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _format_labels(self.labels, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=STAGE_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "analyzer_stage_seconds",
+    "Time spent in each analysis stage per video",
+    ["stage"],
+)
+FRAME_SECONDS = REGISTRY.histogram(
+    "analyzer_frame_seconds",
+    "Time spent in each per-frame analysis stage per frame",
+    ["stage"],
+    FRAME_BUCKETS,
+)
+STAGE_FRAMES = REGISTRY.counter(
+    "analyzer_stage_frames_total", "Frames processed by each analysis stage", ["stage"]
+)
+VIDEO_SECONDS = REGISTRY.histogram(
+    "analyzer_video_seconds", "Wall time of video analyses", ["status"]
+)
+VIDEO_FPS = REGISTRY.histogram(
+    "analyzer_video_fps", "Frames per second of completed video analyses", buckets=FPS_BUCKETS
+)
+VIDEOS = REGISTRY.counter("analyzer_videos_total", "Video analyses by outcome", ["status"])
+VIDEO_PEAK_RSS = REGISTRY.gauge(
+    "analyzer_video_peak_rss_bytes", "Peak resident memory during the last video analysis"
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "analyzer_pipeline_queue_depth",
+    "Items waiting in each frame pipeline queue at the last sample",
+    ["queue"],
+)
+JOB_SECONDS = REGISTRY.histogram(
+    "analyzer_job_seconds", "Run time of finished jobs", ["kind", "status"]
+)
+JOB_WAIT_SECONDS = REGISTRY.histogram(
+    "analyzer_job_wait_seconds", "Time jobs spent queued before they started", ["kind"]
+)
+JOBS = REGISTRY.counter("analyzer_jobs_total", "Finished jobs by outcome", ["kind", "status"])
+JOBS_QUEUED = REGISTRY.gauge("analyzer_jobs_queued", "Jobs waiting for a worker")
+JOBS_RUNNING = REGISTRY.gauge("analyzer_jobs_running", "Jobs being run")
+REPLICAS_AVAILABLE = REGISTRY.gauge(
+    "analyzer_model_replicas_available", "Loaded model replicas not borrowed by a video"
+)
+RSS = REGISTRY.gauge("analyzer_rss_bytes", "Resident memory of the process")
+PEAK_RSS = REGISTRY.gauge("analyzer_peak_rss_bytes", "Peak resident memory of the process")
+
+
+def rss_bytes():
+    """Resident memory of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process so far, or None if unknown."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def render():
+    """The process's metrics in the Prometheus text format."""
+    rss = rss_bytes()
+    if rss is not None:
+        RSS.set(rss)
+    peak = peak_rss_bytes()
+    if peak is not None:
+        PEAK_RSS.set(max(peak, rss or 0))
+    return REGISTRY.render()
+
+
+class AnalysisMetrics:
+    """Stage timings, frame counts, pipeline queue depths and peak memory of
+    one video analysis.
+
+    Stages report their time with ``stage()`` or ``add()`` from whichever
+    thread runs them, so stages that overlap in the frame pipeline each get
+    their own busy time. While the ``with`` block runs, resident memory and
+    the queues of ``watch``-ed pipelines are sampled on a thread. ``finish``
+    records the analysis into the process-wide metrics.
+    """
+
+    def __init__(self, sample_interval=SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self.seconds = {}
+        self.frames = {}
+        self.queue_depths = {}
+        self.peak_rss_bytes = rss_bytes()
+        self.cached = False
+        self.started_at = None
+        self.elapsed = None
+        self._pipelines = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._sample_loop, name="analysis-metrics", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        self.elapsed = time.perf_counter() - self.started_at
+        return False
+
+    def add(self, stage, seconds, frames=0):
+        """Add ``seconds`` spent in ``stage`` on ``frames`` frames."""
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            if frames:
+                self.frames[stage] = self.frames.get(stage, 0) + frames
+        if frames:
+            STAGE_FRAMES.inc(frames, stage=stage)
+            FRAME_SECONDS.observe(seconds / frames, count=frames, stage=stage)
+
+    @contextmanager
+    def stage(self, stage, frames=0):
+        """Time the ``with`` block as ``stage`` working on ``frames`` frames."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, frames)
+
+    def timed(self, stage, iterable):
+        """Yield from ``iterable``, timing each item as one frame of ``stage``."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start, 1)
+            yield item
+
+    def watch(self, pipeline):
+        """Sample the queue depths of a frame_pipeline.FramePipeline."""
+        with self._lock:
+            self._pipelines.append(pipeline)
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            self._sample()
+
+    def _sample(self):
+        rss = rss_bytes()
+        with self._lock:
+            if rss is not None:
+                self.peak_rss_bytes = max(self.peak_rss_bytes or 0, rss)
+            pipelines = list(self._pipelines)
+        for pipeline in pipelines:
+            for name, depth in pipeline.queue_depths().items():
+                QUEUE_DEPTH.set(depth, queue=name)
+                with self._lock:
+                    self.queue_depths[name] = max(self.queue_depths.get(name, 0), depth)
+
+    @property
+    def frame_count(self):
+        """Frames of the video that went through the analysis."""
+        return max(self.frames.values(), default=0)
+
+    @property
+    def fps(self):
+        if not self.elapsed or not self.frame_count:
+            return None
+        return self.frame_count / self.elapsed
+
+    def finish(self, succeeded):
+        """Record the analysis into the process-wide metrics."""
+        status = "succeeded" if succeeded else "failed"
+        VIDEOS.inc(status=status)
+        if self.elapsed is not None:
+            VIDEO_SECONDS.observe(self.elapsed, status=status)
+        if succeeded and self.fps is not None and not self.cached:
+            VIDEO_FPS.observe(self.fps)
+        if self.peak_rss_bytes is not None:
+            VIDEO_PEAK_RSS.set(self.peak_rss_bytes)
+        for stage, seconds in self.seconds.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def to_dict(self):
+        return {
+            "seconds": self.elapsed,
+            "frames": self.frame_count,
+            "fps": self.fps,
+            "cached": self.cached,
+            "stages": {
+                stage: {
+                    "seconds": seconds,
+                    "frames": self.frames.get(stage, 0),
+                }
+                for stage, seconds in self.seconds.items()
+            },
+            "max_queue_depths": dict(self.queue_depths),
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
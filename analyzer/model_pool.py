@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from ultralytics import YOLO
+from mmpose.apis import MMPoseInferencer
+
+import config
+
+# Size of the blank frame pushed through the models during warm-up
+WARM_UP_FRAME_SIZE = 640
+
+
+class ModelSet:
+    """One pose inferencer and one YOLO model bound to a device, run with
+    PyTorch or ONNX Runtime depending on ``config.BACKEND``.
+
+    ``cpus`` is the set of cores inference on this replica is pinned to,
+    or None to run anywhere.
+    """
+
+    def __init__(self, device="cuda:0", cpus=None):
+        self.device = device
+        self.cpus = cpus
+        if config.BACKEND == "onnxruntime":
+            from onnx_backend import load_models
+
+            self.pose_inferencer, self.yolo_model = load_models(device)
+        else:
+            # With YOLO person boxes the pose model skips its own detector
+            det_model = "whole_image" if config.PERSON_DETECTOR == "yolo" else None
+            self.pose_inferencer = MMPoseInferencer(
+                config.POSE_MODEL, device=device, det_model=det_model
+            )
+            self.yolo_model = YOLO(config.YOLO_MODEL)
+        self.warm = False
+
+    def warm_up(self):
+        """Run a blank frame through every model so CUDA kernels, cudnn
+        autotuning and lazy weight loading happen before the first request."""
+        if self.warm:
+            return
+        frame = np.zeros((WARM_UP_FRAME_SIZE, WARM_UP_FRAME_SIZE, 3), dtype=np.uint8)
+        for _ in self.pose_inferencer(frame, show=False):
+            pass
+        self.yolo_model.predict(frame, device=self.device, verbose=False)
+        self.warm = True
+
+
+class ModelPool:
+    """A process-wide pool of model replicas that video processors borrow from.
+
+    Replicas are created lazily the first time they are needed, up to
+    ``replicas`` sets on each of ``device`` (one device or a list of them),
+    spread over the devices in turn. ``cpu_sets`` optionally gives each
+    device a set of cores: a thread borrowing one of its replicas is pinned
+    to them, and so are the pipeline threads it starts meanwhile. ``warm_up``
+    loads and warms every replica ahead of time so the first request does
+    not pay the cold start. A ``lazy`` pool, which is never warmed up, is
+    ready from the start.
+    """
+
+    def __init__(self, device="cuda:0", replicas=1, cpu_sets=None, lazy=False):
+        if replicas < 1:
+            raise ValueError(f"replicas must be at least 1, got {replicas}")
+        devices = [device] if isinstance(device, str) else list(device)
+        cpu_sets = list(cpu_sets or [])
+        if cpu_sets and len(cpu_sets) != len(devices):
+            raise ValueError(
+                f"Got {len(cpu_sets)} CPU sets for {len(devices)} devices"
+            )
+        self.device = ",".join(devices)
+        self.replicas = replicas * len(devices)
+        self._slots = [
+            (devices[i % len(devices)], cpu_sets[i % len(devices)] if cpu_sets else None)
+            for i in range(self.replicas)
+        ]
+        self._available = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._ready = threading.Event()
+        if lazy:
+            self._ready.set()
+        self._error = None
+        self._warm_up_seconds = None
+
+    @property
+    def ready(self):
+        """Whether every replica has been loaded and warmed up, or the pool
+        loads them lazily."""
+        return self._ready.is_set()
+
+    def _checkout(self, timeout=None):
+        with self._lock:
+            create = self._available.empty() and self._created < self.replicas
+            if create:
+                self._created += 1
+                slot = self._slots[self._created - 1]
+
+        if not create:
+            try:
+                return self._available.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(
+                    f"No model replica on {self.device} became available "
+                    f"within {timeout} seconds"
+                )
+
+        try:
+            device, cpus = slot
+            print(f"Loading model replica {self._created}/{self.replicas} on {device}")
+            return ModelSet(device, cpus)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Borrow a model set for the duration of the ``with`` block."""
+        models = self._checkout(timeout)
+        try:
+            with _pinned(models.cpus):
+                yield models
+        finally:
+            self._available.put(models)
+
+    def warm_up(self):
+        """Load every replica and run a warm-up pass on each of them."""
+        start = time.perf_counter()
+        borrowed = []
+        try:
+            for _ in range(self.replicas):
+                borrowed.append(self._checkout())
+            for models in borrowed:
+                models.warm_up()
+            self._warm_up_seconds = time.perf_counter() - start
+            self._error = None
+            self._ready.set()
+            print(
+                f"Model pool ready: {self.replicas} replica(s) on {self.device} "
+                f"warmed up in {self._warm_up_seconds:.1f}s"
+            )
+        except Exception as e:
+            self._error = str(e)
+            print(f"Error warming up model pool: {str(e)}")
+        finally:
+            for models in borrowed:
+                self._available.put(models)
+
+    def start_warm_up(self):
+        """Warm the pool up on a background thread."""
+        thread = threading.Thread(target=self.warm_up, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Describe the pool for the readiness endpoint."""
+        return {
+            "ready": self.ready,
+            "device": self.device,
+            "replicas": self.replicas,
+            "loaded": self._created,
+            "available": self._available.qsize(),
+            "warm_up_seconds": self._warm_up_seconds,
+            "error": self._error,
+        }
+
+
+@contextmanager
+def _pinned(cpus):
+    """Pin the calling thread to ``cpus`` for the ``with`` block. Threads it
+    starts inherit the pinning, which is a no-op where unsupported."""
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        yield
+        return
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cpus)
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+"""
+ONNX Runtime backend for CPU inference.
+
+The pose model (a SimCC top-down model such as RTMPose) and the YOLO model
+are exported once to ``config.ONNX_DIR``:
+
+    python onnx_backend.py export
+
+and loaded by ``ModelSet`` when ``ANALYZER_BACKEND=onnxruntime``. Person
+boxes come from the YOLO pass (``ANALYZER_PERSON_DETECTOR=yolo``), so the
+pose graph is the only MMPose model that needs exporting.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+import config
+
+POSE_GRAPH = "pose.onnx"
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+
+
+def model_paths(directory=None):
+    """Paths of the exported ``(pose, yolo)`` graphs."""
+    directory = directory or config.ONNX_DIR
+    yolo_name = os.path.splitext(os.path.basename(config.YOLO_MODEL))[0] + ".onnx"
+    return os.path.join(directory, POSE_GRAPH), os.path.join(directory, yolo_name)
+
+
+def session_options(threads=0):
+    """ONNX Runtime options with full graph optimization and ``threads``
+    intra-op threads (0 lets ONNX Runtime use every physical core)."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    if threads > 0:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+def execution_providers(device):
+    """ONNX Runtime providers for a torch-style device string."""
+    import onnxruntime as ort
+
+    if device.startswith("cuda") and "CUDAExecutionProvider" in ort.get_available_providers():
+        device_id = int(device.partition(":")[2] or 0)
+        return [("CUDAExecutionProvider", {"device_id": device_id}), "CPUExecutionProvider"]
+    return ["CPUExecutionProvider"]
+
+
+class OnnxPoseEstimator:
+    """Top-down pose estimation with an exported SimCC pose graph.
+
+    Called like ``MMPoseInferencer``: ``inputs`` are frames, image paths or a
+    video path, ``bboxes`` the person boxes of each frame, and it yields
+    ``{"predictions": [...]}`` per batch of ``batch_size`` frames. Frames
+    without boxes are posed on the whole image. Crops, the SimCC decoding
+    and the mapping back to the frame follow MMPose's test pipeline, while
+    normalization runs inside the graph.
+    """
+
+    def __init__(self, graph_path, device="cpu", threads=0):
+        import onnxruntime as ort
+
+        with open(os.path.splitext(graph_path)[0] + ".json", "r") as f:
+            meta = json.load(f)
+        self.input_size = tuple(meta["input_size"])  # (width, height)
+        self.simcc_split_ratio = meta["simcc_split_ratio"]
+        self.padding = meta["padding"]
+        self.session = ort.InferenceSession(
+            graph_path,
+            sess_options=session_options(threads),
+            providers=execution_providers(device),
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+        self.output_device = (
+            "cuda" if self.session.get_providers()[0] == "CUDAExecutionProvider" else "cpu"
+        )
+
+    def __call__(self, inputs, show=False, batch_size=1, bboxes=None, **kwargs):
+        frames = _read_inputs(inputs)
+        boxes = iter(bboxes) if bboxes is not None else itertools.repeat(None)
+        batch_size = max(1, batch_size)
+        while True:
+            batch = list(itertools.islice(frames, batch_size))
+            if not batch:
+                return
+            batch_boxes = [_frame_boxes(frame, next(boxes, None)) for frame in batch]
+            yield {"predictions": self._predict(batch, batch_boxes)}
+
+    def _predict(self, frames, boxes):
+        centers, scales = _centers_scales(
+            np.concatenate(boxes)[:, :4], self.padding, self.input_size
+        )
+        box_frames = [frame for frame, frame_boxes in zip(frames, boxes) for _ in frame_boxes]
+        crops = [
+            cv2.warpAffine(
+                frame,
+                _warp_matrix(center, scale, self.input_size),
+                self.input_size,
+                flags=cv2.INTER_LINEAR,
+            )
+            for frame, center, scale in zip(box_frames, centers, scales)
+        ]
+        # BGR uint8 NCHW; colour conversion and normalization are in the graph
+        batch = np.stack(crops).transpose(0, 3, 1, 2).astype(np.float32)
+        simcc_x, simcc_y = self._run(batch)
+
+        keypoints, scores = _decode_simcc(simcc_x, simcc_y, self.simcc_split_ratio)
+        input_size = np.array(self.input_size, dtype=np.float32)
+        keypoints = (
+            keypoints / input_size * scales[:, None]
+            + centers[:, None]
+            - 0.5 * scales[:, None]
+        )
+
+        predictions = []
+        start = 0
+        for frame_boxes in boxes:
+            instances = []
+            for i, box in enumerate(frame_boxes, start):
+                instances.append(
+                    {
+                        "keypoints": keypoints[i].tolist(),
+                        "keypoint_scores": scores[i].tolist(),
+                        "bbox": (box[:4].tolist(),),
+                        "bbox_score": float(box[4]),
+                    }
+                )
+            start += len(frame_boxes)
+            predictions.append(instances)
+        return predictions
+
+    def _run(self, batch):
+        # IO binding hands the input buffer to the session without a copy
+        # and keeps the outputs on the provider's device until read back
+        binding = self.session.io_binding()
+        binding.bind_cpu_input(self.input_name, np.ascontiguousarray(batch))
+        for name in self.output_names:
+            binding.bind_output(name, self.output_device)
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()
+
+
+def _read_inputs(inputs):
+    """Frames of a frame, a list of frames or image paths, or a video path."""
+    if isinstance(inputs, np.ndarray):
+        yield inputs
+    elif isinstance(inputs, str) and inputs.lower().endswith(VIDEO_EXTENSIONS):
+        cap = cv2.VideoCapture(inputs)
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame
+        finally:
+            cap.release()
+    else:
+        for item in [inputs] if isinstance(inputs, str) else inputs:
+            yield cv2.imread(item) if isinstance(item, str) else item
+
+
+def _frame_boxes(frame, bboxes):
+    """Person boxes of a frame as (N, 5) with scores, or the whole image."""
+    bboxes = np.asarray([] if bboxes is None else bboxes, dtype=np.float32)
+    if bboxes.size == 0:
+        height, width = frame.shape[:2]
+        return np.array([[0, 0, width, height, 1]], dtype=np.float32)
+    bboxes = bboxes.reshape(len(bboxes), -1)
+    if bboxes.shape[1] == 4:
+        bboxes = np.hstack([bboxes, np.ones((len(bboxes), 1), dtype=np.float32)])
+    return bboxes
+
+
+def _centers_scales(bboxes, padding, input_size):
+    """Box centers and padded scales fixed to the model's aspect ratio, as in
+    MMPose's ``GetBBoxCenterScale`` and ``TopdownAffine``."""
+    centers = (bboxes[:, :2] + bboxes[:, 2:4]) * 0.5
+    scales = (bboxes[:, 2:4] - bboxes[:, :2]) * padding
+    aspect_ratio = input_size[0] / input_size[1]
+    w, h = scales[:, 0], scales[:, 1]
+    scales = np.where(
+        (w > h * aspect_ratio)[:, None],
+        np.stack([w, w / aspect_ratio], axis=1),
+        np.stack([h * aspect_ratio, h], axis=1),
+    )
+    return centers.astype(np.float32), scales.astype(np.float32)
+
+
+def _warp_matrix(center, scale, input_size):
+    """Affine transform of a box onto the model input (no rotation)."""
+    ratio = input_size[0] / scale[0]
+    return np.array(
+        [
+            [ratio, 0, input_size[0] * 0.5 - ratio * center[0]],
+            [0, ratio, input_size[1] * 0.5 - ratio * center[1]],
+        ],
+        dtype=np.float32,
+    )
+
+
+def _decode_simcc(simcc_x, simcc_y, split_ratio):
+    """Keypoints in model input pixels and scores from SimCC outputs, as in
+    MMPose's ``get_simcc_maximum``."""
+    keypoints = np.stack([simcc_x.argmax(-1), simcc_y.argmax(-1)], axis=-1).astype(np.float32)
+    scores = np.minimum(simcc_x.max(-1), simcc_y.max(-1))
+    keypoints[scores <= 0] = -1
+    return keypoints / split_ratio, scores
+
+
+def load_models(device="cpu", directory=None, threads=None):
+    """Load the exported ``(pose_estimator, yolo_model)`` pair."""
+    from ultralytics import YOLO
+
+    pose_path, yolo_path = model_paths(directory)
+    for path in (pose_path, yolo_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"Missing ONNX model {path}; export it with 'python onnx_backend.py export'"
+            )
+    threads = config.ONNX_THREADS if threads is None else threads
+    pose_estimator = OnnxPoseEstimator(pose_path, device, threads)
+    return pose_estimator, YOLO(yolo_path, task="detect")
+
+
+def export_pose_model(output_path, pose_model=None, opset=17):
+    """Export a SimCC top-down MMPose model (e.g. RTMPose) to ONNX.
+
+    The graph takes BGR uint8-range NCHW crops with a dynamic batch axis and
+    returns the SimCC x/y vectors; the pre- and post-processing parameters
+    go into a JSON file next to it.
+    """
+    import torch
+    from mmpose.apis import MMPoseInferencer
+    from mmpose.models.utils.tta import flip_vectors
+
+    inferencer = MMPoseInferencer(
+        pose_model or config.POSE_MODEL, device="cpu", det_model="whole_image"
+    ).inferencer
+    model, cfg = inferencer.model, inferencer.cfg
+    codec = model.head.decoder
+    if not hasattr(codec, "simcc_split_ratio"):
+        raise ValueError(
+            f"Only SimCC pose models (e.g. RTMPose) can be exported, got {type(model.head).__name__}"
+        )
+    pipeline = {step["type"]: step for step in cfg.test_dataloader.dataset.pipeline}
+    if pipeline.get("TopdownAffine", {}).get("use_udp", False):
+        raise ValueError("Pose models with UDP affine transforms are not supported")
+    preprocessor = cfg.model.data_preprocessor
+
+    # Flip test averages the SimCC vectors of the mirrored crop, as
+    # RTMCCHead.predict does
+    flip_indices = None
+    if cfg.model.test_cfg.get("flip_test", False):
+        flip_indices = model.dataset_meta["flip_indices"]
+
+    class PoseGraph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+            self.register_buffer("mean", torch.tensor(preprocessor.mean).view(1, 3, 1, 1))
+            self.register_buffer("std", torch.tensor(preprocessor.std).view(1, 3, 1, 1))
+
+        def forward(self, inputs):
+            if preprocessor.get("bgr_to_rgb", False):
+                inputs = inputs[:, [2, 1, 0]]
+            inputs = (inputs - self.mean) / self.std
+            pred_x, pred_y = self.model.head.forward(self.model.extract_feat(inputs))
+            if flip_indices is not None:
+                flip_x, flip_y = flip_vectors(
+                    *self.model.head.forward(self.model.extract_feat(inputs.flip(-1))),
+                    flip_indices=flip_indices,
+                )
+                pred_x = (pred_x + flip_x) * 0.5
+                pred_y = (pred_y + flip_y) * 0.5
+            return pred_x, pred_y
+
+    width, height = codec.input_size
+    graph = PoseGraph().eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            graph,
+            torch.zeros(1, 3, height, width),
+            output_path,
+            input_names=["input"],
+            output_names=["simcc_x", "simcc_y"],
+            dynamic_axes={name: {0: "batch"} for name in ("input", "simcc_x", "simcc_y")},
+            opset_version=opset,
+        )
+    with open(os.path.splitext(output_path)[0] + ".json", "w") as f:
+        json.dump(
+            {
+                "input_size": [width, height],
+                "simcc_split_ratio": codec.simcc_split_ratio,
+                "padding": pipeline.get("GetBBoxCenterScale", {}).get("padding", 1.25),
+            },
+            f,
+        )
+    print(f"Exported pose model to {output_path}")
+
+
+def export_yolo_model(output_path, yolo_model=None):
+    """Export the YOLO model to ONNX with Ultralytics' exporter."""
+    from ultralytics import YOLO
+
+    exported = YOLO(yolo_model or config.YOLO_MODEL).export(
+        format="onnx", dynamic=True, simplify=True
+    )
+    shutil.move(exported, output_path)
+    print(f"Exported YOLO model to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the analyzer models to ONNX")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--output-dir", default=config.ONNX_DIR, help="Directory for the graphs")
+    parser.add_argument("--pose-model", default=config.POSE_MODEL, help="MMPose model alias or config")
+    parser.add_argument("--yolo-model", default=config.YOLO_MODEL, help="YOLO weights")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset of the pose graph")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    config.YOLO_MODEL = args.yolo_model
+    pose_path, yolo_path = model_paths(args.output_dir)
+    export_pose_model(pose_path, args.pose_model, args.opset)
+    export_yolo_model(yolo_path, args.yolo_model)
+
+
+if __name__ == "__main__":
+    main()
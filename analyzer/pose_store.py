@@ -0,0 +1,272 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+# Number of keypoints in the COCO body layout used by the "human" model
+NUM_KEYPOINTS = 17
+
+# Arrays making up a pose store, each saved as ``<name>.npy``
+ARRAY_NAMES = ("keypoints", "bboxes", "bbox_scores", "num_persons")
+
+# Most people PoseStoreWriter keeps per frame
+MAX_PERSONS = 10
+# Frames converted at a time when PoseStoreWriter finalizes a store
+_COPY_CHUNK_FRAMES = 4096
+
+
+def pose_results_to_arrays(pose_results, num_keypoints=NUM_KEYPOINTS):
+    """Pack per-frame MMPose results into dense float32 arrays.
+
+    Frames with fewer people than the busiest frame are padded with NaN.
+
+    Returns a dict with
+        keypoints:    (frames, persons, keypoints, 3) x, y, score
+        bboxes:       (frames, persons, 4) x1, y1, x2, y2
+        bbox_scores:  (frames, persons)
+        num_persons:  (frames,) people detected in each frame
+    """
+    frames = [_frame_instances(result) for result in pose_results]
+    num_frames = len(frames)
+    max_persons = max((len(instances) for instances in frames), default=0)
+
+    keypoints = np.full((num_frames, max_persons, num_keypoints, 3), np.nan, np.float32)
+    bboxes = np.full((num_frames, max_persons, 4), np.nan, np.float32)
+    bbox_scores = np.full((num_frames, max_persons), np.nan, np.float32)
+    num_persons = np.zeros(num_frames, np.int16)
+
+    for frame_idx, instances in enumerate(frames):
+        num_persons[frame_idx] = len(instances)
+        for person_idx, instance in enumerate(instances):
+            kpts = np.asarray(instance["keypoints"], np.float32)[:, :2]
+            keypoints[frame_idx, person_idx, : len(kpts), :2] = kpts
+            scores = instance.get("keypoint_scores")
+            keypoints[frame_idx, person_idx, : len(kpts), 2] = (
+                scores if scores is not None else 1.0
+            )
+            bbox = instance.get("bbox")
+            if bbox is not None:
+                bboxes[frame_idx, person_idx] = np.asarray(bbox, np.float32).reshape(-1)[:4]
+            bbox_score = instance.get("bbox_score")
+            if bbox_score is not None:
+                bbox_scores[frame_idx, person_idx] = np.asarray(bbox_score).reshape(-1)[0]
+
+    return {
+        "keypoints": keypoints,
+        "bboxes": bboxes,
+        "bbox_scores": bbox_scores,
+        "num_persons": num_persons,
+    }
+
+
+def arrays_to_pose_results(arrays):
+    """Rebuild per-frame results in the MMPose inferencer format from arrays."""
+    keypoints = arrays["keypoints"]
+    bboxes = arrays["bboxes"]
+    bbox_scores = arrays["bbox_scores"]
+    pose_results = []
+    for frame_idx, count in enumerate(arrays["num_persons"]):
+        instances = []
+        for person_idx in range(int(count)):
+            kpts = keypoints[frame_idx, person_idx]
+            instances.append(
+                {
+                    "keypoints": kpts[:, :2].tolist(),
+                    "keypoint_scores": kpts[:, 2].tolist(),
+                    "bbox": (bboxes[frame_idx, person_idx].tolist(),),
+                    "bbox_score": float(bbox_scores[frame_idx, person_idx]),
+                }
+            )
+        pose_results.append({"predictions": [instances]})
+    return pose_results
+
+
+def _frame_instances(result):
+    if not result or not result.get("predictions"):
+        return []
+    return result["predictions"][0] or []
+
+
+def pose_store_path(output_path):
+    """Directory holding the pose store of a rendered output video."""
+    return os.path.splitext(output_path)[0] + "_poses"
+
+
+def save_pose_store(directory, arrays, fps):
+    """Write pose arrays as ``.npy`` files plus ``meta.json`` into ``directory``.
+
+    The store is written next to the target and moved into place, so readers
+    never see a partial store.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    tmp_dir = os.path.join(parent, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp_dir)
+    try:
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), arrays[name])
+        _write_meta(tmp_dir, fps, arrays["keypoints"].shape)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(tmp_dir, directory)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _write_meta(directory, fps, keypoints_shape):
+    meta = {
+        "fps": fps,
+        "frame_count": int(keypoints_shape[0]),
+        "max_persons": int(keypoints_shape[1]),
+        "num_keypoints": int(keypoints_shape[2]),
+    }
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+class PoseStoreWriter:
+    """Write a pose store frame by frame without keeping frames in memory.
+
+    Frames are appended to raw files padded to ``max_persons`` and turned
+    into ``.npy`` files, trimmed to the most people seen in any frame, by
+    ``close``. Like save_pose_store, the store only appears once complete.
+    """
+
+    def __init__(self, directory, fps, max_persons=MAX_PERSONS, num_keypoints=NUM_KEYPOINTS):
+        self.directory = directory
+        self.fps = fps
+        self.max_persons = max_persons
+        self.num_keypoints = num_keypoints
+        self.frame_count = 0
+        self.persons_seen = 0
+        parent = os.path.dirname(os.path.abspath(directory))
+        self.tmp_dir = os.path.join(parent, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(self.tmp_dir)
+        self._files = {
+            name: open(os.path.join(self.tmp_dir, f"{name}.raw"), "wb")
+            for name in ARRAY_NAMES
+        }
+
+    def append(self, pose_result):
+        """Append the result of the next frame."""
+        arrays = pose_results_to_arrays([pose_result], self.num_keypoints)
+        persons = min(int(arrays["num_persons"][0]), self.max_persons)
+        self.persons_seen = max(self.persons_seen, persons)
+        arrays["num_persons"][0] = persons
+        for name in ARRAY_NAMES:
+            array = arrays[name]
+            if array.ndim > 1:
+                padded = np.full((1, self.max_persons) + array.shape[2:], np.nan, array.dtype)
+                padded[:, :persons] = array[:, :persons]
+                array = padded
+            self._files[name].write(array.tobytes())
+        self.frame_count += 1
+
+    def close(self):
+        """Finish the store and move it into place."""
+        try:
+            for f in self._files.values():
+                f.close()
+            shapes = {
+                "keypoints": ((self.max_persons, self.num_keypoints, 3), np.float32),
+                "bboxes": ((self.max_persons, 4), np.float32),
+                "bbox_scores": ((self.max_persons,), np.float32),
+                "num_persons": ((), np.int16),
+            }
+            for name, (frame_shape, dtype) in shapes.items():
+                self._finalize(name, frame_shape, dtype)
+            _write_meta(
+                self.tmp_dir,
+                self.fps,
+                (self.frame_count, self.persons_seen, self.num_keypoints),
+            )
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.rename(self.tmp_dir, self.directory)
+        finally:
+            self.abort()
+
+    def abort(self):
+        """Discard the store being written."""
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _finalize(self, name, frame_shape, dtype):
+        raw_path = os.path.join(self.tmp_dir, f"{name}.raw")
+        npy_path = os.path.join(self.tmp_dir, f"{name}.npy")
+        # Drop the padding beyond the most people seen in any frame
+        trim = (slice(None), slice(0, self.persons_seen)) if frame_shape else (slice(None),)
+        out_shape = (self.frame_count,) + (
+            (self.persons_seen,) + frame_shape[1:] if frame_shape else ()
+        )
+        if self.frame_count == 0:
+            np.save(npy_path, np.zeros(out_shape, dtype))
+        else:
+            raw = np.memmap(raw_path, dtype=dtype, mode="r", shape=(self.frame_count,) + frame_shape)
+            out = np.lib.format.open_memmap(npy_path, mode="w+", dtype=dtype, shape=out_shape)
+            for start in range(0, self.frame_count, _COPY_CHUNK_FRAMES):
+                end = start + _COPY_CHUNK_FRAMES
+                out[start:end] = raw[start:end][trim]
+            out.flush()
+            del raw, out
+        os.remove(raw_path)
+
+
+def copy_pose_store(src, dst):
+    """Copy the pose store at ``src`` to ``dst``, replacing any existing one."""
+    parent = os.path.dirname(os.path.abspath(dst))
+    tmp_dir = os.path.join(parent, f".tmp-{uuid.uuid4().hex}")
+    try:
+        shutil.copytree(src, tmp_dir)
+        shutil.rmtree(dst, ignore_errors=True)
+        os.rename(tmp_dir, dst)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class PoseStore:
+    """Read-only, memory-mapped view of a pose store.
+
+    Only the frames that are sliced are read from disk, so serving a short
+    range of a long video stays cheap.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.fps = self.meta["fps"]
+        self.frame_count = self.meta["frame_count"]
+        self.arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAY_NAMES
+        }
+
+    def read(self, start=0, end=None):
+        """Return the arrays of frames ``start`` to ``end`` (exclusive)."""
+        return {name: np.asarray(array[start:end]) for name, array in self.arrays.items()}
+
+    def pose_results(self, start=0, end=None):
+        """Frames ``start`` to ``end`` in the MMPose inferencer result format."""
+        return arrays_to_pose_results(self.read(start, end))
+
+    def frames_json(self, start=0, end=None, decimals=2):
+        """JSON-friendly list of the people detected in each frame of a range."""
+        arrays = self.read(start, end)
+        keypoints = np.round(arrays["keypoints"], decimals)
+        bboxes = np.round(arrays["bboxes"], decimals)
+        frames = []
+        for offset, count in enumerate(arrays["num_persons"]):
+            persons = []
+            for person_idx in range(int(count)):
+                bbox = bboxes[offset, person_idx]
+                bbox_score = arrays["bbox_scores"][offset, person_idx]
+                persons.append(
+                    {
+                        "keypoints": keypoints[offset, person_idx].tolist(),
+                        "bbox": None if np.isnan(bbox).any() else bbox.tolist(),
+                        "bbox_score": None if np.isnan(bbox_score) else float(bbox_score),
+                    }
+                )
+            frames.append({"frame": start + offset, "persons": persons})
+        return frames
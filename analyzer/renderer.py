@@ -0,0 +1,159 @@
+import subprocess
+
+import cv2
+import numpy as np
+
+import config
+
+# COCO skeleton as drawn by MMPose, colours converted to BGR
+KEYPOINT_COLORS = [(255, 153, 51)] * 5 + [(0, 255, 0), (0, 128, 255)] * 6
+SKELETON = [
+    ((15, 13), (0, 255, 0)),
+    ((13, 11), (0, 255, 0)),
+    ((16, 14), (0, 128, 255)),
+    ((14, 12), (0, 128, 255)),
+    ((11, 12), (255, 153, 51)),
+    ((5, 11), (255, 153, 51)),
+    ((6, 12), (255, 153, 51)),
+    ((5, 6), (255, 153, 51)),
+    ((5, 7), (0, 255, 0)),
+    ((6, 8), (0, 128, 255)),
+    ((7, 9), (0, 255, 0)),
+    ((8, 10), (0, 128, 255)),
+    ((1, 2), (255, 153, 51)),
+    ((0, 1), (255, 153, 51)),
+    ((0, 2), (255, 153, 51)),
+    ((1, 3), (255, 153, 51)),
+    ((2, 4), (255, 153, 51)),
+    ((3, 5), (255, 153, 51)),
+    ((4, 6), (255, 153, 51)),
+]
+
+
+def draw_pose(frame, instances, kpt_thr=0.3, radius=4, thickness=2, color=None):
+    """Draw the skeletons of pose instances (as produced by MMPose) in place.
+
+    ``color`` draws every limb and joint in one BGR colour instead of
+    MMPose's palette.
+    """
+    for instance in instances:
+        keypoints = np.asarray(instance["keypoints"], dtype=np.float32)
+        scores = instance.get("keypoint_scores")
+        scores = (
+            np.asarray(scores, dtype=np.float32)
+            if scores is not None
+            else np.ones(len(keypoints), dtype=np.float32)
+        )
+        points = [tuple(int(round(v)) for v in kpt[:2]) for kpt in keypoints]
+        visible = scores > kpt_thr
+
+        for (start, end), limb_color in SKELETON:
+            if visible[start] and visible[end]:
+                cv2.line(
+                    frame, points[start], points[end], color or limb_color, thickness, cv2.LINE_AA
+                )
+        for idx, point in enumerate(points):
+            if visible[idx]:
+                cv2.circle(frame, point, radius, color or KEYPOINT_COLORS[idx], -1, cv2.LINE_AA)
+    return frame
+
+
+def draw_detections(frame, balls, rackets):
+    """Draw ball and racket boxes with their track ids onto a frame in place."""
+    for detections, name, color in (
+        (balls, "Ball", (0, 0, 255)),
+        (rackets, "Racket", (0, 255, 0)),
+    ):
+        for detection in detections:
+            x1, y1, x2, y2 = detection["bbox"]
+            conf = detection["confidence"]
+            track_id = detection["track_id"]
+
+            # Draw bounding box
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+
+            # Add label with confidence and track ID
+            label = f"{name} {track_id}: {conf:.2f}"
+            cv2.putText(
+                frame,
+                label,
+                (x1, y1 - 10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                color,
+                2,
+            )
+    return frame
+
+
+class FFmpegWriter:
+    """Encode BGR frames to H.264 by piping them into a single ffmpeg process."""
+
+    def __init__(self, output_path, width, height, fps, preset=None, crf=None):
+        self.output_path = output_path
+        preset = preset or config.ENCODE_PRESET
+        crf = config.ENCODE_CRF if crf is None else crf
+        cmd = [
+            "ffmpeg",
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}",
+            "-r", str(fps),
+            "-i", "-",
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt", "yuv420p",
+            "-c:v", "libx264",
+            "-profile:v", "baseline",
+            "-level", "3.0",
+            "-preset", str(preset),
+            "-crf", str(crf),
+            "-movflags", "+faststart",
+            "-y", output_path,
+        ]
+        self.proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+
+    def write(self, frame):
+        self.proc.stdin.write(np.ascontiguousarray(frame).data)
+
+    def close(self):
+        """Finish encoding; raises RuntimeError if ffmpeg failed."""
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        stderr = self.proc.stderr.read().decode(errors="replace")
+        self.proc.stderr.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"FFMPEG encoding failed: {stderr}")
+
+
+class OpenCVWriter:
+    """mp4v fallback for machines without ffmpeg."""
+
+    def __init__(self, output_path, width, height, fps):
+        self.output_path = output_path
+        self.writer = cv2.VideoWriter(
+            output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        )
+        if not self.writer.isOpened():
+            raise RuntimeError(f"Could not open VideoWriter for {output_path}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+def open_video_writer(output_path, width, height, fps):
+    """Open an H.264 ffmpeg writer, falling back to OpenCV if ffmpeg is missing."""
+    try:
+        return FFmpegWriter(output_path, width, height, fps)
+    except FileNotFoundError:
+        print("Warning: ffmpeg not found, falling back to OpenCV mp4v encoding")
+        return OpenCVWriter(output_path, width, height, fps)
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+import config
+from pose_store import PoseStore, copy_pose_store
+
+# Bump whenever a change to pose, detection or key moment logic should
+# invalidate previously cached results
+ANALYSIS_VERSION = 2
+
+_DETECTION_KINDS = ("ball", "racket")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Content hash of a file, read in chunks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CachedResult:
+    """Analysis results of one video read back from the cache."""
+
+    def __init__(self, entry_dir):
+        self.entry_dir = entry_dir
+        with open(os.path.join(entry_dir, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(entry_dir, "moments.json"), "r") as f:
+            self.key_moments = json.load(f)
+        with open(os.path.join(entry_dir, "serves.json"), "r") as f:
+            self.serves = json.load(f)
+        self.fps = self.meta["fps"]
+        self.pose_store_dir = os.path.join(entry_dir, "poses")
+        if not os.path.exists(os.path.join(self.pose_store_dir, "meta.json")):
+            raise OSError(f"Missing pose store in {entry_dir}")
+        video_path = os.path.join(entry_dir, "video.mp4")
+        self.video_path = video_path if os.path.exists(video_path) else None
+        self._arrays = None
+
+    def _load_arrays(self):
+        if self._arrays is None:
+            with np.load(os.path.join(self.entry_dir, "detections.npz")) as data:
+                self._arrays = {name: data[name] for name in data.files}
+        return self._arrays
+
+    @property
+    def pose_results(self):
+        return PoseStore(self.pose_store_dir).pose_results()
+
+    def detections(self, kind):
+        """Rebuild the ``kind`` ("ball" or "racket") detection dicts."""
+        arrays = self._load_arrays()
+        frames = arrays[f"{kind}_frames"]
+        bboxes = arrays[f"{kind}_bboxes"]
+        track_ids = arrays[f"{kind}_track_ids"]
+        confidences = arrays[f"{kind}_confidences"]
+        return [
+            {
+                "frame": int(frame),
+                "timestamp": float(frame / self.fps),
+                "bbox": [int(v) for v in bbox],
+                "track_id": int(track_id) if track_id >= 0 else None,
+                "confidence": float(confidence),
+            }
+            for frame, bbox, track_id, confidence in zip(
+                frames, bboxes, track_ids, confidences
+            )
+        ]
+
+
+class ResultCache:
+    """On-disk cache of analysis results keyed by video content.
+
+    Entries hold a copy of the video's pose store (see pose_store.py), the
+    ball/racket detections as arrays in one ``.npz``, the key moments and
+    serve segments as JSON and optionally the rendered video. The least
+    recently used entries are evicted once the cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, root, max_bytes, store_videos=True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.store_videos = store_videos
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key_for(self, video_path, orientation=0):
+        """Key of a video's results under the current models and settings."""
+        fingerprint = json.dumps(
+            {
+                "content": file_digest(video_path),
+                "orientation": int(orientation),
+                "analysis_version": ANALYSIS_VERSION,
+                "backend": config.BACKEND,
+                "pipeline": config.PIPELINE,
+                "pose_model": config.POSE_MODEL,
+                "yolo_model": config.YOLO_MODEL,
+                "person_detector": config.PERSON_DETECTOR,
+                "sampling": [
+                    config.SAMPLING,
+                    config.SAMPLING_MAX_STRIDE,
+                    config.SAMPLING_MOTION_THRESHOLD,
+                ],
+                "roi": [config.ROI, config.ROI_REACQUIRE_FRAMES],
+            },
+            sort_keys=True,
+        )
+        return hashlib.blake2b(fingerprint.encode(), digest_size=20).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """Return the CachedResult for ``key``, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return None
+        try:
+            cached = CachedResult(entry_dir)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Discarding unreadable cache entry {key}: {str(e)}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        # Directory mtime records the last use for LRU eviction
+        os.utime(entry_dir)
+        return cached
+
+    def put(
+        self,
+        key,
+        pose_store_dir,
+        ball_detections,
+        racket_detections,
+        key_moments,
+        serves,
+        fps,
+        video_path=None,
+    ):
+        """Store the results of one analysis under ``key``."""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            copy_pose_store(pose_store_dir, os.path.join(tmp_dir, "poses"))
+            arrays = {}
+            for kind, detections in zip(_DETECTION_KINDS, (ball_detections, racket_detections)):
+                arrays.update(_detections_to_arrays(kind, detections))
+            np.savez_compressed(os.path.join(tmp_dir, "detections.npz"), **arrays)
+
+            with open(os.path.join(tmp_dir, "moments.json"), "w") as f:
+                json.dump(key_moments, f)
+            with open(os.path.join(tmp_dir, "serves.json"), "w") as f:
+                json.dump(serves, f)
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump({"fps": fps, "created_at": time.time()}, f)
+            if self.store_videos and video_path and os.path.exists(video_path):
+                shutil.copyfile(video_path, os.path.join(tmp_dir, "video.mp4"))
+
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits ``max_bytes``."""
+        with self._lock:
+            entries = []
+            for shard in os.listdir(self.root):
+                shard_dir = os.path.join(self.root, shard)
+                if shard.startswith(".") or not os.path.isdir(shard_dir):
+                    continue
+                for key in os.listdir(shard_dir):
+                    entry_dir = os.path.join(shard_dir, key)
+                    entries.append(
+                        (os.path.getmtime(entry_dir), _dir_size(entry_dir), entry_dir)
+                    )
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                print(f"Evicted cache entry {os.path.basename(entry_dir)}")
+
+
+def _detections_to_arrays(kind, detections):
+    return {
+        f"{kind}_frames": np.array([d["frame"] for d in detections], np.int32),
+        f"{kind}_bboxes": np.array(
+            [d["bbox"] for d in detections], np.int32
+        ).reshape(-1, 4),
+        f"{kind}_track_ids": np.array(
+            [-1 if d["track_id"] is None else d["track_id"] for d in detections],
+            np.int32,
+        ),
+        f"{kind}_confidences": np.array(
+            [d["confidence"] for d in detections], np.float32
+        ),
+    }
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
@@ -0,0 +1,163 @@
+import threading
+
+import numpy as np
+
+# Margins of the detection region around the player's box, in box heights:
+# room for the racket to the sides, for the ball toss and the racket at
+# impact above the head and a little below the feet
+SIDE_MARGIN = 0.6
+TOP_MARGIN = 0.8
+BOTTOM_MARGIN = 0.1
+# Margins of the pose region, in box heights: enough for the player to move
+# between frames and to raise the arms without leaving it
+POSE_SIDE_MARGIN = 0.3
+POSE_TOP_MARGIN = 0.5
+POSE_BOTTOM_MARGIN = 0.1
+# Smallest crop side in pixels, so the models still get some context
+MIN_SIZE = 320
+
+
+class RoiTracker:
+    """Follow the player with crop regions for the inference stages.
+
+    Pose estimation gets the player's last box with margins for the arms.
+    Detection gets a larger region with room for the racket and the ball,
+    which stays put while the player remains inside its inner half so that
+    object tracking sees a steady frame. Every ``reacquire_every`` frames,
+    and whenever the player is lost, a full frame is analyzed instead to
+    find the player again. With ``full_frame_pose`` (YOLO person boxes)
+    pose estimation always gets the full frame, and detection, which then
+    locates the player, is the stage that re-acquires. ``region`` is asked
+    from the decoding side and ``update`` fed from pose estimation, so the
+    tracker is thread-safe.
+    """
+
+    def __init__(self, width, height, reacquire_every=30, full_frame_pose=False):
+        self.width = width
+        self.height = height
+        self.reacquire_every = max(1, reacquire_every)
+        self.full_frame_pose = full_frame_pose
+        self.roi = None
+        self.pose_roi = None
+        self.last_full_frame = None
+        self.pixels = 0
+        self.full_pixels = 0
+        self._lock = threading.Lock()
+
+    def region(self, frame_idx):
+        """Crop regions ``(pose_roi, detection_roi)`` for ``frame_idx``.
+
+        Each is ``(x1, y1, x2, y2)`` or None for the full frame. Detection
+        keeps its region while pose estimation re-acquires the player, so
+        the ball and racket trackers see a steady frame.
+        """
+        with self._lock:
+            reacquire = self.roi is None or (
+                self.last_full_frame is not None
+                and frame_idx - self.last_full_frame >= self.reacquire_every
+            )
+            if reacquire:
+                self.last_full_frame = frame_idx
+            if self.full_frame_pose:
+                pose_roi = None
+                detection_roi = None if reacquire else self.roi
+            else:
+                pose_roi = None if reacquire else self.pose_roi
+                detection_roi = self.roi
+            self.full_pixels += 2 * self.width * self.height
+            self.pixels += self._area(pose_roi) + self._area(detection_roi)
+            return pose_roi, detection_roi
+
+    def update(self, pose_result):
+        """Move the region to the player found in a pose result (frame coordinates)."""
+        bbox = _first_person_bbox(pose_result)
+        with self._lock:
+            if bbox is None:
+                # Lost the player: search the full frame next
+                self.roi = self.pose_roi = None
+                return
+            self.pose_roi = self._expand(
+                bbox, POSE_SIDE_MARGIN, POSE_TOP_MARGIN, POSE_BOTTOM_MARGIN
+            )
+            if self.roi is not None and _contains(_shrink(self.roi, 0.25), bbox):
+                return
+            self.roi = self._expand(bbox, SIDE_MARGIN, TOP_MARGIN, BOTTOM_MARGIN)
+
+    def pixel_ratio(self):
+        """Share of full-frame pixels handed to the models so far."""
+        with self._lock:
+            return self.pixels / self.full_pixels if self.full_pixels else 1.0
+
+    def _area(self, roi):
+        if roi is None:
+            return self.width * self.height
+        return (roi[2] - roi[0]) * (roi[3] - roi[1])
+
+    def _expand(self, bbox, side, top, bottom):
+        x1, y1, x2, y2 = bbox
+        box_height = max(y2 - y1, 1)
+        x1 -= side * box_height
+        x2 += side * box_height
+        y1 -= top * box_height
+        y2 += bottom * box_height
+
+        # Grow small regions around their centre up to MIN_SIZE and slide
+        # them back inside the frame
+        roi = [x1, y1, x2, y2]
+        for lo, hi, limit in ((0, 2, self.width), (1, 3, self.height)):
+            size = min(max(roi[hi] - roi[lo], MIN_SIZE), limit)
+            center = (roi[lo] + roi[hi]) / 2
+            start = min(max(center - size / 2, 0), limit - size)
+            roi[lo], roi[hi] = start, start + size
+        return tuple(int(round(v)) for v in roi)
+
+
+def _first_person_bbox(pose_result):
+    instances = (pose_result or {}).get("predictions") or [[]]
+    if not instances[0] or instances[0][0].get("bbox") is None:
+        return None
+    bbox = np.asarray(instances[0][0]["bbox"], dtype=np.float64).reshape(-1)[:4]
+    return tuple(bbox) if np.all(np.isfinite(bbox)) else None
+
+
+def _shrink(roi, fraction):
+    x1, y1, x2, y2 = roi
+    dx = (x2 - x1) * fraction
+    dy = (y2 - y1) * fraction
+    return x1 + dx, y1 + dy, x2 - dx, y2 - dy
+
+
+def _contains(outer, inner):
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and inner[2] <= outer[2]
+        and inner[3] <= outer[3]
+    )
+
+
+def crop(frame, roi):
+    """The part of ``frame`` inside ``roi``, or the frame itself for None."""
+    if roi is None:
+        return frame
+    x1, y1, x2, y2 = roi
+    return np.ascontiguousarray(frame[y1:y2, x1:x2])
+
+
+def offset_pose_result(pose_result, roi):
+    """Map a pose result computed on a crop back to frame coordinates."""
+    if roi is None:
+        return pose_result
+    dx, dy = roi[0], roi[1]
+    for instances in pose_result["predictions"]:
+        for instance in instances:
+            instance["keypoints"] = [
+                [point[0] + dx, point[1] + dy, *point[2:]]
+                for point in instance["keypoints"]
+            ]
+            if instance.get("bbox") is not None:
+                instance["bbox"] = tuple(
+                    [x1 + dx, y1 + dy, x2 + dx, y2 + dy]
+                    for x1, y1, x2, y2 in instance["bbox"]
+                )
+    return pose_result
@@ -0,0 +1,298 @@
+import json
+import os
+
+import numpy as np
+
+from key_moment_detector import LEFT_HIP, LEFT_SHOULDER, MIN_POSE_SCORE, RIGHT_HIP, RIGHT_SHOULDER
+from pose_store import PoseStore, pose_store_path
+
+# Nose and body joints compared between serves; the eyes and ears add
+# little but noise
+JOINTS = np.array([0] + list(range(5, 17)))
+# Similarity of two joints is exp(-SHARPNESS * d^2), with d in torso lengths
+SIMILARITY_SHARPNESS = 5.0
+# Half-width of the band around the diagonal of each phase that alignment
+# searches, in seconds, and as a share of the phase length if larger
+BAND_SECONDS = 0.25
+BAND_FRACTION = 0.1
+
+
+def pose_features(keypoints):
+    """Normalized joints of the first person in every frame.
+
+    ``keypoints`` is a pose store's ``(frames, persons, keypoints, 3)``
+    array. Joints are centred on the hips and scaled by the torso length,
+    so the players' size and position in the picture do not matter.
+    Returns ``(points, weights)``: ``(frames, joints, 2)`` coordinates and
+    ``(frames, joints)`` weights of 1 for confident joints and 0 otherwise.
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float32)
+    if keypoints.ndim != 4 or keypoints.shape[1] == 0:
+        num_frames = len(keypoints)
+        return (
+            np.zeros((num_frames, len(JOINTS), 2), np.float32),
+            np.zeros((num_frames, len(JOINTS)), np.float32),
+        )
+    person = keypoints[:, 0]
+    xy = person[..., :2]
+    hips = (xy[:, LEFT_HIP] + xy[:, RIGHT_HIP]) / 2
+    shoulders = (xy[:, LEFT_SHOULDER] + xy[:, RIGHT_SHOULDER]) / 2
+    torso = np.linalg.norm(shoulders - hips, axis=-1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        points = (xy[:, JOINTS] - hips[:, None]) / torso[:, None, None]
+        weights = (person[:, JOINTS, 2] >= MIN_POSE_SCORE) & (torso[:, None] > 0)
+    weights &= np.isfinite(points).all(axis=-1)
+    points = np.where(weights[..., None], points, 0.0).astype(np.float32)
+    return points, weights.astype(np.float32)
+
+
+def frame_similarity(points1, weights1, points2, weights2):
+    """Similarity (0-1) of pairs of poses, broadcasting over leading axes.
+
+    Each joint both poses show scores exp(-SHARPNESS * d^2) and the scores
+    are averaged; poses without a joint in common score 0.
+    """
+    weights = weights1 * weights2
+    offsets = points1 - points2
+    distances = np.einsum("...d,...d->...", offsets, offsets)
+    total = weights.sum(axis=-1)
+    score = np.einsum("...j,...j->...", np.exp(-SIMILARITY_SHARPNESS * distances), weights)
+    return np.where(total > 0, score / np.maximum(total, 1e-6), 0.0)
+
+
+def match_moments(moments1, moments2, start1=0, start2=0, end1=None, end2=None):
+    """Key moments found in both serves, in order, as ``(label, frame1, frame2)``.
+
+    Moments are paired by label in the order of the first serve; pairs
+    that would make time run backwards in either serve are skipped.
+    """
+    frames2 = {}
+    for moment in moments2:
+        frames2.setdefault(moment["label"], int(moment["frame"]))
+    anchors = []
+    last1, last2 = start1, start2
+    for moment in sorted(moments1, key=lambda m: m["frame"]):
+        frame1 = int(moment["frame"])
+        frame2 = frames2.get(moment["label"])
+        if frame2 is None or frame1 < last1 or frame2 < last2:
+            continue
+        if (end1 is not None and frame1 >= end1) or (end2 is not None and frame2 >= end2):
+            continue
+        if anchors and (frame1 == last1 or frame2 == last2):
+            continue
+        anchors.append((moment["label"], frame1, frame2))
+        last1, last2 = frame1, frame2
+    return anchors
+
+
+def align(points1, weights1, points2, weights2, band):
+    """Align two pose sequences with dynamic time warping in a diagonal band.
+
+    The path runs from the first to the last frame of both sequences and
+    only looks at frames within ``band`` of the straight line between
+    them, so time and memory grow with ``frames * band`` rather than the
+    product of both lengths. Each step of the longer sequence moves the
+    other one on by 0, 1 or 2 frames, so a row only depends on the one
+    before and every row is computed as a whole. Returns the matched frame
+    indices ``(frames1, frames2)``, one pair per frame of the longer
+    sequence.
+    """
+    n1, n2 = len(points1), len(points2)
+    if n1 == 0 or n2 == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    if n1 < n2:
+        frames2, frames1 = align(points2, weights2, points1, weights1, band)
+        return frames1, frames2
+
+    # Rows are frames of the longer sequence, columns a band of the other
+    rows = np.arange(n1)
+    centers = np.rint(rows * ((n2 - 1) / max(n1 - 1, 1))).astype(np.int64)
+    width = 2 * band + 1
+    columns = centers[:, None] - band + np.arange(width)
+    inside = (columns >= 0) & (columns < n2)
+    clipped = np.clip(columns, 0, n2 - 1)
+    cost = 1.0 - frame_similarity(
+        points1[:, None], weights1[:, None], points2[clipped], weights2[clipped]
+    )
+    cost[~inside] = np.inf
+
+    # total[k] is the best path cost to column ``columns[i, k]`` of row i
+    total = np.where(columns[0] == 0, cost[0], np.inf)
+    steps = np.zeros((n1, width), np.int8)
+    shifts = np.diff(centers)
+    padded = np.full(width + 4, np.inf)
+    for i in range(1, n1):
+        padded[2:-2] = total
+        # Column j of this row continues from j, j-1 or j-2 of the row above
+        offset = 2 + shifts[i - 1]
+        candidates = np.stack(
+            [padded[offset - step : offset - step + width] for step in range(3)]
+        )
+        best = candidates.argmin(axis=0)
+        steps[i] = best
+        total = candidates[best, np.arange(width)] + cost[i]
+
+    end = np.flatnonzero(columns[-1] == n2 - 1)
+    k = int(end[0]) if len(end) and np.isfinite(total[end[0]]) else int(np.argmin(total))
+    matched = np.empty(n1, np.int64)
+    for i in range(n1 - 1, -1, -1):
+        matched[i] = columns[i, k]
+        if i:
+            k += int(shifts[i - 1]) - int(steps[i, k])
+    return rows, matched
+
+
+def _band(length1, length2, fps):
+    return max(2, int(round(BAND_SECONDS * fps)), int(np.ceil(BAND_FRACTION * max(length1, length2))))
+
+
+def _frame_map(frames1, frames2, start1, end1):
+    """Frame of serve 2 matched with every frame ``start1`` to ``end1`` of
+    serve 1, averaging over repeats and interpolating over skipped frames."""
+    unique1, inverse = np.unique(frames1, return_inverse=True)
+    mean2 = np.bincount(inverse, weights=frames2) / np.bincount(inverse)
+    return np.rint(np.interp(np.arange(start1, end1), unique1, mean2)).astype(np.int64)
+
+
+def compare_poses(
+    keypoints1, keypoints2, moments1=(), moments2=(), fps1=30.0, fps2=30.0, window1=None, window2=None
+):
+    """Align two serves and score how similar they are, phase by phase.
+
+    ``keypoints1``/``keypoints2`` are pose store keypoint arrays and the
+    moments their key moments. ``window1``/``window2`` restrict the
+    comparison to ``(start, end)`` frames. Key moments found in both serves
+    anchor the alignment: each phase between two of them is warped on its
+    own with ``align``, so the serves line up at every key moment.
+    """
+    start1, end1 = window1 or (0, len(keypoints1))
+    start2, end2 = window2 or (0, len(keypoints2))
+    points1, weights1 = pose_features(keypoints1[start1:end1])
+    points2, weights2 = pose_features(keypoints2[start2:end2])
+    anchors = match_moments(moments1, moments2, start1, start2, end1, end2)
+
+    # Phase boundaries in both serves, relative to their windows
+    bounds1 = [0] + [frame1 - start1 for _, frame1, _ in anchors] + [end1 - start1]
+    bounds2 = [0] + [frame2 - start2 for _, _, frame2 in anchors] + [end2 - start2]
+    labels = [None] + [label for label, _, _ in anchors] + [None]
+    fps = max(fps1, fps2)
+
+    path1 = []
+    path2 = []
+    phases = []
+    for phase in range(len(bounds1) - 1):
+        a1, b1 = bounds1[phase], bounds1[phase + 1]
+        a2, b2 = bounds2[phase], bounds2[phase + 1]
+        if b1 <= a1 or b2 <= a2:
+            continue
+        frames1, frames2 = align(
+            points1[a1:b1], weights1[a1:b1], points2[a2:b2], weights2[a2:b2], _band(b1 - a1, b2 - a2, fps)
+        )
+        frames1 += a1
+        frames2 += a2
+        similarity = frame_similarity(
+            points1[frames1], weights1[frames1], points2[frames2], weights2[frames2]
+        )
+        path1.append(frames1)
+        path2.append(frames2)
+        phases.append(
+            {
+                "from": labels[phase],
+                "to": labels[phase + 1],
+                "start_frame1": int(a1 + start1),
+                "end_frame1": int(b1 + start1),
+                "start_frame2": int(a2 + start2),
+                "end_frame2": int(b2 + start2),
+                "similarity": float(similarity.mean()),
+            }
+        )
+
+    if not path1:
+        return {
+            "similarity": None,
+            "anchors": [],
+            "phases": [],
+            "frame_map": {"start_frame1": start1, "frames2": []},
+        }
+    path1 = np.concatenate(path1)
+    path2 = np.concatenate(path2)
+    similarity = frame_similarity(points1[path1], weights1[path1], points2[path2], weights2[path2])
+    frame_map = _frame_map(path1 + start1, path2 + start2, start1, end1)
+    return {
+        "similarity": float(similarity.mean()),
+        "anchors": [
+            {"label": label, "frame1": frame1, "frame2": frame2} for label, frame1, frame2 in anchors
+        ],
+        "phases": phases,
+        # frames2[i] is the frame of serve 2 shown with frame start_frame1 + i of serve 1
+        "frame_map": {"start_frame1": int(start1), "frames2": frame_map.tolist()},
+    }
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _serve_window(output_path, frame_count, serve=None):
+    """``((start, end), moments)`` of serve number ``serve`` of an analyzed
+    video; the whole clip when it has a single serve and ``serve`` is None."""
+    base = os.path.splitext(output_path)[0]
+    serves = _load_json(base + "_serves.json", [])
+    if serve is None and len(serves) <= 1:
+        return (0, frame_count), _load_json(base + "_moments.json", [])
+    serve = 1 if serve is None else int(serve)
+    for entry in serves:
+        if entry["serve"] == serve:
+            return (entry["start_frame"], entry["end_frame"]), entry["key_moments"]
+    raise ValueError(f"{os.path.basename(output_path)} has no serve {serve}")
+
+
+def compare_videos(output_path1, output_path2, serve1=None, serve2=None):
+    """Compare a serve of each of two analyzed output videos.
+
+    Reads the pose tracks, key moments and serves saved next to the videos
+    and returns ``compare_poses`` of the selected serves (the first serve
+    of multi-serve sessions by default). Raises FileNotFoundError when a
+    video has no pose tracks and ValueError for an unknown serve.
+    """
+    inputs = []
+    for output_path, serve in ((output_path1, serve1), (output_path2, serve2)):
+        poses_dir = pose_store_path(output_path)
+        if not os.path.exists(os.path.join(poses_dir, "meta.json")):
+            raise FileNotFoundError(f"No pose tracks for {os.path.basename(output_path)}")
+        store = PoseStore(poses_dir)
+        window, moments = _serve_window(output_path, store.frame_count, serve)
+        inputs.append((store, window, moments))
+
+    (store1, window1, moments1), (store2, window2, moments2) = inputs
+    comparison = compare_poses(
+        store1.arrays["keypoints"][window1[0] : window1[1]],
+        store2.arrays["keypoints"][window2[0] : window2[1]],
+        [dict(m, frame=m["frame"] - window1[0]) for m in moments1],
+        [dict(m, frame=m["frame"] - window2[0]) for m in moments2],
+        store1.fps,
+        store2.fps,
+    )
+    return _shift(comparison, window1[0], window2[0], store1.fps, store2.fps)
+
+
+def _shift(comparison, offset1, offset2, fps1, fps2):
+    """Move a comparison of two windows back to the frames of the videos."""
+    for anchor in comparison["anchors"]:
+        anchor["frame1"] += offset1
+        anchor["frame2"] += offset2
+    for phase in comparison["phases"]:
+        phase["start_frame1"] += offset1
+        phase["end_frame1"] += offset1
+        phase["start_frame2"] += offset2
+        phase["end_frame2"] += offset2
+    frame_map = comparison["frame_map"]
+    frame_map["start_frame1"] += offset1
+    frame_map["frames2"] = [frame + offset2 for frame in frame_map["frames2"]]
+    comparison["fps1"] = fps1
+    comparison["fps2"] = fps2
+    return comparison
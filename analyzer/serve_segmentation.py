@@ -0,0 +1,260 @@
+from collections import deque
+
+import numpy as np
+
+from key_moment_detector import (
+    LEFT_SHOULDER,
+    LEFT_WRIST,
+    MIN_POSE_SCORE,
+    RIGHT_SHOULDER,
+    RIGHT_WRIST,
+    _first_person_arrays,
+    detect_key_moments,
+)
+
+# Arm heights are measured in shoulder widths above the shoulder line.
+# Both wrists at or below this count as the arms resting
+REST_HEIGHT = 0.0
+# Either wrist above this opens a serve (the ball toss or the swing)
+RAISED_HEIGHT = 0.5
+# The hitting wrist or the racket must reach this for the serve to count
+HIT_HEIGHT = 1.0
+# Seconds at rest that close a serve
+REST_SECONDS = 0.5
+# Seconds kept before the arms went up, so the stance is part of the serve
+PRE_ROLL_SECONDS = 1.0
+# Serves are closed after this many seconds whatever the arms do
+MAX_SERVE_SECONDS = 8.0
+
+
+def arm_heights(pose_result, rackets=()):
+    """Heights of the left wrist and of the hitting arm in one frame.
+
+    The hitting arm is the higher of the right wrist and any racket.
+    Returns None when the frame has no confident pose.
+    """
+    if not pose_result or not pose_result.get("predictions"):
+        return None
+    predictions = pose_result["predictions"][0]
+    if not predictions or "keypoints" not in predictions[0]:
+        return None
+    person = predictions[0]
+    scores = person.get("keypoint_scores")
+    if scores is not None and np.mean(scores) < MIN_POSE_SCORE:
+        return None
+
+    keypoints = np.asarray(person["keypoints"], dtype=np.float64)
+    left_shoulder = keypoints[LEFT_SHOULDER, :2]
+    right_shoulder = keypoints[RIGHT_SHOULDER, :2]
+    shoulder_width = np.linalg.norm(right_shoulder - left_shoulder)
+    if not shoulder_width > 0:
+        return None
+
+    left = (left_shoulder[1] - keypoints[LEFT_WRIST, 1]) / shoulder_width
+    right = (right_shoulder[1] - keypoints[RIGHT_WRIST, 1]) / shoulder_width
+    shoulder_y = (left_shoulder[1] + right_shoulder[1]) / 2
+    for racket in rackets:
+        racket_y = (racket["bbox"][1] + racket["bbox"][3]) / 2
+        right = max(right, (shoulder_y - racket_y) / shoulder_width)
+    return float(left), float(right)
+
+
+class ServeSegment:
+    """Frames ``start_frame`` to ``end_frame`` (exclusive) of one serve."""
+
+    def __init__(self, start_frame, end_frame, peak_frame):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.peak_frame = peak_frame
+
+    def to_dict(self, fps):
+        return {
+            "start_frame": int(self.start_frame),
+            "end_frame": int(self.end_frame),
+            "peak_frame": int(self.peak_frame),
+            "start_time": float(self.start_frame / fps),
+            "end_time": float(self.end_frame / fps),
+        }
+
+
+class ServeSegmenter:
+    """Find serve boundaries in a stream of frames.
+
+    A serve opens when a wrist rises above the shoulders (going back
+    PRE_ROLL_SECONDS) and closes once both wrists have rested for
+    REST_SECONDS or after MAX_SERVE_SECONDS. It only counts if the hitting
+    arm or racket reached HIT_HEIGHT in between, which skips players
+    stretching or picking up balls. Only a few counters are kept, so memory
+    does not grow with the length of the video.
+    """
+
+    def __init__(self, fps):
+        self.pre_roll = max(1, int(round(PRE_ROLL_SECONDS * fps)))
+        self.rest_frames = max(1, int(round(REST_SECONDS * fps)))
+        self.max_frames = max(1, int(round(MAX_SERVE_SECONDS * fps)))
+        self.start_frame = None
+        self.min_start = 0
+        self.last_frame = -1
+        self._reset()
+
+    def _reset(self):
+        self.peak_height = float("-inf")
+        self.peak_frame = None
+        self.rest_run = 0
+
+    @property
+    def open(self):
+        return self.start_frame is not None
+
+    def keep_from(self):
+        """Earliest frame a serve closed later may still start at."""
+        if self.open:
+            return self.start_frame
+        return max(self.min_start, self.last_frame + 1 - self.pre_roll)
+
+    def update(self, frame_idx, heights):
+        """Feed the arm heights of the next frame (None if unknown).
+
+        Returns the ServeSegment that this frame closed, if any.
+        """
+        self.last_frame = frame_idx
+        if not self.open:
+            if heights is not None and max(heights) > RAISED_HEIGHT:
+                self.start_frame = max(self.min_start, frame_idx - self.pre_roll)
+                self._reset()
+            else:
+                return None
+
+        if heights is not None:
+            if heights[1] > self.peak_height:
+                self.peak_height = heights[1]
+                self.peak_frame = frame_idx
+            self.rest_run = self.rest_run + 1 if max(heights) <= REST_HEIGHT else 0
+
+        if (
+            self.rest_run >= self.rest_frames
+            or frame_idx + 1 - self.start_frame >= self.max_frames
+        ):
+            return self._close(frame_idx + 1)
+        return None
+
+    def finish(self):
+        """Close the serve still open at the end of the video, if any."""
+        if not self.open:
+            return None
+        return self._close(self.last_frame + 1)
+
+    def _close(self, end_frame):
+        segment = None
+        if self.peak_height >= HIT_HEIGHT:
+            segment = ServeSegment(self.start_frame, end_frame, self.peak_frame)
+        self.start_frame = None
+        self.min_start = end_frame
+        return segment
+
+
+class ServeCollector:
+    """Segment a video into serves and detect the key moments of each.
+
+    Frames are added in order as they are analyzed. Only the frames of the
+    serve being followed (or the pre-roll while waiting for one) are
+    buffered, and each serve's key moments are detected as soon as it
+    closes, so memory stays bounded for sessions of any length.
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.segmenter = ServeSegmenter(fps)
+        self.buffer = deque()
+        self.serves = []
+
+    @property
+    def open_serve(self):
+        """Number of the serve open at the last frame added, or None."""
+        return len(self.serves) + 1 if self.segmenter.open else None
+
+    def add(self, frame_idx, pose_result, balls, rackets):
+        """Add one analyzed frame; returns the serves it completed."""
+        self.buffer.append((frame_idx, pose_result, balls, rackets))
+        segment = self.segmenter.update(frame_idx, arm_heights(pose_result, rackets))
+        completed = [self._complete(segment)] if segment is not None else []
+
+        keep_from = self.segmenter.keep_from()
+        while self.buffer and self.buffer[0][0] < keep_from:
+            self.buffer.popleft()
+        return completed
+
+    def finish(self):
+        """Complete the serve still open at the end; returns the new serves."""
+        segment = self.segmenter.finish()
+        completed = [self._complete(segment)] if segment is not None else []
+        self.buffer.clear()
+        return completed
+
+    def _complete(self, segment):
+        frames = [
+            item
+            for item in self.buffer
+            if segment.start_frame <= item[0] < segment.end_frame
+        ]
+        serve = segment.to_dict(self.fps)
+        serve["serve"] = len(self.serves) + 1
+        serve["key_moments"] = self._detect_moments(segment.start_frame, frames)
+        self.serves.append(serve)
+        print(
+            f"Serve {serve['serve']}: frames {segment.start_frame}-{segment.end_frame}, "
+            f"{len(serve['key_moments'])} key moments"
+        )
+        return serve
+
+    def _detect_moments(self, start_frame, frames):
+        """Run the serve phase detector on one serve's frames.
+
+        The detector puts the start position on the first frame it is
+        given, so frames before the first confident pose are left out.
+        """
+        valid = _first_person_arrays([item[1] for item in frames])[0]
+        if valid.any():
+            frames = frames[int(np.argmax(valid)) :]
+            start_frame = frames[0][0]
+        pose_results = []
+        ball_detections = []
+        racket_detections = []
+        for frame_idx, pose_result, balls, rackets in frames:
+            pose_results.append(pose_result)
+            ball_detections.extend(_rebase(balls, start_frame))
+            racket_detections.extend(_rebase(rackets, start_frame))
+
+        key_moments = detect_key_moments(
+            pose_results, ball_detections, racket_detections, fps=self.fps, verbose=False
+        )
+        for moment in key_moments:
+            moment["frame"] = int(moment["frame"] + start_frame)
+            moment["timestamp"] = float(moment["frame"] / self.fps)
+            moment["serve"] = len(self.serves) + 1
+        return key_moments
+
+
+def _rebase(detections, start_frame):
+    return [dict(d, frame=d["frame"] - start_frame) for d in detections]
+
+
+def segment_serves(pose_results, ball_detections, racket_detections, fps):
+    """Segment a fully analyzed video into serves with their key moments."""
+    balls = {}
+    for ball in ball_detections:
+        balls.setdefault(ball["frame"], []).append(ball)
+    rackets = {}
+    for racket in racket_detections:
+        rackets.setdefault(racket["frame"], []).append(racket)
+
+    collector = ServeCollector(fps)
+    for frame_idx, pose_result in enumerate(pose_results):
+        collector.add(
+            frame_idx,
+            pose_result,
+            balls.get(frame_idx, []),
+            rackets.get(frame_idx, []),
+        )
+    collector.finish()
+    return collector.serves
@@ -0,0 +1,296 @@
+import io
+import os
+import struct
+import threading
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+# Bytes copied from a request body to disk at a time
+COPY_BUFFER_SIZE = 1 << 20
+
+
+class UploadError(Exception):
+    """Raised when an upload chunk or session request is invalid."""
+
+
+class UploadOffsetError(UploadError):
+    """Raised when a chunk does not start where the upload currently ends."""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload continues at byte {offset}")
+        self.offset = offset
+
+
+class UploadSession:
+    """A video uploaded in chunks that can be read while it grows.
+
+    Chunks are appended in order at ``offset`` and written straight to disk.
+    The top-level MP4 boxes are followed as bytes arrive: when ``moov``
+    precedes ``mdat`` (a "faststart" file) the video becomes decodable as
+    soon as ``moov`` is complete, with ``reader()`` blocking for the frames
+    that have not arrived yet. Other files are only read once complete.
+    """
+
+    def __init__(self, upload_dir, filename, size):
+        self.id = uuid.uuid4().hex
+        self.filename = secure_filename(filename)
+        self.path = os.path.join(upload_dir, f"{self.id}_{self.filename}")
+        self.size = size
+        self.received = 0
+        self.complete = False
+        self.failed = False
+        self.claimed = False
+        self.layout = None
+        self.updated_at = time.time()
+        self._next_box = 0
+        self._moov_end = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        open(self.path, "wb").close()
+
+    @property
+    def streamable(self):
+        """Whether decoding can start before the upload completes."""
+        return self.layout == "faststart" and self.received >= self._moov_end
+
+    def write(self, offset, stream, length=None):
+        """Append the bytes of ``stream`` at ``offset``; returns the new end."""
+        if not self._write_lock.acquire(blocking=False):
+            raise UploadOffsetError(self.received)
+        try:
+            if self.failed:
+                raise UploadError("Upload was cancelled")
+            if offset != self.received:
+                raise UploadOffsetError(self.received)
+            if length is not None and offset + length > self.size:
+                raise UploadError(f"Chunk ends past the upload size of {self.size} bytes")
+            with open(self.path, "r+b") as f:
+                f.seek(offset)
+                for chunk in iter(lambda: stream.read(COPY_BUFFER_SIZE), b""):
+                    if self.failed:
+                        raise UploadError("Upload was cancelled")
+                    if self.received + len(chunk) > self.size:
+                        raise UploadError(
+                            f"Chunk ends past the upload size of {self.size} bytes"
+                        )
+                    f.write(chunk)
+                    f.flush()
+                    self._advance(len(chunk))
+            return self.received
+        finally:
+            self._write_lock.release()
+
+    def _advance(self, count):
+        with self._cond:
+            self.received += count
+            self.updated_at = time.time()
+            if self.layout is None:
+                self._scan_boxes()
+            if self.received == self.size:
+                self.complete = True
+            self._cond.notify_all()
+
+    def _scan_boxes(self):
+        """Follow top-level MP4 boxes up to the received bytes to find
+        whether ``moov`` comes before ``mdat``."""
+        with open(self.path, "rb") as f:
+            while self.layout is None and self._next_box + 16 <= self.received:
+                f.seek(self._next_box)
+                size, kind = struct.unpack(">I4s", f.read(8))
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                elif size == 0:
+                    size = self.size - self._next_box
+                if size < 8 or not kind.isalnum():
+                    self.layout = "unknown"
+                elif kind == b"moov":
+                    self.layout = "faststart"
+                    self._moov_end = self._next_box + size
+                elif kind == b"mdat":
+                    self.layout = "trailing"
+                self._next_box += size
+
+    def wait_for(self, offset, timeout=None):
+        """Block until ``offset`` bytes arrived or the upload ended; returns
+        the bytes received so far."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self.received >= offset or self.complete or self.failed, timeout
+            )
+            return self.received
+
+    def wait_until_streamable(self, timeout=None):
+        """Block until the video can be decoded as it arrives (True) or it
+        turns out it cannot be (False)."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self.streamable
+                or self.complete
+                or self.failed
+                or self.layout not in (None, "faststart"),
+                timeout,
+            )
+            return self.streamable and not self.complete and not self.failed
+
+    def wait_until_complete(self, timeout=None):
+        """Block until every byte arrived; raises IOError if the upload
+        was cancelled or stalled for ``timeout`` seconds."""
+        with self._cond:
+            while not self.complete:
+                received = self.received
+                self._cond.wait_for(
+                    lambda: self.complete or self.failed or self.received > received,
+                    timeout,
+                )
+                if self.failed or self.received == received and not self.complete:
+                    raise IOError(f"Upload of {self.filename} did not complete")
+
+    def reader(self, timeout=None):
+        """A file object over the upload that blocks for bytes not yet received."""
+        return UploadReader(self, timeout)
+
+    def abort(self):
+        """Cancel the upload and wake up anyone waiting on it."""
+        with self._cond:
+            self.failed = True
+            self._cond.notify_all()
+
+    def to_dict(self):
+        return {
+            "upload_id": self.id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.received,
+            "complete": self.complete,
+            "layout": self.layout,
+            "streamable": self.streamable,
+        }
+
+
+class UploadReader(io.BufferedIOBase):
+    """Seekable reader of an UploadSession for OpenCV's stream capture.
+
+    Reads past the received bytes block until more arrive; if nothing
+    arrives for ``timeout`` seconds or the upload is cancelled the stream
+    ends early and ``truncated`` is set.
+    """
+
+    def __init__(self, session, timeout=None):
+        super().__init__()
+        self.session = session
+        self.timeout = timeout
+        self._file = open(session.path, "rb")
+        self._pos = 0
+
+    @property
+    def truncated(self):
+        return not self.session.complete or self.session.failed
+
+    def read(self, size=-1):
+        if self._pos >= self.session.size:
+            return b""
+        received = self.session.wait_for(self._pos + 1, self.timeout)
+        if received <= self._pos:
+            return b""
+        if size is None or size < 0:
+            size = received - self._pos
+        self._file.seek(self._pos)
+        data = self._file.read(min(size, received - self._pos))
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.session.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class UploadManager:
+    """Chunked upload sessions under ``upload_dir``.
+
+    Sessions without a new chunk for ``ttl`` seconds are cancelled; their
+    files are deleted unless an analysis job claimed them, in which case
+    the job cleans up. Complete claimed sessions are handed over entirely.
+    """
+
+    def __init__(self, upload_dir, max_bytes, ttl):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename, size):
+        """Start a session for a ``size`` byte upload of ``filename``."""
+        if size <= 0:
+            raise UploadError("Upload size must be positive")
+        if size > self.max_bytes:
+            raise UploadError(
+                f"Upload of {size} bytes exceeds the limit of {self.max_bytes} bytes"
+            )
+        os.makedirs(self.upload_dir, exist_ok=True)
+        session = UploadSession(self.upload_dir, filename, size)
+        with self._lock:
+            self._prune()
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            self._prune()
+            return self._sessions.get(upload_id)
+
+    def claim(self, upload_id):
+        """Hand a session over to an analysis job; returns None if unknown
+        or already claimed."""
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None or session.claimed or session.failed:
+                return None
+            session.claimed = True
+            return session
+
+    def release(self, session):
+        """Undo ``claim`` when the job could not be queued."""
+        with self._lock:
+            session.claimed = False
+
+    def discard(self, upload_id):
+        """Cancel a session and delete its file unless a job claimed it."""
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is not None:
+            self._close(session)
+
+    def _close(self, session):
+        session.abort()
+        if not session.claimed and os.path.exists(session.path):
+            os.remove(session.path)
+
+    def _prune(self):
+        now = time.time()
+        for upload_id, session in list(self._sessions.items()):
+            if session.failed or (session.complete and session.claimed):
+                del self._sessions[upload_id]
+            elif now - session.updated_at > self.ttl:
+                print(f"Discarding stalled upload {upload_id}")
+                del self._sessions[upload_id]
+                self._close(session)
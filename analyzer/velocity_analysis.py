@@ -1,9 +1,12 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from mmpose.apis import MMPoseInferencer
 import os
 import cv2
 import json
+from decimation import lttb_indices
+from key_moment_detector import RIGHT_WRIST
+from kinematics import compute_kinematics
+from pose_store import pose_results_to_arrays
 
 
 def convert_numpy_types(obj):
@@ -29,49 +32,24 @@ def get_video_fps(video_path):
     return fps
 
 
-def calculate_velocity_and_acceleration(keypoints, fps):
+def calculate_velocity_and_acceleration(keypoints, fps, joint=RIGHT_WRIST):
     """
-    Calculate velocity and acceleration of the right hand.
-    Returns: time, velocity, acceleration
+    Calculate velocity and acceleration of a joint (the right wrist by default).
+    Returns: time, velocity, acceleration, one row per frame, NaN where the
+    joint was not seen. Velocity is in torso lengths per second (see kinematics.py).
     """
-    # Right wrist index in MMPose keypoints
-    RIGHT_WRIST = 10
-
-    # Extract right wrist positions
-    positions = []
-    for frame in keypoints:
-        if frame and "predictions" in frame and frame["predictions"]:
-            person = frame["predictions"][0][0]
-            if "keypoints" in person:
-                # Get x,y coordinates
-                wrist_pos = person["keypoints"][RIGHT_WRIST][:2]
-                positions.append(wrist_pos)
-            else:
-                positions.append(None)
-        else:
-            positions.append(None)
-
-    # Convert to numpy array and handle None values
-    positions = np.array(positions)
-    valid_frames = ~np.isnan(positions[:, 0])
-    positions = positions[valid_frames]
-
-    # Calculate time points
-    time = np.arange(len(positions)) / fps
-
-    # Calculate velocity (first derivative of position)
-    velocity = np.zeros_like(positions)
-    velocity[1:] = (positions[1:] - positions[:-1]) * fps
-
-    # Calculate acceleration (second derivative of position)
-    acceleration = np.zeros_like(positions)
-    acceleration[1:] = (velocity[1:] - velocity[:-1]) * fps
-
-    return time, velocity, acceleration
+    kinematics = compute_kinematics(pose_results_to_arrays(keypoints)["keypoints"], fps)
+    time = np.arange(len(kinematics["velocity"])) / fps
+    return time, kinematics["velocity"][:, joint], kinematics["acceleration"][:, joint]
 
 
 def create_plots(time, velocity, acceleration, video_title, output_path):
-    """Create and save velocity/acceleration plots."""
+    """Create and save velocity/acceleration plots.
+
+    The server charts /api/kinematics instead; Matplotlib is only needed here.
+    """
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(15, 10))
 
     # Plot velocity
@@ -80,12 +58,12 @@ def create_plots(time, velocity, acceleration, video_title, output_path):
     plt.plot(time, velocity[:, 1], label="Y velocity", color="red")
     plt.title(f"Right Hand Velocity - {video_title}")
     plt.xlabel("Time (seconds)")
-    plt.ylabel("Velocity (pixels/second)")
+    plt.ylabel("Velocity (torso lengths/second)")
     plt.legend()
     plt.grid(True)
 
     # Set x-axis ticks every 0.5 seconds
-    max_time = np.ceil(time[-1])
+    max_time = np.ceil(time[-1]) if len(time) else 0
     plt.xticks(np.arange(0, max_time + 0.5, 0.5))
 
     # Plot acceleration
@@ -94,7 +72,7 @@ def create_plots(time, velocity, acceleration, video_title, output_path):
     plt.plot(time, acceleration[:, 1], label="Y acceleration", color="red")
     plt.title(f"Right Hand Acceleration - {video_title}")
     plt.xlabel("Time (seconds)")
-    plt.ylabel("Acceleration (pixels/second²)")
+    plt.ylabel("Acceleration (torso lengths/second²)")
     plt.legend()
     plt.grid(True)
 
@@ -107,8 +85,26 @@ def create_plots(time, velocity, acceleration, video_title, output_path):
     plt.close()
 
 
-def analyze_video(video_path, output_dir, json_path=None):
-    """Analyze video and plot velocity/acceleration."""
+def velocity_series(time, velocity, acceleration, points=1000):
+    """Velocity and acceleration components decimated for charting, in the
+    layout of /api/kinematics."""
+    series = {}
+    for name, values in (("velocity", velocity), ("acceleration", acceleration)):
+        for axis, column in (("x", 0), ("y", 1)):
+            samples = lttb_indices(values[:, column], points)
+            series[f"{name}_{axis}"] = {
+                "times": np.round(time[samples], 3).tolist(),
+                "values": [
+                    None if np.isnan(value) else round(value, 3)
+                    for value in values[samples, column].tolist()
+                ],
+            }
+    return series
+
+
+def analyze_video(video_path, output_dir, json_path=None, plot=False):
+    """Analyze video and save its velocity/acceleration series, or plot
+    them with ``plot``."""
     # Get video title and FPS
     video_title = os.path.splitext(os.path.basename(video_path))[0]
     fps = get_video_fps(video_path)
@@ -141,6 +137,13 @@ def analyze_video(video_path, output_dir, json_path=None):
     # Calculate velocity and acceleration
     time, velocity, acceleration = calculate_velocity_and_acceleration(all_results, fps)
 
+    if not plot:
+        series_path = os.path.join(output_dir, "velocity_analysis.json")
+        with open(series_path, "w") as f:
+            json.dump(velocity_series(time, velocity, acceleration), f)
+        print(f"Analysis complete. Series saved to: {series_path}")
+        return series_path
+
     # Create and save plots
     plot_path = os.path.join(output_dir, "velocity_analysis.png")
     create_plots(time, velocity, acceleration, video_title, plot_path)
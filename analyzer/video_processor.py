@@ -2,22 +2,140 @@ import os
 import cv2
 import numpy as np
 import shutil
+import itertools
 import json
-from ultralytics import YOLO
-from mmpose.apis import MMPoseInferencer
-from key_moment_detector import detect_key_moments
-
-YOLO_MODEL = "yolov9e.pt"
+import threading
+from contextlib import contextmanager
+import config
+from adaptive_sampling import AdaptiveSampler, GapFiller
+from frame_pipeline import (
+    STREAM_CAPTURE,
+    FramePipeline,
+    VideoSource,
+    normalize_rotation,
+    video_rotation,
+)
+from key_moment_detector import OnlineKeyMomentDetector, detect_key_moments
+from kinematics import pose_store_kinematics
+from metrics import AnalysisMetrics
+from model_pool import ModelSet
+from pose_store import (
+    PoseStore,
+    PoseStoreWriter,
+    copy_pose_store,
+    pose_results_to_arrays,
+    pose_store_path,
+    save_pose_store,
+)
+from renderer import draw_detections, draw_pose, open_video_writer
+from roi import RoiTracker, crop, offset_pose_result
+from serve_segmentation import ServeCollector, segment_serves
+
+# Report per-frame progress at most once every this many frames
+PROGRESS_INTERVAL = 10
+
+# COCO classes tracked by YOLO
+PERSON_CLASS = 0
+BALL_CLASS = 32
+RACKET_CLASS = 38
+# Balls and rackets kept per frame (1 ball + 1 racket)
+MAX_OBJECT_DETECTIONS = 2
+# People YOLO may add per frame when it provides the pose model's boxes,
+# and the score a person box needs to be posed
+MAX_PERSON_DETECTIONS = 10
+PERSON_BBOX_THR = 0.3
+
+
+def _no_progress(stage, fraction):
+    pass
+
+
+def _no_moment(moment):
+    pass
+
+
+def _report_frames(progress, stage, done, total):
+    """Report frame-level progress of a stage every PROGRESS_INTERVAL frames."""
+    if total > 0 and done % PROGRESS_INTERVAL == 0:
+        progress(stage, done / total)
+
+
+def _person_bboxes(result, roi=None):
+    """``(N, 5)`` boxes and scores of the people in a YOLO result, in frame coordinates."""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    boxes = result.boxes.xyxy.cpu().numpy()
+    confs = result.boxes.conf.cpu().numpy()
+    classes = result.boxes.cls.cpu().numpy()
+    keep = (classes == PERSON_CLASS) & (confs >= PERSON_BBOX_THR)
+    bboxes = np.concatenate([boxes[keep], confs[keep, None]], axis=1).astype(np.float32)
+    if roi is not None:
+        bboxes[:, :4] += [roi[0], roi[1], roi[0], roi[1]]
+    return bboxes
+
+
+def _collect_pose_results(results, progress, total_frames):
+    """Split MMPoseInferencer results, which hold a batch of frames each,
+    into one pose result per frame."""
+    pose_results = []
+    for result in results:
+        for prediction in result["predictions"]:
+            pose_results.append({"predictions": [prediction]})
+            _report_frames(progress, "pose", len(pose_results), total_frames)
+    return pose_results
+
+
+def _batched(items, size):
+    """Group an iterable into lists of up to ``size`` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _group_by_frame(detections):
+    """Map frame index to the detections of that frame."""
+    lookup = {}
+    for detection in detections:
+        lookup.setdefault(detection["frame"], []).append(detection)
+    return lookup
 
 
 class VideoProcessor:
     """A class to process videos for pose estimation, ball detection, and key moment detection."""
 
-    def __init__(self, device="cuda:0"):
-        """Initialize the video processor with required models."""
-        self.device = device
-        self.pose_inferencer = MMPoseInferencer("human", device=device)
-        self.yolo_model = YOLO(YOLO_MODEL)
+    def __init__(self, device="cuda:0", model_pool=None, result_cache=None):
+        """Initialize the video processor.
+
+        When a ``model_pool`` is given, models are borrowed from it for the
+        inference stages of each video instead of being loaded here. With a
+        ``result_cache``, videos analyzed before are restored from it.
+        """
+        self.device = model_pool.device if model_pool is not None else device
+        self.model_pool = model_pool
+        self.result_cache = result_cache
+        self._models = None
+        self._models_lock = threading.Lock()
+
+    @contextmanager
+    def borrow_models(self):
+        """Yield a ModelSet, from the pool if there is one.
+
+        Models are only held for the duration of the ``with`` block, so
+        concurrent ``process_video`` calls can share a processor.
+        """
+        if self.model_pool is not None:
+            with self.model_pool.acquire() as models:
+                yield models
+        else:
+            with self._models_lock:
+                if self._models is None:
+                    self._models = ModelSet(self.device)
+                yield self._models
 
     def get_video_fps(self, video_path):
         """Get the FPS of a video file."""
@@ -47,7 +165,7 @@ class VideoProcessor:
         # Try to use FFMPEG if available for better compatibility
         try:
             import subprocess
-            ffmpeg_cmd = f'ffmpeg -i "{input_path}" -pix_fmt yuv420p -c:v libx264 -profile:v baseline -level 3.0 -preset medium -crf 23 -movflags +faststart -y "{output_path}"'
+            ffmpeg_cmd = f'ffmpeg -i "{input_path}" -pix_fmt yuv420p -c:v libx264 -profile:v baseline -level 3.0 -preset {config.ENCODE_PRESET} -crf {config.ENCODE_CRF} -movflags +faststart -y "{output_path}"'
             print(f"Attempting to use FFMPEG: {ffmpeg_cmd}")
             result = subprocess.run(
                 ffmpeg_cmd, shell=True, capture_output=True, text=True
@@ -107,246 +225,908 @@ class VideoProcessor:
         else:
             print("WARNING: All encoding attempts failed")
 
-    def detect_objects(self, video_path, fps):
-        """Detect ball and racket in the video."""
-        print("Processing ball and racket detection...")
-        results = self.yolo_model.track(
-            source=video_path,
+    def _tracking_options(self, device=None):
+        """YOLO tracking arguments shared by the file and the frame pipelines,
+        on ``device`` (the processor's by default)."""
+        classes = [BALL_CLASS, RACKET_CLASS]
+        max_det = MAX_OBJECT_DETECTIONS
+        if config.PERSON_DETECTOR == "yolo":
+            # People too, whose boxes then feed pose estimation
+            classes = [PERSON_CLASS] + classes
+            max_det += MAX_PERSON_DETECTIONS
+        return dict(
+            device=device or self.device,
             save=False,
-            classes=[32, 38],  # Tennis ball (32) and racket (38) classes
+            classes=classes,
             conf=0.20,  # Slightly lower threshold to catch more objects
             iou=0.45,  # Intersection over Union threshold
-            max_det=2,  # Maximum detections per frame (1 ball + 1 racket)
+            max_det=max_det,
             tracker="bytetrack.yaml",
-            stream=True,  # Enable streaming mode
             verbose=False,  # Disable progress messages
         )
 
+    def detect_objects(
+        self,
+        yolo_model,
+        video_path,
+        fps,
+        progress=_no_progress,
+        total_frames=0,
+        device=None,
+        rotation=0,
+    ):
+        """Detect ball and racket in the video.
+
+        Returns ``(ball_detections, racket_detections, person_bboxes)``, with
+        the person boxes of every frame when YOLO provides them to pose
+        estimation (ANALYZER_PERSON_DETECTOR=yolo) and None otherwise.
+        With a ``rotation``, frames are rotated as they are decoded and
+        tracked one at a time.
+        """
+        print("Processing ball and racket detection...")
+        if rotation:
+            source = VideoSource(video_path, rotation=rotation)
+            results = (
+                yolo_model.track(
+                    frame,
+                    persist=frame_idx > 0,  # Start fresh trackers on the first frame
+                    **self._tracking_options(device),
+                )[0]
+                for frame_idx, frame in source.frames()
+            )
+        else:
+            results = yolo_model.track(
+                source=video_path,
+                stream=True,  # Enable streaming mode
+                **self._tracking_options(device),
+            )
+
         ball_detections = []
         racket_detections = []
+        person_bboxes = [] if config.PERSON_DETECTOR == "yolo" else None
         frame_idx = 0
 
         for result in results:
-            if result.boxes is not None and len(result.boxes) > 0:
-                boxes = result.boxes.xyxy.cpu().numpy()
-                track_ids = result.boxes.id
-                confs = result.boxes.conf.cpu().numpy()
-                classes = result.boxes.cls.cpu().numpy()
-
-                ball_count = 0
-                racket_count = 0
-                for i, box in enumerate(boxes):
-                    x1, y1, x2, y2 = box.astype(int)
-                    track_id = (
-                        int(track_ids[i].item()) if track_ids is not None else None
-                    )
-                    conf = float(confs[i])
-                    class_id = int(classes[i])
-
-                    detection = {
-                        "frame": int(frame_idx),
-                        "timestamp": float(frame_idx / fps),
-                        "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                        "track_id": track_id,
-                        "confidence": conf,
-                    }
-
-                    if class_id == 32:  # Tennis ball
-                        ball_detections.append(detection)
-                        ball_count += 1
-                    elif class_id == 38:  # Tennis racket
-                        racket_detections.append(detection)
-                        racket_count += 1
-                # print(f"Found {ball_count} balls and {racket_count} rackets")
+            balls, rackets = self._parse_detections(result, frame_idx, fps)
+            ball_detections.extend(balls)
+            racket_detections.extend(rackets)
+            if person_bboxes is not None:
+                person_bboxes.append(_person_bboxes(result))
 
             frame_idx += 1
+            _report_frames(progress, "detection", frame_idx, total_frames)
+
+        progress("detection", 1.0)
 
         print(
             f"Detected {len(ball_detections)} ball instances and {len(racket_detections)} racket instances"
         )
+        return ball_detections, racket_detections, person_bboxes
+
+    def _parse_detections(self, result, frame_idx, fps, roi=None):
+        """Split one YOLO tracking result into ball and racket detections.
+
+        Boxes found on a crop are shifted back by the ``roi`` origin. People
+        are left out, and only the MAX_OBJECT_DETECTIONS most confident balls
+        and rackets are kept.
+        """
+        ball_detections = []
+        racket_detections = []
+        if result.boxes is not None and len(result.boxes) > 0:
+            boxes = result.boxes.xyxy.cpu().numpy()
+            if roi is not None:
+                boxes = boxes + np.array([roi[0], roi[1], roi[0], roi[1]])
+            track_ids = result.boxes.id
+            confs = result.boxes.conf.cpu().numpy()
+            classes = result.boxes.cls.cpu().numpy()
+
+            for i, box in enumerate(boxes):
+                class_id = int(classes[i])
+                if class_id not in (BALL_CLASS, RACKET_CLASS):
+                    continue
+                if len(ball_detections) + len(racket_detections) >= MAX_OBJECT_DETECTIONS:
+                    break
+                x1, y1, x2, y2 = box.astype(int)
+                track_id = (
+                    int(track_ids[i].item()) if track_ids is not None else None
+                )
+                conf = float(confs[i])
+
+                detection = {
+                    "frame": int(frame_idx),
+                    "timestamp": float(frame_idx / fps),
+                    "bbox": [int(x1), int(y1), int(x2), int(y2)],
+                    "track_id": track_id,
+                    "confidence": conf,
+                }
+
+                if class_id == BALL_CLASS:
+                    ball_detections.append(detection)
+                else:
+                    racket_detections.append(detection)
         return ball_detections, racket_detections
 
-    def process_video(self, video_path, output_path, temp_dir, orientation=0):
-        """Process a video and save results with pose estimation, ball detection, and key moments."""
+    def process_video(
+        self,
+        video_path,
+        output_path,
+        temp_dir,
+        orientation=0,
+        progress=None,
+        on_moment=None,
+        upload=None,
+        stats=None,
+    ):
+        """Process a video and save results with pose estimation, ball detection, and key moments.
+
+        ``progress(stage, fraction)`` is called as each stage (see jobs.STAGES) advances.
+        The streaming pipeline calls ``on_moment(moment)`` with provisional key
+        moments as soon as they are confirmed, ahead of the final ones.
+        When ``video_path`` is still being written by an uploads.UploadSession
+        ``upload``, a faststart MP4 is analyzed as it arrives and anything
+        else once the upload completes.
+        ``orientation`` rotates the frames clockwise by that many degrees as
+        they are decoded, so keypoints and boxes are found in the rotated
+        frame and no rotated copy of the video is written. It is ignored for
+        videos whose container already rotates them (see VideoSource).
+        Stage timings are added to the metrics.AnalysisMetrics ``stats``.
+        """
+        progress = progress or _no_progress
+        on_moment = on_moment or _no_moment
+        stats = stats or AnalysisMetrics()
         try:
             os.makedirs(temp_dir, exist_ok=True)
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            rotation = normalize_rotation(orientation)
+
+            stream = None
+            if upload is not None:
+                with stats.stage("upload_wait"):
+                    stream = self._upload_stream(upload)
+            if stream is None:
+                # A rotation in the container replaces the client's one
+                rotation = video_rotation(video_path, rotation)
+            if rotation:
+                print(f"Rotating frames by {rotation} degrees")
+
+            cache_key = None
+            cached = None
+            # Cache keys hash the whole file, so uploads analyzed as they
+            # arrive are only cached once complete
+            if self.result_cache is not None and stream is None:
+                with stats.stage("cache"):
+                    cache_key = self.result_cache.key_for(video_path, rotation)
+                    cached = self.result_cache.get(cache_key)
+                if cached is not None and cached.video_path is not None:
+                    print(f"Restoring cached results for {video_path}")
+                    return self._restore_cached(cached, output_path, progress, stats)
+
+            if cached is not None:
+                # Analysis is cached but the rendered video is not
+                print(f"Rendering cached results for {video_path}")
+                return self._restore_cached(
+                    cached, output_path, progress, stats, video_path, temp_dir, rotation
+                )
 
-            # Get video FPS
-            fps = self.get_video_fps(video_path)
-            
-            # Handle video orientation if needed
-            if orientation != 0:
-                print(f"Rotating video by {orientation} degrees")
-                rotated_video_path = os.path.join(temp_dir, "rotated_video.mp4")
-                self.rotate_video(video_path, rotated_video_path, orientation)
-                
-                # Verify the rotated video is valid
-                if not self.check_video_file(rotated_video_path):
-                    print("Warning: Rotated video appears to be corrupted, attempting to fix...")
-                    
-                    # Try to fix NAL unit errors first (common after rotation)
-                    temp_fixed_path = os.path.join(temp_dir, "rotated_fixed.mp4")
-                    if self.fix_nal_errors(rotated_video_path, temp_fixed_path):
-                        print("Successfully fixed NAL errors in rotated video")
-                        if self.check_video_file(temp_fixed_path):
-                            rotated_video_path = temp_fixed_path
-                        else:
-                            print("Warning: Fixed video still has issues, trying general re-encoding...")
-                            temp_reencoded_path = os.path.join(temp_dir, "rotated_reencoded.mp4")
-                            self.reencode_video(rotated_video_path, temp_reencoded_path)
-                            if self.check_video_file(temp_reencoded_path):
-                                rotated_video_path = temp_reencoded_path
-                            else:
-                                print("Warning: Could not fix rotated video, using original...")
-                                rotated_video_path = video_path
-                    else:
-                        # Try general re-encoding as fallback
-                        print("Warning: NAL error fixing failed, trying general re-encoding...")
-                        temp_reencoded_path = os.path.join(temp_dir, "rotated_reencoded.mp4")
-                        self.reencode_video(rotated_video_path, temp_reencoded_path)
-                        if self.check_video_file(temp_reencoded_path):
-                            rotated_video_path = temp_reencoded_path
-                        else:
-                            print("Warning: Could not fix rotated video, using original...")
-                            rotated_video_path = video_path
-                        
-                video_path = rotated_video_path
-
-            # Run pose detection
-            print("Processing frames with MMPose...")
+            if config.PIPELINE == "legacy":
+                analysis = self._analyze_video_files(
+                    video_path, output_path, temp_dir, progress, stats, rotation
+                )
+            else:
+                analysis = self._analyze_video_stream(
+                    video_path,
+                    output_path,
+                    temp_dir,
+                    progress,
+                    stats,
+                    on_moment,
+                    stream,
+                    rotation,
+                )
+            if analysis is None:
+                return False
+            ball_detections, racket_detections, serves, fps = analysis
+            poses_dir = pose_store_path(output_path)
+            print(f"Saved pose tracks to: {poses_dir}")
+
+            # Detect key moments
+            with stats.stage("key_moments"):
+                key_moments = self._key_moments(
+                    poses_dir, serves, ball_detections, racket_detections, fps
+                )
+            progress("key_moments", 1.0)
+
+            # Saved with the pose store, so it is cached along with it
             try:
-                result_generator = self.pose_inferencer(
-                    video_path, show=False, vis_out_dir=temp_dir, radius=4, thickness=2
+                with stats.stage("kinematics"):
+                    pose_store_kinematics(poses_dir)
+            except Exception as e:
+                print(f"Warning: Could not compute kinematics: {str(e)}")
+
+            # Save results
+            with stats.stage("save"):
+                self._save_results(
+                    output_path, key_moments, ball_detections, racket_detections, serves
                 )
 
-                # Collect pose results
-                pose_results = []
-                for result in result_generator:
-                    pose_results.append(result)
-                
-                # Count the actual results obtained
-                actual_frame_count = len(pose_results)
-                
-                # Check cap frames vs processed frames
-                cap = cv2.VideoCapture(video_path)
-                expected_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                cap.release()
-                
-                print(f"MMPose processed {actual_frame_count} frames out of {expected_frames} expected frames")
-                
-                # If we have significantly fewer frames than expected, try frame extraction
-                if actual_frame_count < expected_frames * 0.9 and expected_frames > 10:
-                    print(f"Warning: MMPose only processed {actual_frame_count}/{expected_frames} frames")
-                    print("Trying frame-by-frame extraction method...")
-                    
-                    # Extract frames for direct processing
-                    frame_paths, video_fps = self.extract_frames_for_mmpose(video_path, temp_dir)
-                    
-                    if len(frame_paths) > actual_frame_count:
-                        print(f"Successfully extracted {len(frame_paths)} frames, reprocessing with MMPose...")
-                        # Process extracted frames with MMPose
-                        result_generator = self.pose_inferencer(
-                            frame_paths, show=False, vis_out_dir=temp_dir, radius=4, thickness=2
+            if self.result_cache is not None:
+                try:
+                    with stats.stage("cache"):
+                        if cache_key is None:
+                            cache_key = self.result_cache.key_for(
+                                video_path, video_rotation(video_path, rotation)
+                            )
+                        self.result_cache.put(
+                            cache_key,
+                            poses_dir,
+                            ball_detections,
+                            racket_detections,
+                            key_moments,
+                            serves,
+                            fps,
+                            video_path=output_path,
                         )
-                        
-                        # Collect new pose results
-                        pose_results = []
-                        for result in result_generator:
-                            pose_results.append(result)
-                            
-                        print(f"MMPose processed {len(pose_results)} frames using extraction method")
-            except Exception as e:
-                print(f"Error during MMPose processing: {str(e)}")
-                print("Trying frame-by-frame extraction as fallback...")
-                
-                # Extract frames for direct processing
-                frame_paths, video_fps = self.extract_frames_for_mmpose(video_path, temp_dir)
-                
-                if len(frame_paths) > 0:
-                    print(f"Successfully extracted {len(frame_paths)} frames, processing with MMPose...")
-                    # Process extracted frames with MMPose
-                    result_generator = self.pose_inferencer(
-                        frame_paths, show=False, vis_out_dir=temp_dir, radius=4, thickness=2
-                    )
-                    
-                    # Collect pose results
-                    pose_results = []
-                    for result in result_generator:
-                        pose_results.append(result)
-                        
-                    print(f"MMPose processed {len(pose_results)} frames using extraction fallback method")
-                else:
-                    print("Frame extraction failed, cannot proceed with pose estimation")
-                    return False
+                except Exception as e:
+                    print(f"Warning: Could not cache results: {str(e)}")
 
-            # Look for pose visualization video
-            temp_files = os.listdir(temp_dir)
-            vis_files = [f for f in temp_files if f.endswith((".mp4", ".avi"))]
+            return True
+        except Exception as e:
+            print(f"Error processing video: {str(e)}")
+            return False
 
-            if not vis_files:
-                print(f"Error: Could not find processed video in {temp_dir}")
-                return False
+    def _upload_stream(self, upload):
+        """Open ``upload`` for decoding as it arrives, or wait for it to complete.
+
+        Returns an UploadReader for a faststart MP4 analyzed by the streaming
+        pipeline, and None once the whole file is on disk otherwise or when
+        OpenCV is too old to decode from a stream.
+        """
+        timeout = config.UPLOAD_SESSION_TTL
+        if (
+            config.PIPELINE != "legacy"
+            and STREAM_CAPTURE
+            and upload.wait_until_streamable(timeout)
+        ):
+            print(f"Analyzing {upload.filename} while it is being uploaded")
+            return upload.reader(timeout)
+        print(f"Waiting for the upload of {upload.filename} to complete")
+        upload.wait_until_complete(timeout)
+        return None
+
+    def _restore_cached(
+        self, cached, output_path, progress, stats, video_path=None, temp_dir=None, rotation=0
+    ):
+        """Write the outputs of a cached analysis for ``output_path``.
+
+        The cached video is copied when there is one; otherwise the cached
+        poses and detections are drawn onto ``video_path`` again, rotated
+        by ``rotation`` degrees.
+        """
+        stats.cached = True
+        ball_detections = cached.detections("ball")
+        racket_detections = cached.detections("racket")
+        if cached.video_path is not None:
+            with stats.stage("restore"):
+                shutil.copyfile(cached.video_path, output_path)
+        else:
+            with stats.stage("render"):
+                self._render_results(
+                    video_path,
+                    output_path,
+                    temp_dir,
+                    PoseStore(cached.pose_store_dir),
+                    ball_detections,
+                    racket_detections,
+                    progress,
+                    rotation,
+                )
 
+        for stage in ("pose", "detection", "render", "encode", "key_moments"):
+            progress(stage, 1.0)
+        with stats.stage("save"):
+            self._save_results(
+                output_path,
+                cached.key_moments,
+                ball_detections,
+                racket_detections,
+                cached.serves,
+            )
+            copy_pose_store(cached.pose_store_dir, pose_store_path(output_path))
+        return True
+
+    def _render_results(
+        self,
+        video_path,
+        output_path,
+        temp_dir,
+        pose_store,
+        ball_detections,
+        racket_detections,
+        progress=_no_progress,
+        rotation=0,
+    ):
+        """Draw a video's stored poses and detections onto it and encode it."""
+        source = VideoSource(video_path, rotation=rotation)
+        total_frames = source.frame_count
+        ball_lookup = _group_by_frame(ball_detections)
+        racket_lookup = _group_by_frame(racket_detections)
+
+        encoded_path = os.path.join(temp_dir, "encoded.mp4")
+        out = open_video_writer(encoded_path, source.width, source.height, source.fps)
+        try:
+            for frame_idx, frame in source.frames():
+                if frame_idx < pose_store.frame_count:
+                    pose_result = pose_store.pose_results(frame_idx, frame_idx + 1)[0]
+                    draw_pose(frame, pose_result["predictions"][0])
+                draw_detections(
+                    frame, ball_lookup.get(frame_idx, []), racket_lookup.get(frame_idx, [])
+                )
+                out.write(frame)
+                _report_frames(progress, "render", frame_idx + 1, total_frames)
+                _report_frames(progress, "encode", frame_idx + 1, total_frames)
+        finally:
+            source.release()
+            out.close()
+
+        os.replace(encoded_path, output_path)
+        print(f"Saved processed video to: {output_path}")
+
+    def _analyze_video_files(
+        self, video_path, output_path, temp_dir, progress, stats, rotation=0
+    ):
+        """Analyze a video with whole-file passes of each model.
+
+        MMPose and YOLO each read the video on their own, and the pose
+        visualisation MMPose writes is decoded again to draw detections.
+        With a ``rotation`` both models get frames rotated as they are
+        decoded instead, and the poses are drawn onto the rotated frames.
+        Returns ``(ball_detections, racket_detections, serves, fps)``, or
+        None on failure.
+        """
+        # Get video FPS
+        fps = self.get_video_fps(video_path)
+
+        # Get total frame count for the video
+        cap = cv2.VideoCapture(video_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        print(f"Total frames in video: {total_frames}")
+
+        with self.borrow_models() as models:
+            # Detect balls and rackets (and people, when their boxes feed MMPose)
+            with stats.stage("detection", total_frames):
+                ball_detections, racket_detections, person_bboxes = self.detect_objects(
+                    models.yolo_model,
+                    video_path,
+                    fps,
+                    progress,
+                    total_frames,
+                    models.device,
+                    rotation,
+                )
+
+            with stats.stage("pose", total_frames):
+                pose_results = self.estimate_poses(
+                    models.pose_inferencer,
+                    video_path,
+                    temp_dir,
+                    progress,
+                    total_frames,
+                    person_bboxes,
+                    rotation,
+                )
+            if pose_results is None:
+                return None
+
+        # Look for pose visualization video
+        temp_files = os.listdir(temp_dir)
+        vis_files = [f for f in temp_files if f.endswith((".mp4", ".avi"))]
+
+        if vis_files:
             # Get pose visualization video path
             temp_video_path = os.path.join(temp_dir, vis_files[0])
-            
-            # Get total frame count for the video
-            cap = cv2.VideoCapture(video_path)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            cap.release()
-            print(f"Total frames in video: {total_frames}")
-            
-            # Detect balls and rackets
-            ball_detections, racket_detections = self.detect_objects(video_path, fps)
-
-            # Add detection boxes for debugging
-            print("Adding ball and racket detection boxes for debugging...")
-            debug_video_path = os.path.join(temp_dir, "debug_detections.mp4")
+            drawn_poses = None
+            drawn_rotation = 0
+        else:
+            # Poses estimated on decoded frames have no visualization, so
+            # draw them onto the original video
+            print(f"No pose visualization in {temp_dir}, drawing poses onto the video")
+            temp_video_path = video_path
+            drawn_poses = pose_results
+            drawn_rotation = rotation
+
+        # Add detection boxes for debugging
+        print("Adding ball and racket detection boxes for debugging...")
+        debug_video_path = os.path.join(temp_dir, "debug_detections.mp4")
+        with stats.stage("render", total_frames):
             self._add_detection_boxes(
                 temp_video_path,
                 debug_video_path,
                 ball_detections,
                 racket_detections,
                 fps,
+                progress,
+                total_frames,
+                drawn_poses,
+                drawn_rotation,
             )
 
-            # Create a temporary file for re-encoding
-            temp_output = os.path.join(temp_dir, "temp_output.mp4")
+        with stats.stage("encode", total_frames):
+            self._encode_output(
+                debug_video_path, output_path, temp_dir, progress, temp_video_path
+            )
 
-            # Re-encode the video to ensure compatibility
-            self.reencode_video(debug_video_path, temp_output)
+        with stats.stage("save"):
+            save_pose_store(
+                pose_store_path(output_path), pose_results_to_arrays(pose_results), fps
+            )
+        with stats.stage("segmentation"):
+            serves = segment_serves(pose_results, ball_detections, racket_detections, fps)
+        return ball_detections, racket_detections, serves, fps
+
+    def _analyze_video_stream(
+        self,
+        video_path,
+        output_path,
+        temp_dir,
+        progress,
+        stats,
+        on_moment=_no_moment,
+        stream=None,
+        rotation=0,
+    ):
+        """Analyze a video in a single decode pass.
+
+        Each decoded frame is handed to the pose and the detection stage
+        through bounded queues (see _inference_stream). The renderer joins
+        their per-frame results back together in frame order, filling in
+        frames skipped by adaptive sampling, draws skeletons and boxes onto the
+        original frame and pipes it straight into the H.264 encoder, so no
+        intermediate video is written or decoded again. Poses are written to
+        the pose store and serves segmented as frames go by, so only the
+        frames of the current serve are held in memory. Key moments found
+        online along the way are passed to ``on_moment``. Frames are rotated
+        by ``rotation`` degrees as they are decoded.
+        Returns ``(ball_detections, racket_detections, serves, fps)``.
+        """
+        source = VideoSource(video_path, stream, rotation)
+        fps = source.fps
+        total_frames = source.frame_count
+        print(f"Total frames in video: {total_frames}")
+
+        # Encode next to the output and move it into place once complete
+        encoded_path = os.path.join(temp_dir, "encoded.mp4")
+        out = open_video_writer(encoded_path, source.width, source.height, fps)
+        poses = PoseStoreWriter(pose_store_path(output_path), fps)
+        serves = ServeCollector(fps)
+        online_moments = OnlineKeyMomentDetector(fps)
+
+        sampler = None
+        if config.SAMPLING == "adaptive":
+            sampler = AdaptiveSampler(
+                config.SAMPLING_MAX_STRIDE, config.SAMPLING_MOTION_THRESHOLD
+            )
+        gaps = GapFiller(fps)
+        roi_tracker = None
+        if config.ROI:
+            roi_tracker = RoiTracker(
+                source.width,
+                source.height,
+                config.ROI_REACQUIRE_FRAMES,
+                full_frame_pose=config.PERSON_DETECTOR == "yolo",
+            )
 
-            # Check if temp output is valid before copying
-            if not self.check_video_file(temp_output):
-                print("Warning: Re-encoded video may be invalid. Using original file.")
-                shutil.copy2(temp_video_path, output_path)
-            else:
-                shutil.copy2(temp_output, output_path)
+        frames_done = 0
+        ball_detections = []
+        racket_detections = []
 
-            # Clean up temporary files
-            try:
-                os.remove(temp_output)
-            except Exception:
-                pass
+        def render(frame_idx, frame, pose_result, detections):
+            nonlocal frames_done
+            balls, rackets = detections
+            with stats.stage("segmentation", 1):
+                poses.append(pose_result)
+                serves.add(frame_idx, pose_result, balls, rackets)
+                for moment in online_moments.update(
+                    frame_idx, pose_result, balls, rackets, serves.open_serve
+                ):
+                    on_moment(moment)
+            ball_detections.extend(balls)
+            racket_detections.extend(rackets)
+            frames_done += 1
+
+            # Every stage is done with the frame, so draw on it in place
+            with stats.stage("render", 1):
+                draw_pose(frame, pose_result["predictions"][0])
+                draw_detections(frame, balls, rackets)
+            with stats.stage("encode", 1):
+                out.write(frame)
+            _report_frames(progress, "render", frames_done, total_frames)
+            _report_frames(progress, "encode", frames_done, total_frames)
 
-            # Detect key moments
-            key_moments = detect_key_moments(
-                pose_results, ball_detections, racket_detections, fps=fps
+        try:
+            with self.borrow_models() as models, FramePipeline(
+                config.PIPELINE_QUEUE_SIZE
+            ) as pipeline:
+                stats.watch(pipeline)
+                results = self._inference_stream(
+                    pipeline,
+                    models,
+                    source,
+                    fps,
+                    progress,
+                    stats,
+                    total_frames,
+                    sampler,
+                    roi_tracker,
+                )
+                print("Processing frames with MMPose and YOLO...")
+                progress("encode", 0.0)
+                for result in results:
+                    for item in gaps.add(*result):
+                        render(*item)
+                for item in gaps.finish():
+                    render(*item)
+            serves.finish()
+            for moment in online_moments.finish():
+                on_moment(moment)
+            with stats.stage("save"):
+                poses.close()
+        finally:
+            source.release()
+            with stats.stage("encode"):
+                out.close()
+            poses.abort()
+
+        if sampler is not None:
+            print(f"Adaptive sampling inferred {sampler.inferred} of {frames_done} frames")
+        if roi_tracker is not None:
+            print(f"ROI cropping kept {roi_tracker.pixel_ratio():.1%} of the pixels")
+        os.replace(encoded_path, output_path)
+        progress("pose", 1.0)
+        progress("detection", 1.0)
+        progress("render", 1.0)
+        progress("encode", 1.0)
+        print(
+            f"Processed {frames_done} frames with {source.frames_decoded} decoded, "
+            f"detected {len(ball_detections)} ball instances and {len(racket_detections)} racket instances"
+        )
+        print(f"Saved processed video to: {output_path}")
+        return ball_detections, racket_detections, serves.serves, fps
+
+    def _inference_stream(
+        self,
+        pipeline,
+        models,
+        source,
+        fps,
+        progress,
+        stats,
+        total_frames,
+        sampler=None,
+        roi_tracker=None,
+    ):
+        """Yield ``(frame_idx, frame, pose_result, (balls, rackets))`` per frame.
+
+        At full rate with MMPose's own person detector, the pose and the
+        detection stage each get every decoded frame and run side by side.
+        Otherwise they are chained: with an AdaptiveSampler, detection runs
+        on exactly the keyframes pose estimation picked and the results of
+        skipped frames are None; with YOLO person boxes, detection runs first
+        and hands its boxes on to pose estimation. With a RoiTracker both
+        stages only see the region around the player, and the poses found
+        move the region along.
+        """
+        yolo_persons = config.PERSON_DETECTOR == "yolo"
+        batch_size = max(1, config.POSE_BATCH_SIZE)
+
+        def regions(frame_idx):
+            if roi_tracker is None:
+                return None, None
+            return roi_tracker.region(frame_idx)
+
+        def estimate_poses(items):
+            with stats.stage("pose", len(items)):
+                pose_results = self._estimate_frame_poses(
+                    models.pose_inferencer, items, progress, total_frames
+                )
+            if roi_tracker is not None:
+                for pose_result in pose_results:
+                    roi_tracker.update(pose_result)
+            return pose_results
+
+        def detect_objects(frame_idx, frame, roi):
+            with stats.stage("detection", 1):
+                return self._detect_frame_objects(
+                    models.yolo_model, frame_idx, frame, fps, progress, total_frames, roi, models.device
+                )
+
+        decoded = stats.timed("decode", source.frames())
+
+        if sampler is None and not yolo_persons:
+            # Regions are picked on the decoding side so both stages agree.
+            # Frames are batched before the fan-out, so neither branch has to
+            # hold more than a queue of batches while the other fills one
+            frames = (
+                (frame_idx, frame, regions(frame_idx))
+                for frame_idx, frame in decoded
+            )
+            pose_batches, detection_batches = pipeline.source(
+                _batched(frames, batch_size), consumers=2, name="decode"
+            )
+            poses = pipeline.map(
+                lambda batch: list(
+                    zip(
+                        estimate_poses([(i, frame, roi[0], None) for i, frame, roi in batch]),
+                        [frame for _, frame, _ in batch],
+                    )
+                ),
+                pose_batches,
+                name="pose",
             )
+            detections = pipeline.map(
+                lambda batch: [
+                    detect_objects(i, frame, roi[1])[0] for i, frame, roi in batch
+                ],
+                detection_batches,
+                name="detection",
+            )
+            for frame_idx, ((pose_result, frame), objects) in enumerate(
+                zip(
+                    itertools.chain.from_iterable(poses),
+                    itertools.chain.from_iterable(detections),
+                )
+            ):
+                yield frame_idx, frame, pose_result, objects
+            return
+
+        # Chained stages pass along batches of one dict per frame; "regions"
+        # is None for frames adaptive sampling skips
+        def select(item):
+            frame_idx, frame = item
+            keyframe = sampler is None or sampler.should_infer(frame_idx)
+            return {
+                "frame_idx": frame_idx,
+                "frame": frame,
+                "regions": regions(frame_idx) if keyframe else None,
+                "pose_result": None,
+                "objects": None,
+                "persons": None,
+            }
+
+        def pose_stage(states):
+            keyframes = []
+            for state in states:
+                if state["regions"] is None:
+                    _report_frames(progress, "pose", state["frame_idx"] + 1, total_frames)
+                else:
+                    keyframes.append(state)
+            if not keyframes:
+                return states
+            # YOLO person boxes are in frame coordinates, so the region
+            # tracker gives the pose model the full frame to look inside them
+            pose_results = estimate_poses(
+                [
+                    (
+                        state["frame_idx"],
+                        state["frame"],
+                        state["regions"][0],
+                        state["persons"],
+                    )
+                    for state in keyframes
+                ]
+            )
+            for state, pose_result in zip(keyframes, pose_results):
+                state["pose_result"] = pose_result
+                if sampler is not None:
+                    sampler.observe_pose(state["frame_idx"], pose_result)
+            return states
+
+        def detection_stage(states):
+            for state in states:
+                frame_idx = state["frame_idx"]
+                if state["regions"] is None:
+                    _report_frames(progress, "detection", frame_idx + 1, total_frames)
+                    continue
+                state["objects"], state["persons"] = detect_objects(
+                    frame_idx, state["frame"], state["regions"][1]
+                )
+                if sampler is not None:
+                    sampler.observe_balls(frame_idx, state["objects"][0])
+            return states
 
-            # Save results
-            self._save_results(
-                output_path, key_moments, ball_detections, racket_detections
+        if yolo_persons:
+            stages = (("detection", detection_stage), ("pose", pose_stage))
+        else:
+            stages = (("pose", pose_stage), ("detection", detection_stage))
+        frames = pipeline.source(decoded, name="decode")[0]
+        (first_name, first), (second_name, second) = stages
+        batches = pipeline.map(
+            lambda batch: first([select(item) for item in batch]),
+            _batched(frames, batch_size),
+            name=first_name,
+        )
+        for states in pipeline.map(second, batches, name=second_name):
+            for state in states:
+                yield state["frame_idx"], state["frame"], state["pose_result"], state["objects"]
+
+    def _key_moments(self, poses_dir, serves, ball_detections, racket_detections, fps):
+        """Key moments of a single serve clip, or of every serve of a session.
+
+        Clips up to ANALYZER_SINGLE_SERVE_MAX_SECONDS with at most one serve
+        are treated as one serve from start to end; the moments of longer
+        videos are those detected per serve during segmentation.
+        """
+        store = PoseStore(poses_dir)
+        if len(serves) <= 1 and store.frame_count <= config.SINGLE_SERVE_MAX_SECONDS * fps:
+            return detect_key_moments(
+                store.pose_results(), ball_detections, racket_detections, fps=fps
             )
+        print(f"Detected {len(serves)} serves")
+        return [moment for serve in serves for moment in serve["key_moments"]]
 
-            return True
+    def _estimate_frame_poses(self, pose_inferencer, items, progress, total_frames):
+        """Estimate poses on a batch of frames, each cropped to its region.
+
+        ``items`` are ``(frame_idx, frame, roi, persons)``, with ``persons``
+        the person boxes found by YOLO to use instead of MMPose's detector,
+        or None. Returns one pose result per frame, in frame coordinates.
+        """
+        crops = [crop(frame, roi) for _, frame, roi, _ in items]
+        kwargs = {}
+        if any(persons is not None for *_, persons in items):
+            kwargs["bboxes"] = [[] if persons is None else persons for *_, persons in items]
+        predictions = []
+        for result in pose_inferencer(crops, show=False, batch_size=len(crops), **kwargs):
+            predictions.extend(result["predictions"])
+
+        pose_results = []
+        for (frame_idx, _, roi, _), prediction in zip(items, predictions):
+            pose_results.append(offset_pose_result({"predictions": [prediction]}, roi))
+            _report_frames(progress, "pose", frame_idx + 1, total_frames)
+        return pose_results
+
+    def _detect_frame_objects(
+        self, yolo_model, frame_idx, frame, fps, progress, total_frames, roi=None, device=None
+    ):
+        """Track ball and racket on one frame (or its ``roi`` crop) of a video streamed in order.
+
+        Returns ``((balls, rackets), person_bboxes)``, with None for the
+        person boxes unless YOLO provides them to pose estimation.
+        """
+        result = yolo_model.track(
+            crop(frame, roi),
+            persist=frame_idx > 0,  # Start fresh trackers on the first frame
+            **self._tracking_options(device),
+        )[0]
+        _report_frames(progress, "detection", frame_idx + 1, total_frames)
+        persons = _person_bboxes(result, roi) if config.PERSON_DETECTOR == "yolo" else None
+        return self._parse_detections(result, frame_idx, fps, roi), persons
+
+    def _encode_output(self, rendered_path, output_path, temp_dir, progress, fallback_path):
+        """Re-encode the rendered video to H.264 and move it to ``output_path``."""
+        # Create a temporary file for re-encoding
+        temp_output = os.path.join(temp_dir, "temp_output.mp4")
+
+        # Re-encode the video to ensure compatibility
+        progress("encode", 0.0)
+        self.reencode_video(rendered_path, temp_output)
+        progress("encode", 1.0)
+
+        # Check if temp output is valid before copying
+        if not self.check_video_file(temp_output):
+            print("Warning: Re-encoded video may be invalid. Using original file.")
+            shutil.copy2(fallback_path, output_path)
+        else:
+            shutil.copy2(temp_output, output_path)
+
+        # Clean up temporary files
+        try:
+            os.remove(temp_output)
+        except Exception:
+            pass
+
+    def estimate_poses(
+        self,
+        pose_inferencer,
+        video_path,
+        temp_dir,
+        progress=_no_progress,
+        total_frames=0,
+        person_bboxes=None,
+        rotation=0,
+    ):
+        """Run MMPose over a video, falling back to frames decoded by OpenCV if needed.
+
+        ``person_bboxes`` holds the person boxes of every frame when they
+        come from YOLO instead of MMPose's detector. With a ``rotation``,
+        MMPose gets frames decoded and rotated by OpenCV straight away.
+        Returns the per-frame pose results, or None if pose estimation failed.
+        """
+        print("Processing frames with MMPose...")
+        kwargs = {"batch_size": max(1, config.POSE_BATCH_SIZE)}
+        if person_bboxes is not None:
+            kwargs["bboxes"] = person_bboxes
+        if rotation:
+            pose_results = self._estimate_decoded_poses(
+                pose_inferencer, video_path, temp_dir, progress, total_frames, kwargs, rotation
+            )
+            progress("pose", 1.0)
+            return pose_results
+        try:
+            result_generator = pose_inferencer(
+                video_path, show=False, vis_out_dir=temp_dir, radius=4, thickness=2, **kwargs
+            )
+
+            # Collect pose results
+            pose_results = _collect_pose_results(result_generator, progress, total_frames)
+            
+            # Count the actual results obtained
+            actual_frame_count = len(pose_results)
+            
+            # Check cap frames vs processed frames
+            cap = cv2.VideoCapture(video_path)
+            expected_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            
+            print(f"MMPose processed {actual_frame_count} frames out of {expected_frames} expected frames")
+            
+            # If we have significantly fewer frames than expected, decode the frames ourselves
+            if actual_frame_count < expected_frames * 0.9 and expected_frames > 10:
+                print(f"Warning: MMPose only processed {actual_frame_count}/{expected_frames} frames")
+                print("Retrying with frames decoded by OpenCV...")
+                decoded_results = self._estimate_decoded_poses(
+                    pose_inferencer, video_path, temp_dir, progress, total_frames, kwargs
+                )
+                if len(decoded_results) > actual_frame_count:
+                    pose_results = decoded_results
+                    print(f"MMPose processed {len(pose_results)} frames decoded by OpenCV")
         except Exception as e:
-            print(f"Error processing video: {str(e)}")
-            return False
+            print(f"Error during MMPose processing: {str(e)}")
+            print("Retrying with frames decoded by OpenCV...")
+            try:
+                pose_results = self._estimate_decoded_poses(
+                    pose_inferencer, video_path, temp_dir, progress, total_frames, kwargs
+                )
+            except Exception as e:
+                print(f"Error decoding frames for MMPose: {str(e)}")
+                pose_results = []
+            if not pose_results:
+                print("Frame decoding failed, cannot proceed with pose estimation")
+                return None
+            print(f"MMPose processed {len(pose_results)} frames decoded by OpenCV")
+
+        progress("pose", 1.0)
+        return pose_results
+
+    def _estimate_decoded_poses(
+        self, pose_inferencer, video_path, temp_dir, progress, total_frames, kwargs, rotation=0
+    ):
+        """Run MMPose on the frames of a video decoded by OpenCV, rotated by
+        ``rotation`` degrees.
+
+        Frames are streamed to the inferencer as arrays straight from a
+        single decode pass, in frame order, so nothing is written to disk.
+        MMPose's partial visualisation of the failed attempt is removed and
+        the caller draws the poses itself.
+        """
+        for name in os.listdir(temp_dir):
+            if name.endswith((".mp4", ".avi")):
+                os.remove(os.path.join(temp_dir, name))
+
+        source = VideoSource(video_path, rotation=rotation)
+        frames = (frame for _, frame in source.frames())
+        if "bboxes" in kwargs:
+            # Person boxes are looked up by frame index
+            frames = itertools.islice(frames, len(kwargs["bboxes"]))
+        try:
+            return _collect_pose_results(
+                pose_inferencer(frames, show=False, **kwargs), progress, total_frames
+            )
+        finally:
+            source.release()
 
     def _save_results(
-        self, output_path, key_moments, ball_detections, racket_detections
+        self, output_path, key_moments, ball_detections, racket_detections, serves=()
     ):
         """Save detection results to JSON files."""
         try:
@@ -368,6 +1148,12 @@ class VideoProcessor:
                 json.dump(racket_detections, f)
             print(f"Saved racket detections to: {rackets_file}")
 
+            # Save serve segments with their key moments
+            serves_file = os.path.splitext(output_path)[0] + "_serves.json"
+            with open(serves_file, "w") as f:
+                json.dump(list(serves), f)
+            print(f"Saved {len(serves)} serves to: {serves_file}")
+
         except Exception as e:
             print(f"Error saving results: {str(e)}")
 
@@ -407,14 +1193,24 @@ class VideoProcessor:
             return False
 
     def _add_detection_boxes(
-        self, input_path, output_path, ball_detections, racket_detections, fps
+        self,
+        input_path,
+        output_path,
+        ball_detections,
+        racket_detections,
+        fps,
+        progress=_no_progress,
+        total_frames=0,
+        pose_results=None,
+        rotation=0,
     ):
-        """Add detection boxes for tennis balls and rackets to video frames."""
-        cap = cv2.VideoCapture(input_path)
-        width, height, _ = self.get_video_info(input_path)
+        """Add detection boxes for tennis balls and rackets to video frames,
+        and the skeletons of ``pose_results`` when given, rotating the
+        frames by ``rotation`` degrees first."""
+        source = VideoSource(input_path, rotation=rotation)
 
         out = cv2.VideoWriter(
-            output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+            output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (source.width, source.height)
         )
 
         # Create frame lookup dictionaries for quick access
@@ -432,158 +1228,19 @@ class VideoProcessor:
                 racket_lookup[frame] = []
             racket_lookup[frame].append(racket)
 
-        frame_idx = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            # Add ball detections for this frame
-            if frame_idx in ball_lookup:
-                for ball in ball_lookup[frame_idx]:
-                    x1, y1, x2, y2 = ball["bbox"]
-                    conf = ball["confidence"]
-                    track_id = ball["track_id"]
-
-                    # Draw bounding box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-
-                    # Add label with confidence and track ID
-                    label = f"Ball {track_id}: {conf:.2f}"
-                    cv2.putText(
-                        frame,
-                        label,
-                        (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.5,
-                        (0, 0, 255),
-                        2,
-                    )
-
-            # Add racket detections for this frame
-            if frame_idx in racket_lookup:
-                for racket in racket_lookup[frame_idx]:
-                    x1, y1, x2, y2 = racket["bbox"]
-                    conf = racket["confidence"]
-                    track_id = racket["track_id"]
-
-                    # Draw bounding box
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-                    # Add label with confidence and track ID
-                    label = f"Racket {track_id}: {conf:.2f}"
-                    cv2.putText(
-                        frame,
-                        label,
-                        (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.5,
-                        (0, 255, 0),
-                        2,
-                    )
+        for frame_idx, frame in source.frames():
+            if pose_results is not None and frame_idx < len(pose_results):
+                draw_pose(frame, pose_results[frame_idx]["predictions"][0])
+            draw_detections(
+                frame, ball_lookup.get(frame_idx, []), racket_lookup.get(frame_idx, [])
+            )
 
             out.write(frame)
-            frame_idx += 1
+            _report_frames(progress, "render", frame_idx + 1, total_frames)
 
-        cap.release()
         out.release()
-        print(f"Debugging visualization saved to: {output_path} with {frame_idx} frames processed")
-
-    # def fix_nal_errors(self, input_path, output_path):
-    #     """Fix NAL unit errors in H264 videos by reencoding with stricter parameters."""
-    #     try:
-    #         import subprocess
-    #         print(f"Attempting to fix NAL unit errors in {input_path}")
-            
-    #         # First pass: Decode to raw frames to avoid carrying over any NAL issues
-    #         temp_yuv = f"{output_path}.temp.yuv"
-    #         decode_cmd = f'ffmpeg -i "{input_path}" -f rawvideo -pix_fmt yuv420p -y "{temp_yuv}"'
-            
-    #         print(f"Decoding to raw format: {decode_cmd}")
-    #         result1 = subprocess.run(decode_cmd, shell=True, capture_output=True, text=True)
-            
-    #         if result1.returncode != 0:
-    #             print(f"Raw decoding failed: {result1.stderr}")
-    #             print("Trying alternate method...")
-                
-    #             # Alternative approach: use a very strict H264 encoding
-    #             strict_cmd = f'ffmpeg -i "{input_path}" -c:v libx264 -profile:v baseline -level 3.0 -pix_fmt yuv420p -preset slow -crf 18 -movflags +faststart -y "{output_path}"'
-    #             print(f"Reencoding with strict parameters: {strict_cmd}")
-    #             result3 = subprocess.run(strict_cmd, shell=True, capture_output=True, text=True)
-                
-    #             if result3.returncode == 0:
-    #                 print("Strict reencoding completed successfully")
-    #                 if os.path.exists(temp_yuv):
-    #                     os.remove(temp_yuv)
-    #                 return True
-    #             else:
-    #                 print(f"Strict reencoding failed: {result3.stderr}")
-    #                 return False
-            
-    #         # Second pass: Re-encode to H264 with strict parameters
-    #         encode_cmd = f'ffmpeg -f rawvideo -pix_fmt yuv420p -s {self.get_video_info(input_path)[0]}x{self.get_video_info(input_path)[1]} -r {self.get_video_info(input_path)[2]} -i "{temp_yuv}" -c:v libx264 -profile:v baseline -level 3.0 -preset medium -crf 18 -movflags +faststart -y "{output_path}"'
-            
-    #         print(f"Reencoding from raw: {encode_cmd}")
-    #         result2 = subprocess.run(encode_cmd, shell=True, capture_output=True, text=True)
-            
-    #         # Clean up temp file
-    #         if os.path.exists(temp_yuv):
-    #             os.remove(temp_yuv)
-                
-    #         if result2.returncode == 0:
-    #             print("NAL error fixing completed successfully")
-    #             return True
-    #         else:
-    #             print(f"Reencoding failed: {result2.stderr}")
-    #             return False
-                
-    #     except Exception as e:
-    #         print(f"Error fixing NAL units: {str(e)}")
-    #         return False
-
-    def extract_frames_for_mmpose(self, video_path, temp_dir):
-        """
-        Extract frames from a video and save as PNG for MMPose direct processing.
-        This is a fallback method when normal video processing fails.
-        Returns a list of frame paths.
-        """
-        print(f"Extracting frames from {video_path} for direct MMPose processing...")
-        
-        # Create frames directory
-        frames_dir = os.path.join(temp_dir, "frames")
-        os.makedirs(frames_dir, exist_ok=True)
-        
-        # Open video file
-        cap = cv2.VideoCapture(video_path)
-        
-        # Get video properties
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        print(f"Extracting {total_frames} frames from {width}x{height} video at {fps}fps")
-        
-        # Extract frames
-        frame_paths = []
-        frame_count = 0
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            # Save frame as PNG (lossless)
-            frame_path = os.path.join(frames_dir, f"frame_{frame_count:06d}.png")
-            cv2.imwrite(frame_path, frame)
-            frame_paths.append(frame_path)
-            
-            frame_count += 1
-            if frame_count % 30 == 0:
-                progress = (frame_count / total_frames) * 100 if total_frames > 0 else 0
-                print(f"Extracted {frame_count}/{total_frames} frames ({progress:.1f}%)...")
-        
-        cap.release()
-        print(f"Successfully extracted {frame_count} frames to {frames_dir}")
-        
-        return frame_paths, fps
+        progress("render", 1.0)
+        print(
+            f"Debugging visualization saved to: {output_path} "
+            f"with {source.frames_decoded} frames processed"
+        )
@@ -0,0 +1,147 @@
+import os
+import uuid
+from datetime import datetime, timezone
+
+from werkzeug.http import is_resource_modified
+from werkzeug.wrappers import Response
+
+# Bytes read from disk and written to the socket at a time
+CHUNK_SIZE = 256 * 1024
+# Requests for more ranges than this get the whole file instead
+MAX_RANGES = 16
+
+
+def serve_file(request, path, mimetype="video/mp4", chunk_size=CHUNK_SIZE):
+    """Serve a file with HTTP range and conditional request support.
+
+    Single ranges get a 206 streamed straight from the file, through the
+    server's ``wsgi.file_wrapper`` (sendfile) under gunicorn and in
+    ``chunk_size`` reads otherwise, so memory stays bounded whatever the
+    range size. Multiple ranges get a ``multipart/byteranges`` body. The
+    ETag and Last-Modified validators answer ``If-None-Match`` and
+    ``If-Modified-Since`` with 304 and guard ``If-Range``.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+
+    response = Response(mimetype=mimetype, direct_passthrough=True)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.accept_ranges = "bytes"
+    # Output videos are re-rendered under the same name, so clients may keep
+    # them but revalidate; unchanged files then cost a 304 without a body
+    response.cache_control.no_cache = True
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+
+    ranges = None
+    if request.range is not None and _if_range_matches(request, etag, last_modified):
+        ranges = _resolve_ranges(request.range, size)
+    if ranges == []:
+        response.status_code = 416
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if ranges is None:
+        ranges = [(0, size)]
+    else:
+        response.status_code = 206
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        if response.status_code == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        response.content_length = stop - start
+        response.response = _file_body(request.environ, path, start, stop, chunk_size)
+        return response
+
+    boundary = uuid.uuid4().hex
+    parts = [
+        (
+            (
+                f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+            ).encode(),
+            start,
+            stop,
+        )
+        for start, stop in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    response.content_type = f"multipart/byteranges; boundary={boundary}"
+    response.content_length = (
+        sum(len(header) + stop - start for header, start, stop in parts)
+        + 2 * (len(parts) - 1)
+        + len(closing)
+    )
+    response.response = _multipart_body(path, parts, closing, chunk_size)
+    return response
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Whether ``Range`` applies: no ``If-Range`` or one naming this version."""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date == last_modified
+    return True
+
+
+def _resolve_ranges(byte_range, size):
+    """Sorted, merged ``(start, stop)`` byte ranges within ``size``.
+
+    Returns None to ignore the header (unknown unit or too many ranges) and
+    an empty list when no range is satisfiable.
+    """
+    if byte_range.units != "bytes" or len(byte_range.ranges) > MAX_RANGES:
+        return None
+    ranges = []
+    for start, stop in byte_range.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _file_body(environ, path, start, stop, chunk_size):
+    # gunicorn's file wrapper sends Content-Length bytes from the current
+    # file offset with sendfile(2); other servers' wrappers may read to EOF
+    file_wrapper = environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None and environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"):
+        f = open(path, "rb")
+        f.seek(start)
+        return file_wrapper(f, chunk_size)
+    return _read_range(path, start, stop, chunk_size)
+
+
+def _read_range(path, start, stop, chunk_size):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _multipart_body(path, parts, closing, chunk_size):
+    for i, (header, start, stop) in enumerate(parts):
+        yield (b"\r\n" if i else b"") + header
+        yield from _read_range(path, start, stop, chunk_size)
+    yield closing
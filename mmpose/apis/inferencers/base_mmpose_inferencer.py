@@ -310,6 +310,19 @@ class BaseMMPoseInferencer(BaseInferencer):
 
         pass
 
+    def _update_bottomup_test_cfg(self, bbox_thr: float, nms_thr: float):
+        """One-stage pose estimators perform prediction filtering within the
+        head's `predict` method. Here, we set the arguments for filtering."""
+        if self.cfg.model.type == 'BottomupPoseEstimator':
+            # 1. init with default arguments
+            test_cfg = self.model.head.test_cfg.copy()
+            # 2. update the score_thr and nms_thr in the test_cfg of the head
+            if 'score_thr' in test_cfg:
+                test_cfg['score_thr'] = bbox_thr
+            if 'nms_thr' in test_cfg:
+                test_cfg['nms_thr'] = nms_thr
+            self.model.test_cfg = test_cfg
+
     def preprocess(self,
                    inputs: InputsType,
                    batch_size: int = 1,
@@ -332,17 +345,7 @@ class BaseMMPoseInferencer(BaseInferencer):
             List[str or np.ndarray]: List of original inputs in the batch
         """
 
-        # One-stage pose estimators perform prediction filtering within the
-        # head's `predict` method. Here, we set the arguments for filtering
-        if self.cfg.model.type == 'BottomupPoseEstimator':
-            # 1. init with default arguments
-            test_cfg = self.model.head.test_cfg.copy()
-            # 2. update the score_thr and nms_thr in the test_cfg of the head
-            if 'score_thr' in test_cfg:
-                test_cfg['score_thr'] = bbox_thr
-            if 'nms_thr' in test_cfg:
-                test_cfg['nms_thr'] = nms_thr
-            self.model.test_cfg = test_cfg
+        self._update_bottomup_test_cfg(bbox_thr, nms_thr)
 
         for i, input in enumerate(inputs):
             bbox = bboxes[i] if bboxes else []
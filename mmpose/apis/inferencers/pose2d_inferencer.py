@@ -128,6 +128,72 @@ class Pose2DInferencer(BaseMMPoseInferencer):
             self.visualizer.set_dataset_meta(self.model.dataset_meta,
                                              skeleton_style)
 
+    def preprocess(self,
+                   inputs: InputsType,
+                   batch_size: int = 1,
+                   bboxes: Optional[List] = None,
+                   bbox_thr: float = 0.3,
+                   nms_thr: float = 0.3,
+                   **kwargs):
+        """Process the inputs into model-feedable batches.
+
+        Up to ``batch_size`` inputs are processed together: the detector of
+        top-down models runs once per batch, and the person instances of
+        all inputs in the batch are collated so that the pose model handles
+        them in a single forward pass. :meth:`forward` splits the
+        predictions back per input, in input order.
+
+        Args:
+            inputs (InputsType): Inputs given by user.
+            batch_size (int): batch size. Defaults to 1.
+            bboxes (list, optional): Person boxes of each input, see
+                :meth:`preprocess_single`. Defaults to None.
+            bbox_thr (float): threshold for bounding box detection.
+                Defaults to 0.3.
+            nms_thr (float): IoU threshold for bounding box NMS.
+                Defaults to 0.3.
+
+        Yields:
+            Any: Data processed by the ``pipeline`` and ``collate_fn``.
+            List[str or np.ndarray]: List of original inputs in the batch
+        """
+        self._update_bottomup_test_cfg(bbox_thr, nms_thr)
+
+        batch = []
+        for i, input in enumerate(inputs):
+            batch.append((i, input, bboxes[i] if bboxes else []))
+            if len(batch) >= batch_size:
+                yield self._preprocess_batch(batch, bbox_thr, nms_thr)
+                batch = []
+        if batch:
+            yield self._preprocess_batch(batch, bbox_thr, nms_thr)
+
+    def _preprocess_batch(self, batch: List[Tuple], bbox_thr: float,
+                          nms_thr: float):
+        """Collate the person instances of a batch of ``(index, input,
+        bboxes)`` into one model input."""
+        detected = {}
+        if self.cfg.data_mode == 'topdown' and self.detector is not None:
+            to_detect = [(i, input) for i, input, bbox in batch
+                         if len(bbox) == 0]
+            if to_detect:
+                det_results = self._detect([input for _, input in to_detect])
+                for (i, _), det_result in zip(to_detect, det_results):
+                    detected[i] = self._filter_det_bboxes(
+                        det_result, bbox_thr, nms_thr)
+
+        data_infos = []
+        instance_counts = []
+        for i, input, bbox in batch:
+            bboxes = detected[i] if i in detected else self._user_bboxes(bbox)
+            infos = self._pack_data_infos(input, i, bboxes)
+            data_infos.extend(infos)
+            instance_counts.append(len(infos))
+
+        data = self.collate_fn(data_infos)
+        data['instance_counts'] = instance_counts
+        return data, [input for _, input, _ in batch]
+
     def preprocess_single(self,
                           input: InputType,
                           index: int,
@@ -144,68 +210,98 @@ class Pose2DInferencer(BaseMMPoseInferencer):
                 Defaults to 0.3.
             nms_thr (float): IoU threshold for bounding box NMS.
                 Defaults to 0.3.
+            bboxes (np.ndarray or list): Person boxes of the input in
+                ``(x1, y1, x2, y2)`` or ``(x1, y1, x2, y2, score)`` format.
+                When given, they are used instead of running the detector.
+                Defaults to [].
 
         Yields:
             Any: Data processed by the ``pipeline`` and ``collate_fn``.
         """
-
+        if self.cfg.data_mode == 'topdown':
+            if len(bboxes) > 0:
+                bboxes = self._user_bboxes(bboxes)
+            elif self.detector is not None:
+                bboxes = self._filter_det_bboxes(
+                    self._detect([input])[0], bbox_thr, nms_thr)
+        return self._pack_data_infos(input, index, bboxes)
+
+    def _detect(self, inputs: List[InputType]) -> list:
+        """Run the person detector over a list of inputs in one batch."""
+        try:
+            return self.detector(
+                inputs, batch_size=len(inputs),
+                return_datasamples=True)['predictions']
+        except ValueError:
+            print_log(
+                'Support for mmpose and mmdet versions up to 3.1.0 '
+                'will be discontinued in upcoming releases. To '
+                'ensure ongoing compatibility, please upgrade to '
+                'mmdet version 3.2.0 or later.',
+                logger='current',
+                level=logging.WARNING)
+            return self.detector(
+                inputs, batch_size=len(inputs),
+                return_datasample=True)['predictions']
+
+    def _filter_det_bboxes(self, det_result, bbox_thr: float,
+                           nms_thr: float) -> np.ndarray:
+        """Person boxes with scores kept from one detection result."""
+        pred_instance = det_result.pred_instances.cpu().numpy()
+        bboxes = np.concatenate(
+            (pred_instance.bboxes, pred_instance.scores[:, None]), axis=1)
+
+        label_mask = np.zeros(len(bboxes), dtype=np.uint8)
+        for cat_id in self.det_cat_ids:
+            label_mask = np.logical_or(label_mask,
+                                       pred_instance.labels == cat_id)
+
+        bboxes = bboxes[np.logical_and(label_mask,
+                                       pred_instance.scores > bbox_thr)]
+        return bboxes[nms(bboxes, nms_thr)]
+
+    @staticmethod
+    def _user_bboxes(bboxes) -> np.ndarray:
+        """User boxes as an ``(N, 5)`` array, with score 1 if missing."""
+        if len(bboxes) == 0:
+            return np.zeros((0, 5), dtype=np.float32)
+        bboxes = np.asarray(bboxes, dtype=np.float32)
+        bboxes = bboxes.reshape(len(bboxes), -1)
+        if bboxes.shape[1] == 4:
+            bboxes = np.concatenate(
+                (bboxes, np.ones((len(bboxes), 1), dtype=np.float32)), axis=1)
+        return bboxes
+
+    def _pack_data_infos(self, input: InputType, index: int,
+                         bboxes: np.ndarray) -> list:
+        """Run the data pipeline on every person instance of one input."""
         if isinstance(input, str):
             data_info = dict(img_path=input)
         else:
             data_info = dict(img=input, img_path=f'{index}.jpg'.rjust(10, '0'))
         data_info.update(self.model.dataset_meta)
 
-        if self.cfg.data_mode == 'topdown':
-            bboxes = []
-            if self.detector is not None:
-                try:
-                    det_results = self.detector(
-                        input, return_datasamples=True)['predictions']
-                except ValueError:
-                    print_log(
-                        'Support for mmpose and mmdet versions up to 3.1.0 '
-                        'will be discontinued in upcoming releases. To '
-                        'ensure ongoing compatibility, please upgrade to '
-                        'mmdet version 3.2.0 or later.',
-                        logger='current',
-                        level=logging.WARNING)
-                    det_results = self.detector(
-                        input, return_datasample=True)['predictions']
-                pred_instance = det_results[0].pred_instances.cpu().numpy()
-                bboxes = np.concatenate(
-                    (pred_instance.bboxes, pred_instance.scores[:, None]),
-                    axis=1)
-
-                label_mask = np.zeros(len(bboxes), dtype=np.uint8)
-                for cat_id in self.det_cat_ids:
-                    label_mask = np.logical_or(label_mask,
-                                               pred_instance.labels == cat_id)
-
-                bboxes = bboxes[np.logical_and(
-                    label_mask, pred_instance.scores > bbox_thr)]
-                bboxes = bboxes[nms(bboxes, nms_thr)]
-
-            data_infos = []
-            if len(bboxes) > 0:
-                for bbox in bboxes:
-                    inst = data_info.copy()
-                    inst['bbox'] = bbox[None, :4]
-                    inst['bbox_score'] = bbox[4:5]
-                    data_infos.append(self.pipeline(inst))
-            else:
-                inst = data_info.copy()
+        if self.cfg.data_mode != 'topdown':  # bottom-up
+            return [self.pipeline(data_info)]
 
-                # get bbox from the image size
-                if isinstance(input, str):
-                    input = mmcv.imread(input)
-                h, w = input.shape[:2]
-
-                inst['bbox'] = np.array([[0, 0, w, h]], dtype=np.float32)
-                inst['bbox_score'] = np.ones(1, dtype=np.float32)
+        data_infos = []
+        if len(bboxes) > 0:
+            for bbox in bboxes:
+                inst = data_info.copy()
+                inst['bbox'] = bbox[None, :4]
+                inst['bbox_score'] = bbox[4:5]
                 data_infos.append(self.pipeline(inst))
+        else:
+            inst = data_info.copy()
 
-        else:  # bottom-up
-            data_infos = [self.pipeline(data_info)]
+            # get bbox from the image size
+            if isinstance(input, str):
+                input = mmcv.imread(input)
+            h, w = input.shape[:2]
+
+            inst['bbox'] = np.array([[0, 0, w, h]], dtype=np.float32)
+            inst['bbox_score'] = np.ones(1, dtype=np.float32)
+            data_infos.append(self.pipeline(inst))
 
         return data_infos
 
@@ -222,7 +318,8 @@ class Pose2DInferencer(BaseMMPoseInferencer):
                 be either a dictionary or a tuple.
             merge_results (bool, optional): Whether to merge data samples,
                 default to True. This is only applicable when the data_mode
-                is 'topdown'.
+                is 'topdown'. The instances of each input of a batch are
+                merged into one data sample per input.
             bbox_thr (float, optional): A threshold for the bounding box
                 scores. Bounding boxes with scores greater than this value
                 will be retained. Default value is -1 which retains all
@@ -231,9 +328,22 @@ class Pose2DInferencer(BaseMMPoseInferencer):
         Returns:
             A list of data samples with prediction instances.
         """
+        instance_counts = None
+        if isinstance(inputs, dict):
+            inputs = dict(inputs)
+            instance_counts = inputs.pop('instance_counts', None)
+
         data_samples = self.model.test_step(inputs)
         if self.cfg.data_mode == 'topdown' and merge_results:
-            data_samples = [merge_data_samples(data_samples)]
+            if instance_counts is None:
+                instance_counts = [len(data_samples)]
+            merged = []
+            start = 0
+            for count in instance_counts:
+                merged.append(
+                    merge_data_samples(data_samples[start:start + count]))
+                start += count
+            data_samples = merged
 
         if bbox_thr > 0:
             for ds in data_samples:
@@ -8,6 +8,7 @@ from tempfile import TemporaryDirectory
 from unittest import TestCase
 
 import mmcv
+import numpy as np
 import torch
 from mmengine.infer.infer import BaseInferencer
 
@@ -162,3 +163,66 @@ class TestPose2DInferencer(TestCase):
                           os.listdir(f'{tmp_dir}/predictions'))
         self.assertTrue(inferencer._video_input)
         self.assertIn(len(results['predictions']), (4, 5))
+
+    def test_call_with_bboxes(self):
+
+        # top-down model without a detector, person boxes given by the user
+        inferencer = Pose2DInferencer('human', det_model='whole_image')
+        self.assertIsNone(inferencer.detector)
+
+        img = mmcv.imread('tests/data/coco/000000197388.jpg')
+        bboxes = np.array([[30, 40, 200, 380], [250, 60, 400, 390]],
+                          dtype=np.float32)
+        results = next(inferencer(img, bboxes=[bboxes]))
+        self.assertEqual(len(results['predictions'][0]), 2)
+        for pred, bbox in zip(results['predictions'][0], bboxes):
+            np.testing.assert_allclose(pred['bbox'][0], bbox)
+            self.assertAlmostEqual(pred['bbox_score'], 1.0)
+            self.assertEqual(len(pred['keypoints']), 17)
+
+        # boxes with scores
+        results = next(inferencer(img, bboxes=[[[30, 40, 200, 380, 0.8]]]))
+        self.assertEqual(len(results['predictions'][0]), 1)
+        self.assertAlmostEqual(
+            results['predictions'][0][0]['bbox_score'], 0.8, places=5)
+
+    def test_call_batched(self):
+
+        try:
+            from mmdet.apis.det_inferencer import DetInferencer  # noqa: F401
+        except (ImportError, ModuleNotFoundError):
+            return unittest.skip('mmdet is not installed')
+
+        det_model, det_weights = self._get_det_model_weights()
+        inferencer = Pose2DInferencer(
+            'human', det_model=det_model, det_weights=det_weights)
+
+        img = mmcv.imread('tests/data/coco/000000197388.jpg')
+        inputs = [img, mmcv.imflip(img), img]
+        single = [res['predictions'][0] for res in inferencer(inputs)]
+
+        # detection and pose run once per batch, predictions come back
+        # per input in input order
+        batched = []
+        for res in inferencer(inputs, batch_size=2):
+            self.assertLessEqual(len(res['predictions']), 2)
+            batched.extend(res['predictions'])
+        self.assertEqual(len(batched), len(inputs))
+        for preds_single, preds_batched in zip(single, batched):
+            self.assertEqual(len(preds_single), len(preds_batched))
+            for pred_single, pred_batched in zip(preds_single, preds_batched):
+                np.testing.assert_allclose(
+                    pred_single['keypoints'],
+                    pred_batched['keypoints'],
+                    rtol=1e-3,
+                    atol=1e-2)
+
+        # user boxes for some inputs only
+        bboxes = [[[30, 40, 200, 380]], [], [[250, 60, 400, 390]]]
+        batched = []
+        for res in inferencer(inputs, batch_size=3, bboxes=bboxes):
+            batched.extend(res['predictions'])
+        self.assertEqual(len(batched[0]), 1)
+        self.assertEqual(len(batched[1]), len(single[1]))
+        np.testing.assert_allclose(batched[2][0]['bbox'][0],
+                                   [250, 60, 400, 390])